@@ -2,6 +2,9 @@
 ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it under an ASGI server (e.g. ``uvicorn config.asgi:application``) to
+serve the Server-Sent Events stream at ``api/v1/user/events/`` without
+tying up a worker thread per connected client.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
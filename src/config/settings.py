@@ -52,11 +52,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "user.middleware.RequestMetricsMiddleware",
+    "user.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "user.middleware.PrimaryPinningMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -92,6 +95,77 @@ DATABASES = {
     }
 }
 
+# "production" switches SQLite to WAL with tuned pragmas, starts write
+# transactions with BEGIN IMMEDIATE and keeps connections open between
+# requests. The user.backends.sqlite3 engine takes the "transaction_mode"
+# and "pragmas" options.
+DATABASE_MODE = os.getenv("DATABASE_MODE", "development")
+
+if DATABASE_MODE == "production":
+    DATABASES["default"].update(
+        {
+            "ENGINE": "user.backends.sqlite3",
+            "CONN_MAX_AGE": int(os.getenv("DATABASE_CONN_MAX_AGE", 600)),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)) / 1000,
+                "transaction_mode": "IMMEDIATE",
+                "pragmas": {
+                    "journal_mode": "WAL",
+                    "synchronous": "NORMAL",
+                    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+                    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+                    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", 64 * 1024)),
+                    "temp_store": "MEMORY",
+                },
+            },
+        }
+    )
+
+# Comma-separated replica database files. Reads from list endpoints go to a
+# replica; a user who just wrote is pinned to the primary for
+# REPLICA_PIN_SECONDS to cover replication lag. Pinning is shared through the
+# cache, so multi-worker deployments need a shared CACHES backend.
+DATABASE_REPLICAS = [name for name in os.getenv("DATABASE_REPLICAS", "").split(",") if name]
+
+for index, replica_name in enumerate(DATABASE_REPLICAS, start=1):
+    DATABASES[f"replica_{index}"] = {
+        **DATABASES["default"],
+        "NAME": replica_name,
+        "TEST": {"MIRROR": "default"},
+    }
+
+# Comma-separated database files to split posts across by author
+# ("posts_0", "posts_1", ...). Likes and hashtag links follow their post;
+# hashtags are copied to every shard and users, follows and notifications
+# stay in "default". Each shard needs the full schema, so run
+# "manage.py migrate --database posts_N" for every shard. Set POST_SHARDS
+# before the first migrate: migration 0011 then leaves the post relations
+# without database constraints, which unsharded databases keep. Changing
+# the number of shards does not move existing posts.
+POST_SHARD_NAMES = [name for name in os.getenv("POST_SHARDS", "").split(",") if name]
+
+for index, shard_name in enumerate(POST_SHARD_NAMES):
+    DATABASES[f"posts_{index}"] = {
+        **DATABASES["default"],
+        "NAME": shard_name,
+    }
+
+POST_SHARDS = [f"posts_{index}" for index in range(len(POST_SHARD_NAMES))]
+
+POST_SHARDING = {
+    "MAX_WORKERS": int(os.getenv("POST_SHARDING_MAX_WORKERS", 8)),
+}
+
+DATABASE_ROUTERS = ["user.sharding.PostShardRouter", "user.db.PrimaryReplicaRouter"]
+
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", 5))
+
+SQLITE_BUSY_RETRY = {
+    "ATTEMPTS": 5,
+    "BASE_DELAY": 0.02,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -135,6 +209,17 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Media is served by user.media.serve_media with Range and cache validator
+# support, with DEBUG on or when MEDIA_SERVE_ENABLED=1. Behind nginx, set
+# MEDIA_SERVE_MODE=accel and map the prefix to MEDIA_ROOT in an internal
+# location so nginx sends the file itself.
+MEDIA_SERVING = {
+    "ENABLED": DEBUG or os.getenv("MEDIA_SERVE_ENABLED") == "1",
+    "MODE": os.getenv("MEDIA_SERVE_MODE", "django"),
+    "ACCEL_REDIRECT_PREFIX": "/protected-media/",
+    "MAX_AGE": int(os.getenv("MEDIA_MAX_AGE", 7 * 24 * 3600)),
+}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -144,9 +229,13 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # REST FRAMEWORK SETTINGS
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": [
+        "user.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_THROTTLE_CLASSES": [
-        "rest_framework.throttling.AnonRateThrottle",
-        "rest_framework.throttling.UserRateThrottle",
+        "user.throttling.BatchAwareAnonRateThrottle",
+        "user.throttling.BatchAwareUserRateThrottle",
     ],
     "DEFAULT_THROTTLE_RATES": {"anon": "50/minute", "user": "70/minute"},
     "DEFAULT_AUTHENTICATION_CLASSES": (
@@ -169,3 +258,100 @@ SPECTACULAR_SETTINGS = {
     "VERSION": "1.0.0",
     "SERVE_INCLUDE_SCHEMA": False,
 }
+
+# Written by "manage.py build_openapi_schema" and served by the schema view
+# unless OPENAPI_SCHEMA_LIVE is on, which generates the schema on every
+# request while the API is being worked on.
+OPENAPI_SCHEMA_DIR = Path(os.getenv("OPENAPI_SCHEMA_DIR", BASE_DIR / "openapi"))
+OPENAPI_SCHEMA_LIVE = os.getenv("OPENAPI_SCHEMA_LIVE", "1") == "1"
+
+# Each worker records its own series and publishes them to the cache under
+# its pid; /metrics reports every worker, so several worker processes need a
+# shared CACHES backend.
+REQUEST_METRICS = {
+    "ENABLED": os.getenv("REQUEST_METRICS_ENABLED", "1") == "1",
+    "SLOW_REQUEST_THRESHOLD_MS": (
+        int(os.getenv("SLOW_REQUEST_THRESHOLD_MS")) if os.getenv("SLOW_REQUEST_THRESHOLD_MS") else None
+    ),
+}
+
+# Likes and follows within this window are folded into one notification.
+NOTIFICATION_BUCKET_SECONDS = int(os.getenv("NOTIFICATION_BUCKET_SECONDS", 3600))
+
+# Server-Sent Events hub. Use "user.events.RedisEventBackend" (needs the
+# redis package) to deliver events across several worker processes.
+EVENTS = {
+    "BACKEND": os.getenv("EVENTS_BACKEND", "user.events.LocalEventBackend"),
+    "BACKEND_OPTIONS": {"url": os.getenv("REDIS_URL")} if os.getenv("REDIS_URL") else {},
+}
+
+# Post view/impression counters are buffered per process and written in
+# batches; at most FLUSH_INTERVAL_SECONDS of counts are lost on a crash.
+POST_COUNTERS = {
+    "FLUSH_INTERVAL_SECONDS": float(os.getenv("POST_COUNTERS_FLUSH_INTERVAL", 5)),
+    "MAX_PENDING_POSTS": 10000,
+}
+
+# Stored responses for requests sent with an Idempotency-Key header; prune
+# expired ones with "manage.py prune_idempotency_keys".
+IDEMPOTENCY = {
+    "TTL_SECONDS": int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 3600)),
+    "WAIT_SECONDS": 10.0,
+}
+
+# Engagement ranking for ?order=ranked; run "manage.py update_post_scores"
+# periodically (e.g. every 15 minutes) to apply time decay.
+RANKING = {
+    "HALF_LIFE_HOURS": float(os.getenv("RANKING_HALF_LIFE_HOURS", 24)),
+    "HORIZON_DAYS": 14,
+    "CACHE_SECONDS": 30,
+}
+
+# /users/{id}/summary/ responses are cached per profile and per (viewer,
+# profile), and invalidated when the profile, its posts, likes or follows
+# change.
+USER_SUMMARY = {
+    "POSTS": 5,
+    "CACHE_SECONDS": int(os.getenv("USER_SUMMARY_CACHE_SECONDS", 60)),
+}
+
+# Cached reads (user summaries, ranked post candidates) are recomputed by one
+# worker at a time while the others serve the stale entry for up to
+# STALE_SECONDS. TTLs are jittered by +/- JITTER. "manage.py warm_caches"
+# prefills the hottest keys on deploy, which only helps workers when CACHES
+# points at a shared backend rather than the per-process default.
+READ_CACHE = {
+    "STALE_SECONDS": 300,
+    "JITTER": 0.1,
+}
+
+# Posts older than AFTER_DAYS are moved to the archive tables by
+# "manage.py archive_posts"; default listings only read the hot table.
+ARCHIVE = {
+    "AFTER_DAYS": int(os.getenv("ARCHIVE_AFTER_DAYS", 90)),
+    "BATCH_SIZE": 500,
+}
+
+# Chunked uploads (/api/v1/user/uploads/): chunks are streamed to TEMP_DIR,
+# assembled on completion and pruned by "manage.py prune_uploads" when left
+# unattached for EXPIRE_HOURS.
+UPLOADS = {
+    "CHUNK_SIZE": int(os.getenv("UPLOAD_CHUNK_SIZE", 4 * 1024 * 1024)),
+    "MAX_SIZE": int(os.getenv("UPLOAD_MAX_SIZE", 50 * 1024 * 1024)),
+    "EXPIRE_HOURS": 24,
+}
+
+# JSON and text responses of at least MIN_SIZE bytes are gzipped when the
+# client accepts it. Cached response bodies (user summaries) are stored
+# with their gzip encoding made once at CACHED_LEVEL, so hits are not
+# recompressed; PRECOMPRESS = False halves their cache footprint instead.
+RESPONSE_COMPRESSION = {
+    "MIN_SIZE": int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", 1024)),
+    "PRECOMPRESS": True,
+    "CACHED_LEVEL": 9,
+}
+
+BATCH_REQUESTS = {
+    "MAX_SIZE": 20,
+    "MAX_WORKERS": 4,
+}
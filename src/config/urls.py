@@ -1,28 +1,52 @@
-from django.conf.urls.static import static
+import re
+from functools import lru_cache
+
 from django.contrib import admin
-from django.urls import path, include
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularRedocView,
-    SpectacularSwaggerView,
-)
+from django.urls import path, include, re_path
+from django.utils.module_loading import import_string
 
 from config import settings
+from user.media import get_media_serving_settings, serve_media
+from user.views import MetricsView, BatchView
+
+
+def lazy_view(dotted_path, **initkwargs):
+    """
+    Defer importing a view class until its first request. The schema views
+    pull in drf_spectacular's generator and YAML dependencies, which would
+    otherwise be imported by every worker at startup.
+    """
+
+    @lru_cache(maxsize=None)
+    def get_view():
+        return import_string(dotted_path).as_view(**initkwargs)
+
+    def view(request, *args, **kwargs):
+        return get_view()(request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/v1/user/", include("user.urls", namespace="user")),
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
+    path("api/v1/batch/", BatchView.as_view(), name="batch"),
+    path("metrics", MetricsView.as_view(), name="metrics"),
+    path("api/schema/", lazy_view("user.schema.PrecomputedSchemaView"), name="schema"),
     path(
         "api/schema/swagger-ui/",
-        SpectacularSwaggerView.as_view(url_name="schema"),
+        lazy_view("drf_spectacular.views.SpectacularSwaggerView", url_name="schema"),
         name="swagger-ui",
     ),
     path(
         "api/schema/redoc/",
-        SpectacularRedocView.as_view(url_name="schema"),
+        lazy_view("drf_spectacular.views.SpectacularRedocView", url_name="schema"),
         name="redoc",
     ),
-] + static(
-    settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-)  # NOQA W503
+]
+
+if get_media_serving_settings()["ENABLED"]:
+    urlpatterns.append(
+        re_path(r"^%s(?P<path>.+)$" % re.escape(settings.MEDIA_URL.lstrip("/")), serve_media, name="media")
+    )
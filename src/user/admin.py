@@ -1,22 +1,260 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db.models import Q
 
-from user.models import UserFollowing
+from user.deletion import soft_delete_user
+from user.models import UserFollowing, Post, Hashtag, Notification, ArchivedPost
+from user.pagination import EstimatedCountPaginator
+from user.sharding import is_sharded, post_shards, using_shard
+
+ADMIN_CHUNK_SIZE = 1000
+
+
+def update_in_chunks(queryset, chunk_size=ADMIN_CHUNK_SIZE, **values):
+    """
+    Apply ``values`` to ``queryset`` one primary-key chunk at a time so a
+    bulk action never holds a long write lock.
+    """
+    pks = queryset.order_by().values_list("pk", flat=True).iterator(chunk_size=chunk_size)
+    model = queryset.model
+    updated = 0
+    chunk = []
+    for pk in pks:
+        chunk.append(pk)
+        if len(chunk) == chunk_size:
+            updated += model._default_manager.filter(pk__in=chunk).update(**values)
+            chunk = []
+    if chunk:
+        updated += model._default_manager.filter(pk__in=chunk).update(**values)
+    return updated
+
+
+def delete_in_chunks(queryset, chunk_size=ADMIN_CHUNK_SIZE):
+    """
+    Delete ``queryset`` in primary-key chunks, each in its own statement.
+    """
+    model = queryset.model
+    deleted = 0
+    while pks := list(queryset.order_by().values_list("pk", flat=True)[:chunk_size]):
+        deleted += model._default_manager.filter(pk__in=pks).delete()[0]
+    return deleted
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """
+    Defaults for tables too large for exact counts on every changelist.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
 
 
 @admin.register(get_user_model())
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(ScalableModelAdmin):
     list_display = (
         "email",
         "username",
         "profile_image",
         "phone_number",
     )
+    search_fields = ("=email", "^username")
+    list_filter = ("is_staff", "is_active")
+    actions = ("activate_users", "deactivate_users", "soft_delete_users")
+
+    def get_actions(self, request):
+        # A plain delete would skip the soft delete and leave sharded posts
+        # behind; accounts go through soft_delete_user like the API.
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    def delete_model(self, request, obj):
+        soft_delete_user(obj)
+
+    @admin.action(description="Activate selected users")
+    def activate_users(self, request, queryset):
+        updated = update_in_chunks(queryset, is_active=True)
+        self.message_user(request, f"Activated {updated} users.", messages.SUCCESS)
+
+    @admin.action(description="Deactivate selected users")
+    def deactivate_users(self, request, queryset):
+        updated = update_in_chunks(queryset, is_active=False)
+        self.message_user(request, f"Deactivated {updated} users.", messages.SUCCESS)
+
+    @admin.action(description="Delete selected users", permissions=["delete"])
+    def soft_delete_users(self, request, queryset):
+        deleted = 0
+        for user in queryset.filter(deleted_at__isnull=True).iterator(chunk_size=ADMIN_CHUNK_SIZE):
+            soft_delete_user(user)
+            deleted += 1
+        self.message_user(
+            request, f"Deleted {deleted} users; their content is removed by purge_deleted_accounts.", messages.SUCCESS
+        )
 
 
 @admin.register(UserFollowing)
-class UserFollowingAdmin(admin.ModelAdmin):
+class UserFollowingAdmin(ScalableModelAdmin):
     list_display = (
         "user_id",
         "following_user_id",
+        "created",
+    )
+    list_select_related = ("user_id", "following_user_id")
+    autocomplete_fields = ("user_id", "following_user_id")
+    search_fields = ("=user_id__email", "=following_user_id__email")
+    actions = ("delete_follows_in_chunks",)
+
+    @admin.action(description="Delete selected follows in chunks", permissions=["delete"])
+    def delete_follows_in_chunks(self, request, queryset):
+        deleted = delete_in_chunks(queryset)
+        self.message_user(request, f"Deleted {deleted} follows.", messages.SUCCESS)
+
+
+class PostShardFilter(admin.SimpleListFilter):
+    """
+    Picks the post shard the changelist shows; the first one by default.
+    """
+
+    title = "shard"
+    parameter_name = "shard"
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in post_shards()]
+
+    def queryset(self, request, queryset):
+        # PostAdmin already runs the whole view on the chosen shard.
+        return queryset
+
+    def choices(self, changelist):
+        current = PostAdmin.shard_or_first(self.value())
+        for alias, title in self.lookup_choices:
+            yield {
+                "selected": alias == current,
+                "query_string": changelist.get_query_string({self.parameter_name: alias}),
+                "display": title,
+            }
+
+
+@admin.register(Post)
+class PostAdmin(ScalableModelAdmin):
+    """
+    With sharded posts each view runs on one shard: the changelist on the
+    one picked with ``PostShardFilter`` and the object views on the shard
+    holding the post.
+    """
+
+    list_display = (
+        "id",
+        "author",
+        "is_published",
+        "created_at",
+    )
+    list_select_related = ("author",)
+    list_filter = (PostShardFilter, "is_published")
+    search_fields = ("=id", "=author__email")
+    raw_id_fields = ("author", "likes")
+    autocomplete_fields = ("hashtag",)
+    readonly_fields = ("created_at", "updated_at")
+    actions = ("publish_posts", "unpublish_posts")
+
+    @admin.action(description="Publish selected posts")
+    def publish_posts(self, request, queryset):
+        updated = update_in_chunks(queryset, is_published=True)
+        self.message_user(request, f"Published {updated} posts.", messages.SUCCESS)
+
+    @admin.action(description="Unpublish selected posts")
+    def unpublish_posts(self, request, queryset):
+        updated = update_in_chunks(queryset, is_published=False)
+        self.message_user(request, f"Unpublished {updated} posts.", messages.SUCCESS)
+
+    def get_list_select_related(self, request):
+        # Shards have no user rows to join; authors are read from the
+        # default database one by one instead.
+        return () if is_sharded() else super().get_list_select_related(request)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not is_sharded() or not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        term = search_term.strip()
+        authors = get_user_model().objects.filter(email__iexact=term).values_list("pk", flat=True)
+        query = Q(author_id__in=list(authors))
+        if term.isdigit():
+            query |= Q(pk=int(term))
+        return queryset.filter(query), False
+
+    @staticmethod
+    def shard_or_first(alias):
+        shards = post_shards()
+        return alias if alias in shards else next(iter(shards), None)
+
+    @staticmethod
+    def object_shard(object_id):
+        post = None
+        if object_id and is_sharded():
+            try:
+                post = Post.objects.locate(pk=object_id)
+            except (ValidationError, ValueError):
+                pass
+        return PostAdmin.shard_or_first(post._state.db if post is not None else None)
+
+    def on_shard(self, alias, view, *args):
+        if alias is None:
+            return view(*args)
+        with using_shard(alias):
+            response = view(*args)
+            # Template responses read the posts while rendering.
+            if hasattr(response, "render"):
+                response.render()
+        return response
+
+    def changelist_view(self, request, extra_context=None):
+        alias = self.shard_or_first(request.GET.get(PostShardFilter.parameter_name))
+        return self.on_shard(alias, super().changelist_view, request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url="", extra_context=None):
+        alias = self.object_shard(object_id)
+        return self.on_shard(alias, super().changeform_view, request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        return self.on_shard(self.object_shard(object_id), super().delete_view, request, object_id, extra_context)
+
+    def history_view(self, request, object_id, extra_context=None):
+        return self.on_shard(self.object_shard(object_id), super().history_view, request, object_id, extra_context)
+
+
+@admin.register(ArchivedPost)
+class ArchivedPostAdmin(ScalableModelAdmin):
+    list_display = (
+        "id",
+        "author",
+        "created_at",
+        "archived_at",
+    )
+    list_select_related = ("author",)
+    search_fields = ("=id", "=author__email")
+    raw_id_fields = ("author",)
+    readonly_fields = ("created_at", "updated_at", "archived_at")
+
+
+@admin.register(Hashtag)
+class HashtagAdmin(ScalableModelAdmin):
+    list_display = ("name",)
+    search_fields = ("^name",)
+
+
+@admin.register(Notification)
+class NotificationAdmin(ScalableModelAdmin):
+    list_display = (
+        "recipient",
+        "kind",
+        "post",
+        "actor_count",
+        "is_read",
+        "updated_at",
     )
+    list_select_related = ("recipient",)
+    list_filter = ("kind", "is_read")
+    search_fields = ("=recipient__email",)
+    raw_id_fields = ("recipient", "post", "last_actor")
@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user'
+
+    def ready(self):
+        from user import sharding, summary
+        from user.models import Hashtag, Post, User, UserFollowing
+
+        for signal in (post_save, post_delete):
+            signal.connect(summary.invalidate_on_follow, sender=UserFollowing, dispatch_uid="user.summary.follow")
+            signal.connect(summary.invalidate_on_post, sender=Post, dispatch_uid="user.summary.post")
+        post_save.connect(summary.invalidate_on_user, sender=User, dispatch_uid="user.summary.user")
+        m2m_changed.connect(summary.invalidate_on_like, sender=Post.likes.through, dispatch_uid="user.summary.like")
+
+        post_save.connect(sharding.replicate_on_save, sender=Hashtag, dispatch_uid="user.sharding.replicate")
+        post_delete.connect(sharding.unreplicate_on_delete, sender=Hashtag, dispatch_uid="user.sharding.unreplicate")
+        post_delete.connect(
+            sharding.delete_post_notifications, sender=Post, dispatch_uid="user.sharding.post_notifications"
+        )
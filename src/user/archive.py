@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from user.db import retry_on_busy
+from user.models import ArchivedPost, ArchivedPostHashtag, ArchivedPostLike, Post
+from user.sharding import post_databases
+
+DEFAULT_ARCHIVE_SETTINGS = {
+    "AFTER_DAYS": 90,
+    "BATCH_SIZE": 500,
+}
+
+ARCHIVED_COLUMNS = (
+    "id",
+    "author_id",
+    "content",
+    "image",
+    "created_at",
+    "updated_at",
+    "is_published",
+    "view_count",
+    "impression_count",
+)
+
+# Relations that exist on both tables: the through model of each side and
+# the column linking to the related object.
+ARCHIVED_RELATIONS = {
+    "likes": (Post.likes.through, ArchivedPostLike, "user_id"),
+    "hashtag": (Post.hashtag.through, ArchivedPostHashtag, "hashtag_id"),
+}
+
+
+def get_archive_settings():
+    return {**DEFAULT_ARCHIVE_SETTINGS, **getattr(settings, "ARCHIVE", {})}
+
+
+def archive_cutoff(after_days=None):
+    return timezone.now() - timedelta(days=after_days or get_archive_settings()["AFTER_DAYS"])
+
+
+def archive_batch(post_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Move ``post_ids`` with their likes and hashtag links to the archive
+    tables in one transaction. Notifications about the posts are deleted
+    along with them.
+
+    Posts on a shard (``using``) are copied to the archive in one
+    transaction and removed from the shard in a second one. A run stopped
+    in between leaves them in both places; the next run finishes the move,
+    as rows already archived are skipped.
+    """
+    if using == DEFAULT_DB_ALIAS:
+        return retry_on_busy(_move_batch)(post_ids)
+    retry_on_busy(_copy_batch)(post_ids, using)
+    retry_on_busy(_delete_batch, using=using)(post_ids, using)
+    return len(post_ids)
+
+
+def _move_batch(post_ids):
+    _copy_batch(post_ids, DEFAULT_DB_ALIAS)
+    _delete_batch(post_ids, DEFAULT_DB_ALIAS)
+    return len(post_ids)
+
+
+def _copy_batch(post_ids, using):
+    posts = Post._base_manager.using(using).filter(pk__in=post_ids)
+    ArchivedPost.objects.bulk_create(
+        [ArchivedPost(**row) for row in posts.values(*ARCHIVED_COLUMNS)], ignore_conflicts=True
+    )
+    for through, archived_through, column in ARCHIVED_RELATIONS.values():
+        links = through.objects.using(using).filter(post_id__in=post_ids).values_list("post_id", column)
+        archived_through.objects.bulk_create(
+            [archived_through(post_id=post_id, **{column: value}) for post_id, value in links], ignore_conflicts=True
+        )
+
+
+def _delete_batch(post_ids, using):
+    for through, _, _ in ARCHIVED_RELATIONS.values():
+        through.objects.using(using).filter(post_id__in=post_ids).delete()
+    Post._base_manager.using(using).filter(pk__in=post_ids).delete()
+
+
+def archive_old_posts(cutoff=None, batch_size=None, log=None):
+    """
+    Archive every post created before ``cutoff`` in batches of
+    ``batch_size``, oldest first, each batch in its own transaction. An
+    interrupted run leaves whole batches moved and resumes with the rest.
+    """
+    cutoff = cutoff or archive_cutoff()
+    batch_size = batch_size or get_archive_settings()["BATCH_SIZE"]
+    archived = 0
+    for alias in post_databases():
+        pending = (
+            Post._base_manager.using(alias).filter(created_at__lt=cutoff).order_by("pk").values_list("pk", flat=True)
+        )
+        while post_ids := list(pending[:batch_size]):
+            archived += archive_batch(post_ids, alias)
+            if log:
+                log(f"archived {archived} posts (up to id {post_ids[-1]})")
+    return archived
@@ -0,0 +1,42 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend with two extra ``OPTIONS``:
+
+    ``transaction_mode``
+        ``"DEFERRED"``, ``"IMMEDIATE"`` or ``"EXCLUSIVE"``, used to begin
+        every transaction. Taking the write lock at BEGIN lets the busy
+        handler wait for it, instead of failing instantly when a deferred
+        transaction has to upgrade. Django 5.1 has this option built in.
+    ``pragmas``
+        ``{name: value}`` set on every new connection.
+    """
+
+    TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        transaction_mode = kwargs.pop("transaction_mode", None)
+        if transaction_mode is not None and transaction_mode.upper() not in self.TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"settings.DATABASES[{self.alias!r}]['OPTIONS']['transaction_mode'] is improperly configured to "
+                f"{transaction_mode!r}. Use one of {', '.join(map(repr, self.TRANSACTION_MODES))}, or None."
+            )
+        self.transaction_mode = transaction_mode.upper() if transaction_mode else None
+        self.pragmas = kwargs.pop("pragmas", {})
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
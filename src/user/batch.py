@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+BATCH_NAMESPACE = "user"
+FORWARDED_META = ("SERVER_NAME", "SERVER_PORT", "SERVER_PROTOCOL", "REMOTE_ADDR", "HTTP_HOST", "HTTP_USER_AGENT")
+
+# Shared by every batch in the process, so concurrent batches together run
+# at most MAX_WORKERS sub-requests at once.
+_pool = ThreadPoolExecutor(max_workers=settings.BATCH_REQUESTS["MAX_WORKERS"], thread_name_prefix="batch")
+
+
+def build_subrequest(parent, user, auth, method, path, body=None):
+    """
+    Build a request for ``path`` that carries the already authenticated
+    ``user`` so DRF skips token decoding.
+    """
+    url = urlsplit(path)
+    payload = json.dumps(body).encode() if body is not None else b""
+    environ = {key: parent.META[key] for key in FORWARDED_META if key in parent.META}
+    environ.update(
+        {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": url.path,
+            "QUERY_STRING": url.query,
+            "HTTP_ACCEPT": "application/json",
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(payload)),
+            "wsgi.input": BytesIO(payload),
+            "wsgi.url_scheme": parent.scheme,
+        }
+    )
+    request = WSGIRequest(environ)
+    request.user = user
+    request.batch_parent = parent
+    request._force_auth_user = user
+    request._force_auth_token = auth
+    return request
+
+
+def _error(status, detail):
+    return status, json.dumps({"detail": detail}).encode()
+
+
+def dispatch_subrequest(parent, user, auth, spec):
+    """
+    Run one sub-request through its view and return ``(status, json_bytes)``.
+    """
+    try:
+        match = resolve(urlsplit(spec["path"]).path)
+    except Resolver404:
+        return _error(404, "Not found.")
+    if match.namespace != BATCH_NAMESPACE or asyncio.iscoroutinefunction(match.func):
+        return _error(400, "This endpoint cannot be used in a batch.")
+
+    request = build_subrequest(parent, user, auth, spec["method"], spec["path"], spec.get("body"))
+    request.resolver_match = match
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, "render") and not response.is_rendered:
+            response.render()
+    except Exception:
+        logger.exception("Batch sub-request %s %s failed", spec["method"], spec["path"])
+        return _error(500, "Internal server error.")
+
+    if response.streaming:
+        return _error(400, "Streaming responses cannot be used in a batch.")
+    content = response.content
+    if not content:
+        return response.status_code, b"null"
+    if not response.get("Content-Type", "").startswith("application/json"):
+        return response.status_code, json.dumps(content.decode(errors="replace")).encode()
+    return response.status_code, content
+
+
+def _dispatch_in_thread(parent, user, auth, spec):
+    try:
+        return dispatch_subrequest(parent, user, auth, spec)
+    finally:
+        connections.close_all()
+
+
+def dispatch_batch(parent, user, auth, specs):
+    """
+    Run ``specs`` in order and return their ``(status, json_bytes)`` results.
+
+    Runs of consecutive GET requests are dispatched concurrently on the
+    shared pool; any other method acts as a barrier so later reads observe
+    earlier writes. Inside a transaction everything runs on this thread, as
+    other threads' connections cannot see its writes.
+    """
+    results = [None] * len(specs)
+    concurrent = not any(connection.in_atomic_block for connection in connections.all(initialized_only=True))
+    index = 0
+    while index < len(specs):
+        end = index + 1
+        if concurrent and specs[index]["method"] == "GET":
+            while end < len(specs) and specs[end]["method"] == "GET":
+                end += 1
+        if end - index == 1:
+            results[index] = dispatch_subrequest(parent, user, auth, specs[index])
+        else:
+            futures = [_pool.submit(_dispatch_in_thread, parent, user, auth, spec) for spec in specs[index:end]]
+            results[index:end] = [future.result() for future in futures]
+        index = end
+    return results
+
+
+def render_batch(results):
+    """
+    Assemble the batch response body by splicing each sub-response's JSON
+    bytes, so sub-responses are never decoded and re-encoded.
+    """
+    parts = [b'{"status":%d,"body":%s}' % (status, body) for status, body in results]
+    return b'{"responses":[' + b",".join(parts) + b"]}"
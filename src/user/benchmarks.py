@@ -0,0 +1,77 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from user.models import Post, Hashtag
+
+BENCH_EMAIL_DOMAIN = "bench.invalid"
+BENCH_HASHTAG_PREFIX = "bench_"
+
+
+def create_bench_data(users=50, posts=200, likes_per_post=0, hashtags=0, seed=0):
+    """
+    Create throwaway users, posts, likes and hashtags for the bench_* commands.
+
+    Returns the ids of the created users and posts.
+    """
+    delete_bench_data()
+    rng = random.Random(seed)
+    User = get_user_model()
+    User.objects.bulk_create(
+        [User(email=f"bench{i}@{BENCH_EMAIL_DOMAIN}", username=f"bench{i}") for i in range(users)]
+    )
+    user_ids = list(User.objects.filter(email__endswith=BENCH_EMAIL_DOMAIN).values_list("id", flat=True))
+    Post.objects.bulk_create(
+        [Post(author_id=rng.choice(user_ids), content=f"bench post {i} " * 8) for i in range(posts)]
+    )
+    post_ids = list(Post.objects.filter(author_id__in=user_ids).values_list("id", flat=True))
+
+    if likes_per_post:
+        Like = Post.likes.through
+        Like.objects.bulk_create(
+            [
+                Like(post_id=post_id, user_id=user_id)
+                for post_id in post_ids
+                for user_id in rng.sample(user_ids, min(likes_per_post, len(user_ids)))
+            ]
+        )
+    if hashtags:
+        Hashtag.objects.bulk_create([Hashtag(name=f"{BENCH_HASHTAG_PREFIX}{i}") for i in range(hashtags)])
+        tag_ids = list(Hashtag.objects.filter(name__startswith=BENCH_HASHTAG_PREFIX).values_list("id", flat=True))
+        PostHashtag = Post.hashtag.through
+        PostHashtag.objects.bulk_create(
+            [
+                PostHashtag(post_id=post_id, hashtag_id=tag_id)
+                for post_id in post_ids
+                for tag_id in rng.sample(tag_ids, min(3, len(tag_ids)))
+            ]
+        )
+    return user_ids, post_ids
+
+
+def delete_bench_data():
+    get_user_model().objects.filter(email__endswith=BENCH_EMAIL_DOMAIN).delete()
+    Hashtag.objects.filter(name__startswith=BENCH_HASHTAG_PREFIX).delete()
+
+
+def time_view(view, path, user, iterations, **extra):
+    """
+    Call ``view`` with an authenticated GET ``iterations`` times, bypassing
+    throttling and middleware. Returns the last response and the mean wall
+    and CPU seconds per call.
+    """
+    factory = APIRequestFactory(SERVER_NAME="localhost")
+    wall = cpu = 0.0
+    response = None
+    for _ in range(iterations):
+        request = factory.get(path, **extra)
+        force_authenticate(request, user=user)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        response = view(request)
+        if hasattr(response, "render"):
+            response.render()
+        wall += time.perf_counter() - wall_start
+        cpu += time.process_time() - cpu_start
+    return response, wall / iterations, cpu / iterations
@@ -0,0 +1,89 @@
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+DEFAULT_READ_CACHE_SETTINGS = {
+    "STALE_SECONDS": 300,
+    "JITTER": 0.1,
+    "BETA": 1.0,
+    "LOCK_SECONDS": 30,
+    "WAIT_SECONDS": 2.0,
+    "POLL_SECONDS": 0.05,
+}
+
+
+def get_read_cache_settings():
+    return {**DEFAULT_READ_CACHE_SETTINGS, **getattr(settings, "READ_CACHE", {})}
+
+
+def jittered(ttl, config=None):
+    """
+    ``ttl`` spread by up to ``JITTER`` either way, so keys filled together
+    do not all expire together.
+    """
+    config = config or get_read_cache_settings()
+    return ttl * (1 + random.uniform(-config["JITTER"], config["JITTER"]))
+
+
+def should_refresh(expires_at, delta, config, now=None):
+    """
+    Probabilistic early expiry ("XFetch"): the closer an entry is to
+    ``expires_at`` and the longer it took to compute (``delta``), the more
+    likely a read is to refresh it early. Refreshes are spread over time
+    instead of all landing at the moment it expires.
+    """
+    now = time.time() if now is None else now
+    return now - delta * config["BETA"] * math.log(1 - random.random()) >= expires_at
+
+
+def refresh(key, compute, ttl, config=None):
+    """
+    Compute and store ``key`` unconditionally and return the value.
+    """
+    config = config or get_read_cache_settings()
+    start = time.time()
+    value = compute()
+    delta = time.time() - start
+    ttl = jittered(ttl, config)
+    # The entry outlives its logical expiry by STALE_SECONDS so it can still
+    # be served while one worker recomputes it.
+    cache.set(key, (value, time.time() + ttl, delta), ttl + config["STALE_SECONDS"])
+    return value
+
+
+def cached(key, compute, ttl, config=None):
+    """
+    Return the cached value of ``key``, computing it with ``compute()`` at
+    most once across workers when it is missing or due.
+
+    A due entry is recomputed by whichever worker takes the ``<key>:lock``
+    lock; the others keep serving the stale value meanwhile. When there is
+    nothing to serve, the others poll for up to ``WAIT_SECONDS`` for the
+    lock holder's result, then compute it themselves.
+    """
+    config = config or get_read_cache_settings()
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires_at, delta = entry
+        if not should_refresh(expires_at, delta, config):
+            return value
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, config["LOCK_SECONDS"]):
+        try:
+            return refresh(key, compute, ttl, config)
+        finally:
+            cache.delete(lock_key)
+    if entry is not None:
+        return entry[0]
+
+    deadline = time.monotonic() + config["WAIT_SECONDS"]
+    while time.monotonic() < deadline:
+        time.sleep(config["POLL_SECONDS"])
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return refresh(key, compute, ttl, config)
@@ -0,0 +1,111 @@
+import gzip
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+DEFAULT_RESPONSE_COMPRESSION_SETTINGS = {
+    "MIN_SIZE": 1024,
+    "PRECOMPRESS": True,
+    "CACHED_LEVEL": 9,
+    "CONTENT_TYPES": (
+        "application/json",
+        "application/x-ndjson",
+        "application/vnd.oai.openapi",
+        "application/vnd.oai.openapi+json",
+        "text/html",
+        "text/plain",
+    ),
+}
+
+
+def get_response_compression_settings():
+    return {**DEFAULT_RESPONSE_COMPRESSION_SETTINGS, **getattr(settings, "RESPONSE_COMPRESSION", {})}
+
+
+def accepts_gzip(request):
+    """
+    Whether ``Accept-Encoding`` lists gzip with a non-zero ``q``. Like
+    ``GZipMiddleware``, ``*`` alone does not count.
+    """
+    qualities = {}
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities.get("gzip", qualities.get("x-gzip", 0.0)) > 0
+
+
+def is_compressible(content_type, config):
+    media_type = content_type.split(";")[0].strip().lower()
+    return media_type in config["CONTENT_TYPES"]
+
+
+class EncodedBody:
+    """
+    A rendered response body kept with its gzip encoding, made once when
+    the body is cached, so cache hits are served in the negotiated encoding
+    without compressing again. Bodies under ``MIN_SIZE``, and all of them
+    with ``PRECOMPRESS`` off, are kept as is.
+    """
+
+    def __init__(self, content, content_type="application/json", config=None):
+        config = config or get_response_compression_settings()
+        self.content = content
+        self.content_type = content_type
+        self.gzipped = None
+        if config["PRECOMPRESS"] and len(content) >= config["MIN_SIZE"]:
+            gzipped = gzip.compress(content, compresslevel=config["CACHED_LEVEL"], mtime=0)
+            if len(gzipped) < len(content):
+                self.gzipped = gzipped
+
+
+def encoded_response(request, body, status=200):
+    """
+    Serve an ``EncodedBody`` gzipped when the client accepts it and a gzip
+    encoding was stored, otherwise as is. Either way the response carries a
+    Content-Encoding or is too small to compress, so ``CompressionMiddleware``
+    leaves it alone.
+    """
+    if body.gzipped is not None and accepts_gzip(request):
+        response = HttpResponse(body.gzipped, content_type=body.content_type, status=status)
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(body.content, content_type=body.content_type, status=status)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    ``GZipMiddleware`` limited to ``CONTENT_TYPES`` responses of at least
+    ``MIN_SIZE`` bytes. Streaming responses of those types, such as the
+    NDJSON account export, are compressed as they stream.
+
+    Event streams (which must reach the client event by event), partial
+    content and responses that already carry a Content-Encoding, such as
+    cached ``EncodedBody`` responses, are passed through untouched.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.config = get_response_compression_settings()
+
+    def process_response(self, request, response):
+        if response.status_code == 206 or not is_compressible(response.get("Content-Type", ""), self.config):
+            return response
+        if not response.streaming and len(response.content) < self.config["MIN_SIZE"]:
+            return response
+        if not accepts_gzip(request):
+            # Django's check ignores q=0.
+            patch_vary_headers(response, ("Accept-Encoding",))
+            return response
+        return super().process_response(request, response)
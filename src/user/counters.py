@@ -0,0 +1,149 @@
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, F, PositiveBigIntegerField, Value, When
+
+from user.db import retry_on_busy
+from user.models import Post
+from user.sharding import post_databases
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POST_COUNTERS_SETTINGS = {
+    "FLUSH_INTERVAL_SECONDS": 5.0,
+    "MAX_PENDING_POSTS": 10000,
+    "UPDATE_BATCH_SIZE": 500,
+}
+
+COUNTER_FIELDS = ("view_count", "impression_count")
+
+
+def get_post_counters_settings():
+    return {**DEFAULT_POST_COUNTERS_SETTINGS, **getattr(settings, "POST_COUNTERS", {})}
+
+
+@retry_on_busy
+def write_counts(pending, batch_size):
+    """
+    Add ``pending`` (``{field: Counter(post_id -> n)}``) to the posts with
+    one ``UPDATE ... SET field = field + CASE WHEN id IN (...) THEN n ... END``
+    per batch of posts, covering every counter field in the same statement.
+    """
+    post_ids = sorted(set().union(*pending.values()))
+    for start in range(0, len(post_ids), batch_size):
+        batch = post_ids[start : start + batch_size]
+        changes = {}
+        for field, counts in pending.items():
+            # Most posts share a small increment, so one WHEN per distinct
+            # amount keeps the CASE short instead of one branch per post.
+            by_amount = defaultdict(list)
+            for post_id in batch:
+                if counts.get(post_id):
+                    by_amount[counts[post_id]].append(post_id)
+            whens = [When(pk__in=ids, then=Value(amount)) for amount, ids in by_amount.items()]
+            if whens:
+                changes[field] = F(field) + Case(*whens, default=Value(0), output_field=PositiveBigIntegerField())
+        # Each shard matches only the posts it holds.
+        for alias in post_databases():
+            Post._base_manager.using(alias).filter(pk__in=batch).update(**changes)
+    return len(post_ids)
+
+
+class CounterBuffer:
+    """
+    Per-process buffer of post view and impression increments.
+
+    Requests only bump in-memory counters; a daemon thread writes them out
+    every ``FLUSH_INTERVAL_SECONDS``, or sooner once ``MAX_PENDING_POSTS``
+    posts have pending increments. A crash loses at most one interval of
+    counts, which ranking tolerates. An interval of 0 writes through on
+    every increment; with ``autoflush`` off the caller flushes.
+    """
+
+    def __init__(self, config=None, autoflush=True):
+        self.config = config or get_post_counters_settings()
+        self.autoflush = autoflush
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {field: Counter() for field in COUNTER_FIELDS}
+        self._wakeup = threading.Event()
+        self._flusher_pid = None
+
+    def record_views(self, post_ids):
+        self.increment("view_count", post_ids)
+
+    def record_impressions(self, post_ids):
+        self.increment("impression_count", post_ids)
+
+    def increment(self, field, post_ids, amount=1):
+        with self._lock:
+            counts = self._pending[field]
+            for post_id in post_ids:
+                counts[post_id] += amount
+            pending_posts = len(counts)
+        if not self.autoflush:
+            return
+        if self.config["FLUSH_INTERVAL_SECONDS"] <= 0:
+            self.flush()
+            return
+        self._ensure_flusher()
+        if pending_posts >= self.config["MAX_PENDING_POSTS"]:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return {field: Counter(counts) for field, counts in self._pending.items() if counts}
+
+    def flush(self):
+        """
+        Write all pending increments and return the number of posts updated.
+        Increments are put back if the write fails, so they go out with the
+        next flush.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending = {field: counts for field, counts in self._pending.items() if counts}
+                self._pending = {field: Counter() for field in COUNTER_FIELDS}
+            if not pending:
+                return 0
+            try:
+                return write_counts(pending, self.config["UPDATE_BATCH_SIZE"])
+            except Exception:
+                with self._lock:
+                    for field, counts in pending.items():
+                        self._pending[field].update(counts)
+                raise
+
+    def _ensure_flusher(self):
+        # Compare pids so a worker forked after the first increment starts
+        # its own thread instead of relying on the parent's.
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._run, name="post-counter-flusher", daemon=True).start()
+        atexit.register(self._flush_quietly)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.config["FLUSH_INTERVAL_SECONDS"])
+            self._wakeup.clear()
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to flush post counters")
+        finally:
+            connections.close_all()
+
+
+post_counters = CounterBuffer()
@@ -0,0 +1,102 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def is_database_locked(error):
+    message = str(error).lower()
+    return "database is locked" in message or "database table is locked" in message
+
+
+def retry_on_busy(func=None, *, attempts=None, base_delay=None, using="default"):
+    """
+    Run a unit of work in a transaction, retrying it when SQLite reports the
+    database as locked.
+
+    SQLite's busy handler does not help when a deferred transaction has to be
+    upgraded to a write lock, so the whole transaction is rolled back and
+    retried after a full-jitter exponential backoff. Calls made inside an
+    outer atomic block run once, as that transaction has to be retried by
+    its owner.
+    """
+    if func is None:
+        return lambda f: retry_on_busy(f, attempts=attempts, base_delay=base_delay, using=using)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if connections[using].in_atomic_block:
+            return func(*args, **kwargs)
+        max_attempts = attempts or settings.SQLITE_BUSY_RETRY["ATTEMPTS"]
+        delay = base_delay or settings.SQLITE_BUSY_RETRY["BASE_DELAY"]
+        for attempt in range(1, max_attempts + 1):
+            try:
+                with transaction.atomic(using=using):
+                    return func(*args, **kwargs)
+            except OperationalError as error:
+                if not is_database_locked(error) or attempt == max_attempts:
+                    raise
+                logger.info("Database locked in %s, retry %d/%d", func.__qualname__, attempt, max_attempts)
+                time.sleep(random.uniform(0, delay * 2 ** (attempt - 1)))
+
+    return wrapper
+
+
+_replica_reads = ContextVar("replica_reads", default=False)
+
+
+def primary_pin_key(user_id):
+    return f"db:pin-primary:{user_id}"
+
+
+def is_pinned_to_primary(user):
+    return bool(user and user.is_authenticated and cache.get(primary_pin_key(user.pk)))
+
+
+def pin_to_primary(user):
+    cache.set(primary_pin_key(user.pk), True, settings.REPLICA_PIN_SECONDS)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """
+    Allow reads inside the block to be served by a replica.
+    """
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads to a random replica when the current request opted in via
+    ``replica_reads`` and everything else to the primary. Reads inside a
+    transaction on the primary stay there, so they see its writes.
+    """
+
+    def __init__(self):
+        self.replicas = [alias for alias in settings.DATABASES if alias.startswith("replica")]
+
+    def db_for_read(self, model, **hints):
+        if self.replicas and _replica_reads.get() and not connections["default"].in_atomic_block:
+            return random.choice(self.replicas)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
@@ -0,0 +1,172 @@
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.utils import timezone
+
+from user import ranking
+from user.db import retry_on_busy
+from user.models import ArchivedPost, ArchivedPostLike, IdempotencyKey, Notification, Post, Upload, UserFollowing
+from user.sharding import hide_author, post_databases, shard_for_author, unhide_author
+from user.uploads import discard_upload
+
+DELETED_EMAIL_DOMAIN = "deleted.invalid"
+PURGE_BATCH_SIZE = 500
+
+
+def soft_delete_user(user):
+    """
+    Hide ``user`` and everything they own immediately with a single-row
+    UPDATE and a ``HiddenAuthor`` row per database;
+    ``purge_deleted_accounts`` removes the related rows later.
+
+    The email and username are released so they can be registered again
+    while the account waits to be purged.
+    """
+    user.deleted_at = timezone.now()
+    user.is_active = False
+    user.email = f"deleted-{user.pk}@{DELETED_EMAIL_DOMAIN}"
+    user.username = None
+    user.set_unusable_password()
+    user.save(update_fields=["deleted_at", "is_active", "email", "username", "password"])
+    hide_author(user.pk)
+
+
+def pending_purge():
+    return get_user_model().all_objects.filter(deleted_at__isnull=False).order_by("deleted_at", "pk")
+
+
+def _delete_batch(queryset, batch_size):
+    model = queryset.model
+    pks = list(queryset.order_by().values_list("pk", flat=True)[:batch_size])
+    if pks:
+        model._base_manager.using(queryset._db).filter(pk__in=pks).delete()
+    return len(pks)
+
+
+@retry_on_busy
+def _release_actor_notifications(user_id, batch_size):
+    """
+    Detach one batch of notifications last caused by the deleted user. Unread
+    ones that only they caused are removed and the recipients' unread
+    counters decremented, so nobody is left with a notification that has
+    nothing behind it.
+    """
+    rows = list(
+        Notification.objects.filter(last_actor_id=user_id)
+        .order_by()
+        .values_list("pk", "recipient_id", "actor_count", "is_read")[:batch_size]
+    )
+    orphaned = [(pk, recipient_id) for pk, recipient_id, actor_count, is_read in rows if actor_count == 1]
+    if orphaned:
+        Notification.objects.filter(pk__in=[pk for pk, _ in orphaned]).delete()
+    Notification.objects.filter(pk__in=[row[0] for row in rows]).update(last_actor=None)
+
+    unread = Counter(
+        recipient_id for pk, recipient_id, actor_count, is_read in rows if actor_count == 1 and not is_read
+    )
+    User = get_user_model()
+    for recipient_id, count in unread.items():
+        User.all_objects.filter(pk=recipient_id, unread_notification_count__gte=count).update(
+            unread_notification_count=F("unread_notification_count") - count
+        )
+    return len(rows)
+
+
+def _discard_upload_batch(user_id, batch_size):
+    uploads = list(Upload.objects.filter(owner_id=user_id)[:batch_size])
+    for upload in uploads:
+        discard_upload(upload)
+    return len(uploads)
+
+
+def _delete_like_batch(user_id, batch_size):
+    """
+    Delete one batch of the user's likes from the first post database that
+    still has some.
+    """
+    for alias in post_databases():
+        if deleted := retry_on_busy(_delete_likes, using=alias)(alias, user_id, batch_size):
+            return deleted
+    return 0
+
+
+def _delete_likes(alias, user_id, batch_size):
+    # The liked posts lose the like's engagement in the same transaction.
+    likes = Post.likes.through.objects.using(alias)
+    rows = list(likes.filter(user_id=user_id).order_by().values_list("pk", "post_id")[:batch_size])
+    if rows:
+        likes.filter(pk__in=[pk for pk, _ in rows]).delete()
+        ranking.on_likes_removed(alias, [post_id for _, post_id in rows])
+    return len(rows)
+
+
+def _delete_post_batch(user_id, batch_size):
+    """
+    Delete one batch of the user's posts, clearing their link tables first
+    so the cascade has nothing left to collect. Their notifications are in
+    the default database, which need not hold the posts, and go first.
+    """
+    alias = shard_for_author(user_id)
+    posts = Post._base_manager.using(alias).filter(author_id=user_id)
+    post_ids = list(posts.order_by().values_list("pk", flat=True)[:batch_size])
+    if post_ids:
+        retry_on_busy(lambda: Notification.objects.filter(post_id__in=post_ids).delete())()
+        retry_on_busy(_delete_posts, using=alias)(alias, post_ids)
+    return len(post_ids)
+
+
+def _delete_posts(alias, post_ids):
+    Post.likes.through.objects.using(alias).filter(post_id__in=post_ids).delete()
+    Post.hashtag.through.objects.using(alias).filter(post_id__in=post_ids).delete()
+    Post._base_manager.using(alias).filter(pk__in=post_ids).delete()
+
+
+def purge_steps(user_id, batch_size):
+    """
+    The purge of one account as ordered ``(name, step)`` pairs. Each step
+    removes at most ``batch_size`` rows in its own transaction and returns
+    how many it handled; a step is repeated until it returns 0.
+
+    Every step selects what is left rather than tracking progress, so an
+    interrupted purge resumes where it stopped on the next run.
+    """
+    retrying = retry_on_busy(_delete_batch)
+    return [
+        ("notifications caused", lambda: _release_actor_notifications(user_id, batch_size)),
+        ("notifications received", lambda: retrying(Notification.objects.filter(recipient_id=user_id), batch_size)),
+        ("likes", lambda: _delete_like_batch(user_id, batch_size)),
+        ("following", lambda: retrying(UserFollowing._base_manager.filter(user_id=user_id), batch_size)),
+        ("followers", lambda: retrying(UserFollowing._base_manager.filter(following_user_id=user_id), batch_size)),
+        ("posts", lambda: _delete_post_batch(user_id, batch_size)),
+        ("archived likes", lambda: retrying(ArchivedPostLike.objects.filter(user_id=user_id), batch_size)),
+        ("archived posts", lambda: retrying(ArchivedPost._base_manager.filter(author_id=user_id), batch_size)),
+        ("idempotency keys", lambda: retrying(IdempotencyKey.objects.filter(user_id=user_id), batch_size)),
+        ("uploads", lambda: _discard_upload_batch(user_id, batch_size)),
+    ]
+
+
+def purge_user(user_id, batch_size=PURGE_BATCH_SIZE, pause=0.0, log=None):
+    """
+    Remove everything belonging to soft-deleted ``user_id`` in bounded
+    batches, then the user row itself. Returns the number of rows removed
+    per step.
+    """
+    totals = {}
+    for name, step in purge_steps(user_id, batch_size):
+        totals[name] = 0
+        while handled := step():
+            totals[name] += handled
+            if log:
+                log(f"user {user_id}: {name} {totals[name]}")
+            if pause:
+                time.sleep(pause)
+    _delete_user(user_id)
+    unhide_author(user_id)
+    return totals
+
+
+@retry_on_busy
+def _delete_user(user_id):
+    get_user_model().all_objects.filter(pk=user_id, deleted_at__isnull=False).delete()
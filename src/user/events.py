@@ -0,0 +1,269 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EVENTS_SETTINGS = {
+    "BACKEND": "user.events.LocalEventBackend",
+    "BACKEND_OPTIONS": {},
+    "REPLAY_BUFFER_SIZE": 100,
+    "REPLAY_MAX_CHANNELS": 10000,
+    "SUBSCRIBER_QUEUE_SIZE": 100,
+    "HEARTBEAT_SECONDS": 15,
+    "MAX_STREAM_SECONDS": 300,
+    "RETRY_MILLISECONDS": 3000,
+    "TICKET_SECONDS": 60,
+}
+
+TICKET_SALT = "user.events.ticket"
+
+
+def get_events_settings():
+    return {**DEFAULT_EVENTS_SETTINGS, **getattr(settings, "EVENTS", {})}
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+def author_channel(user_id):
+    return f"posts:{user_id}"
+
+
+def issue_stream_ticket(user):
+    """
+    A signed ticket that opens the event stream for ``user`` within
+    ``TICKET_SECONDS``. Browser ``EventSource`` cannot send headers, so it
+    passes this in the URL instead of the long-lived access token.
+    """
+    return signing.dumps(user.pk, salt=TICKET_SALT)
+
+
+def stream_ticket_user_id(ticket, config=None):
+    """
+    The user id a ticket was issued for, or None if it is invalid or
+    expired.
+    """
+    config = config or get_events_settings()
+    try:
+        return signing.loads(ticket, salt=TICKET_SALT, max_age=config["TICKET_SECONDS"])
+    except signing.BadSignature:
+        return None
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    channel: str
+    type: str
+    data: dict
+
+    def encode(self):
+        payload = json.dumps(self.data, cls=DjangoJSONEncoder, separators=(",", ":"))
+        return f"id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n".encode()
+
+    def to_message(self):
+        return json.dumps(
+            {"id": self.id, "channel": self.channel, "type": self.type, "data": self.data}, cls=DjangoJSONEncoder
+        )
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(**json.loads(message))
+
+
+@dataclass(eq=False)
+class Subscriber:
+    channels: frozenset
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue = field(repr=False)
+    dropped: bool = False
+
+
+class EventHub:
+    """
+    In-process fan-out of events to SSE subscribers.
+
+    ``publish`` may be called from any thread; events are handed to each
+    subscriber's event loop with ``call_soon_threadsafe``. The last
+    ``REPLAY_BUFFER_SIZE`` events of the ``REPLAY_MAX_CHANNELS`` most
+    recently active channels are kept so reconnecting clients can resume
+    from ``Last-Event-ID``. Cross-process delivery is
+    delegated to the configured backend, which calls ``dispatch`` on every
+    process that has subscribers.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_events_settings()
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._buffers = OrderedDict()
+        self._last_id = 0
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            backend_class = import_string(self.config["BACKEND"])
+            self._backend = backend_class(self, **self.config["BACKEND_OPTIONS"])
+        return self._backend
+
+    def next_id(self):
+        with self._lock:
+            self._last_id = max(self._last_id + 1, time.time_ns())
+            return self._last_id
+
+    def publish(self, channel, event_type, data):
+        self.backend.publish(Event(self.next_id(), channel, event_type, data))
+
+    def publish_on_commit(self, channel, event_type, data):
+        transaction.on_commit(lambda: self.publish(channel, event_type, data))
+
+    def dispatch(self, event):
+        with self._lock:
+            buffer = self._buffers.get(event.channel)
+            if buffer is None:
+                buffer = self._buffers[event.channel] = deque(maxlen=self.config["REPLAY_BUFFER_SIZE"])
+                if len(self._buffers) > self.config["REPLAY_MAX_CHANNELS"]:
+                    self._buffers.popitem(last=False)
+            else:
+                self._buffers.move_to_end(event.channel)
+            buffer.append(event)
+            subscribers = tuple(self._subscribers.get(event.channel, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(self._deliver, subscriber, event)
+            except RuntimeError:
+                # The subscriber's loop has already been closed.
+                self.unsubscribe(subscriber)
+
+    @staticmethod
+    def _deliver(subscriber, event):
+        try:
+            subscriber.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            subscriber.dropped = True
+
+    def subscribe(self, channels):
+        subscriber = Subscriber(
+            channels=frozenset(channels),
+            loop=asyncio.get_running_loop(),
+            queue=asyncio.Queue(maxsize=self.config["SUBSCRIBER_QUEUE_SIZE"]),
+        )
+        with self._lock:
+            for channel in subscriber.channels:
+                self._subscribers.setdefault(channel, set()).add(subscriber)
+        self.backend.subscribed(subscriber.channels)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            for channel in subscriber.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def replay(self, channels, last_event_id):
+        with self._lock:
+            events = [
+                event for channel in channels for event in self._buffers.get(channel, ()) if event.id > last_event_id
+            ]
+        return sorted(events, key=lambda event: event.id)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len({subscriber for subscribers in self._subscribers.values() for subscriber in subscribers})
+
+    async def stream(self, channels, last_event_id=None):
+        """
+        Yield SSE-encoded events for ``channels`` until the stream reaches
+        ``MAX_STREAM_SECONDS``, sending a comment line as heartbeat when idle.
+        """
+        subscriber = self.subscribe(channels)
+        deadline = time.monotonic() + self.config["MAX_STREAM_SECONDS"]
+        try:
+            yield f"retry: {self.config['RETRY_MILLISECONDS']}\n\n".encode()
+            if last_event_id is not None:
+                for event in self.replay(subscriber.channels, last_event_id):
+                    yield event.encode()
+            while not subscriber.dropped:
+                timeout = min(self.config["HEARTBEAT_SECONDS"], deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield b": heartbeat\n\n"
+                    continue
+                yield event.encode()
+        finally:
+            self.unsubscribe(subscriber)
+
+
+class LocalEventBackend:
+    """
+    Delivers events only within the current process. Used for development,
+    tests and single-worker deployments.
+    """
+
+    def __init__(self, hub, **options):
+        self.hub = hub
+
+    def publish(self, event):
+        self.hub.dispatch(event)
+
+    def subscribed(self, channels):
+        pass
+
+
+class RedisEventBackend:
+    """
+    Fans events out to every process through Redis pub/sub.
+
+    Requires the optional ``redis`` package. A daemon thread per process
+    listens on ``events:*`` and dispatches into the local hub.
+    """
+
+    def __init__(self, hub, url="redis://localhost:6379/0", prefix="events:"):
+        import redis
+
+        self.hub = hub
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, event):
+        self.client.publish(self.prefix + event.channel, event.to_message())
+
+    def subscribed(self, channels):
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="redis-event-listener", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self.prefix + "*")
+        for message in pubsub.listen():
+            try:
+                self.hub.dispatch(Event.from_message(message["data"]))
+            except (KeyError, TypeError, ValueError):
+                logger.exception("Invalid event message %r", message)
+
+
+hub = EventHub()
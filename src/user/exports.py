@@ -0,0 +1,114 @@
+import json
+import zlib
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from user.models import ArchivedPost, Post, UserFollowing
+from user.sharding import post_shards
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _line(record_type, data):
+    return json.dumps({"type": record_type, **data}, cls=DjangoJSONEncoder, ensure_ascii=False).encode() + b"\n"
+
+
+def iter_account_export(user, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield a user's account as NDJSON lines: the profile, then posts,
+    followings, followers and liked posts, archived posts included.
+
+    Every table is read with a server-side ``iterator()`` and hashtags are
+    fetched once per chunk of posts, so memory use does not grow with the
+    size of the account.
+    """
+    yield _line(
+        "user",
+        {
+            "id": user.id,
+            "email": user.email,
+            "username": user.username,
+            "phone_number": user.phone_number,
+            "bio": user.bio,
+            "location": user.location,
+            "birth_date": user.birth_date,
+            "profile_image": user.profile_image.name or None,
+            "date_joined": user.date_joined,
+        },
+    )
+
+    for model, posts in (
+        (Post, Post.objects.for_author(user.id)),
+        (ArchivedPost, ArchivedPost.objects.filter(author=user)),
+    ):
+        links = model.hashtag.through.objects.using(posts.db)
+        posts = (
+            posts.order_by("id")
+            .values("id", "content", "image", "is_published", "created_at", "updated_at")
+            .iterator(chunk_size=chunk_size)
+        )
+        for chunk in _chunked(posts, chunk_size):
+            hashtags = {}
+            chunk_links = links.filter(post_id__in=[post["id"] for post in chunk]).values_list(
+                "post_id", "hashtag__name"
+            )
+            for post_id, name in chunk_links:
+                hashtags.setdefault(post_id, []).append(name)
+            for post in chunk:
+                post["image"] = post["image"] or None
+                yield _line("post", {**post, "hashtags": hashtags.get(post["id"], [])})
+
+    followings = (
+        UserFollowing.objects.filter(user_id=user)
+        .order_by("id")
+        .values_list("following_user_id", "created")
+        .iterator(chunk_size=chunk_size)
+    )
+    for following_id, created in followings:
+        yield _line("following", {"user_id": following_id, "created": created})
+
+    followers = (
+        UserFollowing.objects.filter(following_user_id=user)
+        .order_by("id")
+        .values_list("user_id", "created")
+        .iterator(chunk_size=chunk_size)
+    )
+    for follower_id, created in followers:
+        yield _line("follower", {"user_id": follower_id, "created": created})
+
+    # Likes on sharded posts are spread over every shard.
+    like_tables = [Post.likes.through.objects.using(alias) for alias in post_shards()] or [Post.likes.through.objects]
+    for table in like_tables + [ArchivedPost.likes.through.objects]:
+        likes = (
+            table.filter(user_id=user.id)
+            .order_by("id")
+            .values_list("post_id", flat=True)
+            .iterator(chunk_size=chunk_size)
+        )
+        for post_id in likes:
+            yield _line("like", {"post_id": post_id})
+
+
+def gzip_stream(chunks, level=6, flush_size=64 * 1024):
+    """
+    Gzip an iterable of byte strings incrementally, yielding compressed
+    blocks of roughly ``flush_size`` input bytes.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= flush_size:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,71 @@
+import re
+import unicodedata
+
+from django.db import DEFAULT_DB_ALIAS
+
+from user.models import Hashtag, Post
+from user.sharding import replicate
+
+HASHTAG_MAX_LENGTH = Hashtag._meta.get_field("name").max_length
+
+# A tag starts after whitespace, punctuation or the start of the text and is
+# made of Unicode word characters plus combining marks and zero-width joiners.
+HASHTAG_PATTERN = re.compile(r"(?<![\w#&/])#(\w[\w\u0300-\u036f\u0900-\u0dff\u200c\u200d]*)")
+
+
+def normalize_hashtag(name):
+    """
+    Canonical form used for storage and lookups: NFKC, case-folded, without
+    a leading ``#`` and cut to the column length.
+    """
+    name = unicodedata.normalize("NFKC", name).strip().lstrip("#").casefold()
+    return name[:HASHTAG_MAX_LENGTH]
+
+
+def extract_hashtags(text):
+    """
+    Return the normalized ``#tags`` in ``text`` in order of first use.
+    """
+    names = (normalize_hashtag(match) for match in HASHTAG_PATTERN.findall(text or ""))
+    return list(dict.fromkeys(name for name in names if name and not name.isdigit()))
+
+
+def get_or_create_hashtags(names):
+    """
+    Return ``Hashtag`` objects for ``names`` with one SELECT, plus one
+    INSERT and one SELECT for the missing ones. With sharded posts the new
+    ones are also copied to every shard, as ``bulk_create`` sends no
+    ``post_save``.
+    """
+    names = list(dict.fromkeys(name for name in names if name))
+    if not names:
+        return []
+    hashtags = list(Hashtag.objects.filter(name__in=names))
+    missing = set(names).difference(tag.name for tag in hashtags)
+    if missing:
+        Hashtag.objects.bulk_create([Hashtag(name=name) for name in missing], ignore_conflicts=True)
+        created = list(Hashtag.objects.filter(name__in=missing))
+        replicate(Hashtag, created)
+        hashtags += created
+    return hashtags
+
+
+def link_hashtags(posts_to_names, using=DEFAULT_DB_ALIAS):
+    """
+    Attach hashtags to several posts at once: ``posts_to_names`` maps post
+    ids to tag names. The posts must all be in database ``using``. Existing
+    links are left in place.
+    """
+    hashtags = {
+        tag.name: tag.id for tag in get_or_create_hashtags(n for names in posts_to_names.values() for n in names)
+    }
+    Through = Post.hashtag.through
+    Through.objects.using(using).bulk_create(
+        [
+            Through(post_id=post_id, hashtag_id=hashtags[name])
+            for post_id, names in posts_to_names.items()
+            for name in names
+            if name in hashtags
+        ],
+        ignore_conflicts=True,
+    )
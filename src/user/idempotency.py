@@ -0,0 +1,173 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from user.db import retry_on_busy
+from user.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+DEFAULT_IDEMPOTENCY_SETTINGS = {
+    "TTL_SECONDS": 24 * 3600,
+    "WAIT_SECONDS": 10.0,
+    "IN_FLIGHT_TIMEOUT_SECONDS": 60,
+    "POLL_SECONDS": 0.05,
+    "PRUNE_BATCH_SIZE": 1000,
+}
+
+
+def get_idempotency_settings():
+    return {**DEFAULT_IDEMPOTENCY_SETTINGS, **getattr(settings, "IDEMPOTENCY", {})}
+
+
+def _canonical_value(value):
+    if isinstance(value, UploadedFile):
+        return {"file": value.name, "size": value.size, "content_type": value.content_type}
+    return value
+
+
+def request_fingerprint(request):
+    """
+    SHA-256 over the method, path and parsed body, so a reused key can be
+    told apart from a retry. Uploaded files contribute their name and size.
+    """
+    data = request.data
+    if hasattr(data, "lists"):
+        data = {name: [_canonical_value(value) for value in values] for name, values in data.lists()}
+    payload = json.dumps(
+        [request.method, request.get_full_path(), data], sort_keys=True, default=str, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@retry_on_busy
+def _insert(user, key, fingerprint, ttl):
+    # A savepoint, so a duplicate key leaves an enclosing transaction usable.
+    with transaction.atomic():
+        return IdempotencyKey.objects.create(
+            user=user, key=key, fingerprint=fingerprint, expires_at=timezone.now() + timedelta(seconds=ttl)
+        )
+
+
+def _replay(record):
+    return Response(
+        record.response, status=record.status_code, headers={**record.response_headers, REPLAYED_HEADER: "true"}
+    )
+
+
+def claim(user, key, fingerprint, config=None):
+    """
+    Reserve ``key`` for this request. Returns ``(record, None)`` when the
+    caller should run the view, or ``(None, response)`` when it should answer
+    with ``response`` instead: the stored outcome of an earlier request, or
+    an error. A duplicate that arrives while the first request is in flight
+    waits for it for up to ``WAIT_SECONDS`` and then replays its outcome.
+    """
+    config = config or get_idempotency_settings()
+    deadline = time.monotonic() + config["WAIT_SECONDS"]
+    while True:
+        try:
+            return _insert(user, key, fingerprint, config["TTL_SECONDS"]), None
+        except IntegrityError:
+            pass
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:
+            continue
+        now = timezone.now()
+        abandoned = record.status_code is None and record.created_at <= now - timedelta(
+            seconds=config["IN_FLIGHT_TIMEOUT_SECONDS"]
+        )
+        if record.expires_at <= now or abandoned:
+            # Expired, or left in flight by a worker that died mid-request.
+            IdempotencyKey.objects.filter(pk=record.pk, status_code=record.status_code).delete()
+            continue
+        if record.fingerprint != fingerprint:
+            return None, Response(
+                {"detail": f"This {IDEMPOTENCY_HEADER} was already used for a different request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if record.status_code is not None:
+            return None, _replay(record)
+        if time.monotonic() >= deadline:
+            return None, Response(
+                {"detail": f"A request with this {IDEMPOTENCY_HEADER} is still in progress."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        time.sleep(config["POLL_SECONDS"])
+
+
+def complete(record, response):
+    """
+    Store the outcome of the request that owns ``record``: its status, data
+    and the headers the view set. Server errors are not stored, so the
+    client can retry them with the same key.
+    """
+    if response.status_code >= 500:
+        release(record)
+        return
+    # The content type is set again when the replay is rendered.
+    headers = {name: value for name, value in response.items() if name.lower() != "content-type"}
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        status_code=response.status_code, response=response.data, response_headers=headers
+    )
+
+
+def release(record):
+    IdempotencyKey.objects.filter(pk=record.pk).delete()
+
+
+def idempotent(view_method):
+    """
+    Make a DRF view method safe to retry with an ``Idempotency-Key`` header.
+
+    The first request with a key runs the view and stores its status, data
+    and headers; later requests with the same key and body get that response
+    back without running the view. Requests without the header are unaffected.
+    """
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        if not key or len(key) > IdempotencyKey._meta.get_field("key").max_length:
+            return Response(
+                {"detail": f"{IDEMPOTENCY_HEADER} must be 1 to 255 characters."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        record, response = claim(request.user, key, request_fingerprint(request))
+        if response is not None:
+            return response
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            release(record)
+            raise
+        complete(record, response)
+        return response
+
+    return wrapper
+
+
+def prune_expired(batch_size=None, now=None):
+    """
+    Delete expired keys in batches, each in its own transaction, and return
+    how many were removed.
+    """
+    batch_size = batch_size or get_idempotency_settings()["PRUNE_BATCH_SIZE"]
+    now = now or timezone.now()
+    delete_batch = retry_on_busy(lambda pks: IdempotencyKey.objects.filter(pk__in=pks, expires_at__lte=now).delete()[0])
+    deleted = 0
+    while pks := list(IdempotencyKey.objects.filter(expires_at__lte=now).values_list("pk", flat=True)[:batch_size]):
+        deleted += delete_batch(pks)
+    return deleted
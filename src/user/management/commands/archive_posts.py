@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.archive import archive_cutoff, archive_old_posts, get_archive_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Move posts older than ARCHIVE['AFTER_DAYS'] with their likes and hashtag links to the archive "
+        "tables, in batches that each run in their own transaction. Safe to interrupt and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--after-days", type=int, default=None)
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        after_days = options["after_days"] or get_archive_settings()["AFTER_DAYS"]
+        log = self.stdout.write if options["verbosity"] > 1 else None
+        start = time.perf_counter()
+        archived = archive_old_posts(archive_cutoff(after_days), options["batch_size"], log=log)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {archived} posts older than {after_days} days in {time.perf_counter() - start:.2f}s."
+            )
+        )
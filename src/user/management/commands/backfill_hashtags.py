@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max, Min
+
+from user.db import retry_on_busy
+from user.hashtags import extract_hashtags, link_hashtags
+from user.models import Post
+from user.sharding import post_databases
+
+
+class Command(BaseCommand):
+    help = "Parse #tags from the content of existing posts and link them, in parallel chunks of post ids."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--start-id", type=int, default=None, help="Resume from this post id")
+
+    def handle(self, *args, **options):
+        size = options["chunk_size"]
+        ranges = []
+        # Ranges are per post database, as each shard holds its own ids.
+        for alias in post_databases():
+            bounds = Post.objects.using(alias).aggregate(low=Min("id"), high=Max("id"))
+            if bounds["low"] is not None:
+                low = options["start_id"] or bounds["low"]
+                ranges += [(alias, start, start + size) for start in range(low, bounds["high"] + 1, size)]
+        if not ranges:
+            self.stdout.write("No posts to backfill.")
+            return
+
+        linked = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            for (alias, start, end), count in zip(ranges, pool.map(self._process_range, ranges)):
+                linked += count
+                self.stdout.write(f"{alias} posts {start}-{end - 1}: {count} posts with tags")
+        self.stdout.write(self.style.SUCCESS(f"Backfilled hashtags for {linked} posts."))
+
+    def _process_range(self, bounds):
+        alias, start, end = bounds
+        try:
+            rows = Post.objects.using(alias).filter(id__gte=start, id__lt=end).values_list("id", "content")
+            posts_to_names = {post_id: names for post_id, content in rows if (names := extract_hashtags(content))}
+            if posts_to_names:
+                retry_on_busy(link_hashtags, using=alias)(posts_to_names, using=alias)
+            return len(posts_to_names)
+        finally:
+            connections.close_all()
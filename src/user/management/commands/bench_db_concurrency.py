@@ -0,0 +1,103 @@
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+
+from user.benchmarks import create_bench_data, delete_bench_data
+from user.db import is_database_locked, retry_on_busy
+from user.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a mixed read/write workload (post listing and like toggles) from several threads "
+        "and report throughput, latency and lock errors. Compare runs with DATABASE_MODE unset "
+        "and DATABASE_MODE=production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+        parser.add_argument("--write-ratio", type=float, default=0.2)
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--posts", type=int, default=200)
+        parser.add_argument("--no-retry", action="store_true", help="Do not retry writes on SQLITE_BUSY")
+
+    def handle(self, *args, **options):
+        journal_mode = self._journal_mode()
+        self.stdout.write(
+            f"mode={settings.DATABASE_MODE} journal_mode={journal_mode} "
+            f"conn_max_age={settings.DATABASES['default'].get('CONN_MAX_AGE', 0)}"
+        )
+        users, posts = create_bench_data(options["users"], options["posts"])
+        try:
+            results = self._run(users, posts, options)
+        finally:
+            delete_bench_data()
+        self._report(results, options["duration"])
+
+    def _journal_mode(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            return cursor.fetchone()[0]
+
+    def _run(self, users, posts, options):
+        deadline = time.perf_counter() + options["duration"]
+        results = []
+        lock = threading.Lock()
+
+        def toggle_like(user_id, post_id):
+            post = Post.objects.get(pk=post_id)
+            if post.likes.filter(pk=user_id).exists():
+                post.likes.remove(user_id)
+            else:
+                post.likes.add(user_id)
+
+        write = toggle_like if options["no_retry"] else retry_on_busy(toggle_like)
+
+        def worker():
+            rng = random.Random()
+            local = {"reads": [], "writes": [], "errors": 0}
+            try:
+                while time.perf_counter() < deadline:
+                    is_write = rng.random() < options["write_ratio"]
+                    start = time.perf_counter()
+                    try:
+                        if is_write:
+                            write(rng.choice(users), rng.choice(posts))
+                        else:
+                            list(Post.objects.select_related("author").prefetch_related("likes")[:20])
+                    except OperationalError as error:
+                        if not is_database_locked(error):
+                            raise
+                        local["errors"] += 1
+                        continue
+                    local["writes" if is_write else "reads"].append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+                with lock:
+                    results.append(local)
+
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _report(self, results, duration):
+        for kind in ("reads", "writes"):
+            latencies = sorted(value for result in results for value in result[kind])
+            if not latencies:
+                self.stdout.write(f"{kind}: none")
+                continue
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f"{kind}: {len(latencies) / duration:.0f} ops/s "
+                f"p50={statistics.median(latencies) * 1000:.2f}ms p99={p99 * 1000:.2f}ms"
+            )
+        self.stdout.write(f"locked errors: {sum(result['errors'] for result in results)}")
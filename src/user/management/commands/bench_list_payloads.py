@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from user.benchmarks import create_bench_data, delete_bench_data, time_view
+from user.views import PostListCreateUpdateDestroyViewSet
+
+DEFAULT_QUERIES = (
+    "",
+    "?expand=",
+    "?fields=author,content,created_at",
+    "?fields=content,created_at",
+)
+
+
+class Command(BaseCommand):
+    help = "Compare payload size, queries and CPU time of the post list for different ?fields=/?expand= values."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=500)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--likes-per-post", type=int, default=20)
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--query", action="append", dest="queries", help="Query string to measure, repeatable")
+
+    def handle(self, *args, **options):
+        users, _ = create_bench_data(
+            options["users"], options["posts"], likes_per_post=options["likes_per_post"], hashtags=20
+        )
+        viewer = get_user_model().objects.get(pk=users[0])
+        view = PostListCreateUpdateDestroyViewSet.as_view({"get": "list"}, throttle_classes=[])
+        try:
+            baseline = None
+            for query in options["queries"] or DEFAULT_QUERIES:
+                with CaptureQueriesContext(connection) as queries:
+                    response, _, _ = time_view(view, "/api/v1/user/posts/" + query, viewer, 1)
+                _, wall, cpu = time_view(view, "/api/v1/user/posts/" + query, viewer, options["iterations"])
+                size = len(response.content)
+                baseline = baseline or (size, cpu)
+                self.stdout.write(
+                    f"{query or '(full)':<40} {size:>10} bytes ({size / baseline[0]:.0%}) "
+                    f"{len(queries):>3} queries  wall={wall * 1000:.1f}ms cpu={cpu * 1000:.1f}ms "
+                    f"({cpu / baseline[1]:.0%})"
+                )
+        finally:
+            delete_bench_data()
@@ -0,0 +1,109 @@
+import http.client
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.urls import re_path
+from django.views.static import serve
+
+from user.media import serve_media
+
+urlpatterns = []
+
+
+class ThreadingServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Download a media file through django.views.static.serve and user.media.serve_media over HTTP "
+        "with concurrent clients, and report throughput, bytes on the wire and memory per download for "
+        "full downloads, resumed (Range) downloads and cache revalidations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size-mb", type=int, default=20)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--requests", type=int, default=64)
+
+    def handle(self, *args, **options):
+        size = options["size_mb"] * 1024 * 1024
+        with tempfile.TemporaryDirectory() as media_root:
+            with open(os.path.join(media_root, "video.bin"), "wb") as file:
+                file.write(os.urandom(size))
+            urlpatterns[:] = [
+                re_path(r"^static-serve/(?P<path>.+)$", serve, {"document_root": media_root}),
+                re_path(r"^media/(?P<path>.+)$", serve_media),
+            ]
+            with override_settings(ROOT_URLCONF=__name__, MEDIA_ROOT=media_root, ALLOWED_HOSTS=["*"], DEBUG=False):
+                server = make_server(
+                    "127.0.0.1", 0, WSGIHandler(), server_class=ThreadingServer, handler_class=QuietHandler
+                )
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                try:
+                    self._run(server.server_port, size, options["concurrency"], options["requests"])
+                finally:
+                    server.shutdown()
+
+    def _run(self, port, size, concurrency, requests):
+        etag = self._fetch(port, "/media/video.bin", {})[1].get("etag")
+        scenarios = {
+            "full download": {},
+            "resume from 50%": {"Range": f"bytes={size // 2}-"},
+            "revalidate": {"If-None-Match": etag},
+        }
+        self.stdout.write(f"{size / 1024 / 1024:.0f} MiB file, {concurrency} concurrent clients, {requests} requests")
+        for scenario, headers in scenarios.items():
+            for label, path in (("static.serve", "/static-serve/video.bin"), ("serve_media", "/media/video.bin")):
+                self._measure(port, f"{scenario:<16} {label:<13}", path, headers, concurrency, requests)
+
+    def _measure(self, port, label, path, headers, concurrency, requests):
+        def run():
+            with ThreadPoolExecutor(concurrency) as pool:
+                return list(pool.map(lambda _: self._fetch(port, path, headers), range(requests)))
+
+        # Time and trace allocations in separate passes: tracemalloc slows
+        # every allocation enough to distort the throughput numbers.
+        cpu = time.process_time()
+        start = time.perf_counter()
+        results = run()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        received = sum(length for length, _, _ in results)
+        statuses = sorted({status for _, _, status in results})
+        self.stdout.write(
+            f"{label} status {statuses}: {requests / elapsed:7.1f} req/s, "
+            f"{received / elapsed / 1024 / 1024:7.1f} MiB/s, {received / requests / 1024:9.1f} KiB/request, "
+            f"CPU {cpu / requests * 1000:6.2f}ms/request, peak {peak / concurrency / 1024:6.1f} KiB/download"
+        )
+
+    @staticmethod
+    def _fetch(port, path, headers):
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection.request("GET", path, headers=headers)
+        response = connection.getresponse()
+        received = 0
+        while block := response.read(64 * 1024):
+            received += len(block)
+        connection.close()
+        return received, {name.lower(): value for name, value in response.getheaders()}, response.status
@@ -0,0 +1,93 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from user.archive import archive_old_posts
+from user.benchmarks import create_bench_data, delete_bench_data, time_view
+from user.models import ArchivedPost, Post
+from user.views import PostListCreateUpdateDestroyViewSet
+
+HOT_TABLES = (Post._meta.db_table, Post.likes.through._meta.db_table, Post.hashtag.through._meta.db_table)
+
+
+def table_sizes(tables):
+    """
+    Bytes used by each table and its indexes, keyed by table. Returns None
+    when the backend cannot report sizes.
+    """
+    sizes = {}
+    with connection.cursor() as cursor:
+        for table in tables:
+            if connection.vendor == "postgresql":
+                cursor.execute("SELECT pg_table_size(%s), pg_indexes_size(%s)", [table, table])
+                sizes[table] = cursor.fetchone()
+            elif connection.vendor == "sqlite":
+                try:
+                    cursor.execute(
+                        "SELECT SUM(CASE WHEN name = %s THEN pgsize ELSE 0 END), "
+                        "SUM(CASE WHEN name != %s THEN pgsize ELSE 0 END) FROM dbstat "
+                        "WHERE name = %s OR name IN (SELECT name FROM sqlite_schema WHERE tbl_name = %s AND type = 'index')",
+                        [table, table, table, table],
+                    )
+                except Exception:
+                    return None
+                sizes[table] = cursor.fetchone()
+            else:
+                return None
+    return sizes
+
+
+class Command(BaseCommand):
+    help = (
+        "Create posts spread over a year, then report hot table and index sizes and post list latency "
+        "before and after archiving, plus the latency of an author history that unions in the archive."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=5000)
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--likes-per-post", type=int, default=10)
+        parser.add_argument("--span-days", type=int, default=365)
+        parser.add_argument("--after-days", type=int, default=30)
+        parser.add_argument("--iterations", type=int, default=5)
+
+    def handle(self, *args, **options):
+        user_ids, post_ids = create_bench_data(
+            options["users"], options["posts"], likes_per_post=options["likes_per_post"], hashtags=20
+        )
+        try:
+            rng = random.Random(0)
+            now = timezone.now()
+            for post_id in post_ids:
+                age = timedelta(minutes=rng.randrange(options["span_days"] * 24 * 60))
+                Post.objects.filter(pk=post_id).update(created_at=now - age)
+            user = Post.objects.filter(pk__in=post_ids).first().author
+
+            self._report("before", user, options)
+            archived = archive_old_posts(now - timedelta(days=options["after_days"]))
+            if connection.vendor == "sqlite":
+                # Rebuild the file so freed pages stop counting towards the hot tables.
+                with connection.cursor() as cursor:
+                    cursor.execute("VACUUM")
+            self.stdout.write(f"archived {archived} posts, {ArchivedPost.objects.count()} in archive")
+            self._report("after", user, options)
+        finally:
+            delete_bench_data()
+
+    def _report(self, label, user, options):
+        sizes = table_sizes(HOT_TABLES)
+        if sizes is not None:
+            for table, (data, indexes) in sizes.items():
+                self.stdout.write(
+                    f"{label:<7} {table:<22} data={(data or 0) / 1024:>8.0f}KiB indexes={(indexes or 0) / 1024:>8.0f}KiB"
+                )
+        list_view = PostListCreateUpdateDestroyViewSet.as_view({"get": "list"}, throttle_classes=[])
+        for name, path in (
+            ("latest posts", "/api/v1/user/posts/?fields=content,created_at"),
+            ("author history", f"/api/v1/user/posts/?author={user.pk}"),
+        ):
+            response, wall, _ = time_view(list_view, path, user, options["iterations"])
+            self.stdout.write(f"{label:<7} {name:<22} {len(response.data):>6} posts {wall * 1000:>8.1f}ms")
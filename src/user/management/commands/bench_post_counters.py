@@ -0,0 +1,91 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import F, Sum
+
+from user.benchmarks import create_bench_data, delete_bench_data
+from user.counters import CounterBuffer, get_post_counters_settings
+from user.db import retry_on_busy
+from user.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure sustained impression increments per second from several threads, buffered through "
+        "CounterBuffer versus one UPDATE per increment, and check that no increment is lost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds to run each mode")
+        parser.add_argument("--posts", type=int, default=1000)
+        parser.add_argument("--page-size", type=int, default=20, help="Posts per simulated list response")
+        parser.add_argument("--flush-interval", type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        _, post_ids = create_bench_data(users=20, posts=options["posts"])
+        try:
+            for mode in ("direct", "buffered"):
+                Post.objects.filter(pk__in=post_ids).update(impression_count=0)
+                increments, elapsed, extra = self._run(mode, post_ids, options)
+                stored = Post.objects.filter(pk__in=post_ids).aggregate(total=Sum("impression_count"))["total"]
+                if stored != increments:
+                    raise CommandError(f"{mode}: {increments} increments recorded but {stored} stored")
+                self.stdout.write(f"{mode:<9} {increments / elapsed:>10.0f} increments/s  {extra}")
+        finally:
+            delete_bench_data()
+
+    def _run(self, mode, post_ids, options):
+        buffer = CounterBuffer({**get_post_counters_settings(), "FLUSH_INTERVAL_SECONDS": options["flush_interval"]})
+        flush_times = []
+        stop = threading.Event()
+        totals = []
+        lock = threading.Lock()
+
+        @retry_on_busy
+        def direct(page):
+            Post.objects.filter(pk__in=page).update(impression_count=F("impression_count") + 1)
+
+        def flusher():
+            while not stop.wait(options["flush_interval"]):
+                start = time.perf_counter()
+                buffer.flush()
+                flush_times.append(time.perf_counter() - start)
+            connections.close_all()
+
+        def worker():
+            rng = random.Random()
+            count = 0
+            try:
+                while not stop.is_set():
+                    page = rng.sample(post_ids, options["page_size"])
+                    if mode == "direct":
+                        direct(page)
+                    else:
+                        buffer.record_impressions(page)
+                    count += len(page)
+            finally:
+                connections.close_all()
+                with lock:
+                    totals.append(count)
+
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+        if mode == "buffered":
+            threads.append(threading.Thread(target=flusher))
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(options["duration"])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        extra = ""
+        if mode == "buffered":
+            buffer.flush()
+            if flush_times:
+                extra = f"{len(flush_times)} flushes, mean wall time under load {sum(flush_times) / len(flush_times) * 1000:.1f}ms"
+        return sum(totals), elapsed, extra
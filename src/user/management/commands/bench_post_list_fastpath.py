@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from user.benchmarks import create_bench_data, delete_bench_data
+from user.models import Post
+from user.renderers import FastJSONRenderer
+from user.serializers import PostListSerializer, PostListFastSerializer
+
+DEFAULT_QUERIES = ("", "?expand=", "?fields=author,content,created_at", "?fields=likes,hashtag&expand=hashtag")
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that PostListFastSerializer + FastJSONRenderer produce byte-identical output to "
+        "PostListSerializer + JSONRenderer and compare their throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=500)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--likes-per-post", type=int, default=20)
+        parser.add_argument("--iterations", type=int, default=10)
+
+    def handle(self, *args, **options):
+        create_bench_data(options["users"], options["posts"], likes_per_post=options["likes_per_post"], hashtags=20)
+        factory = APIRequestFactory(SERVER_NAME="localhost")
+        try:
+            for query in DEFAULT_QUERIES:
+                request = Request(factory.get("/api/v1/user/posts/" + query))
+                drf_body, drf_time = self._measure(lambda: self._render_drf(request), options["iterations"])
+                fast_body, fast_time = self._measure(lambda: self._render_fast(request), options["iterations"])
+                if drf_body != fast_body:
+                    raise CommandError(f"Fast path output differs from PostListSerializer for {query or '(full)'}")
+                self.stdout.write(
+                    f"{query or '(full)':<40} {len(drf_body):>9} bytes identical  "
+                    f"drf={drf_time * 1000:.1f}ms fast={fast_time * 1000:.1f}ms "
+                    f"({drf_time / fast_time:.1f}x, {options['posts'] / fast_time:.0f} posts/s)"
+                )
+        finally:
+            delete_bench_data()
+
+    @staticmethod
+    def _measure(render, iterations):
+        body = render()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            render()
+        return body, (time.perf_counter() - start) / iterations
+
+    @staticmethod
+    def _render_drf(request):
+        queryset = PostListSerializer.setup_eager_loading(Post.objects.all(), request)
+        data = PostListSerializer(queryset, many=True, context={"request": request}).data
+        return JSONRenderer().render(data)
+
+    @staticmethod
+    def _render_fast(request):
+        serializer = PostListFastSerializer(request)
+        return FastJSONRenderer().render(serializer.to_representation(serializer.get_rows(Post.objects.all())))
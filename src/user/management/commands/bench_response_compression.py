@@ -0,0 +1,93 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.test import override_settings
+
+from user.benchmarks import create_bench_data, delete_bench_data, time_view
+from user.compression import CompressionMiddleware, get_response_compression_settings
+from user.models import Post, UserFollowing
+from user.summary import get_user_summary_settings, invalidate_user_summary
+from user.views import FollowersUsersViewSet, PostListCreateUpdateDestroyViewSet, UserViewSet
+
+ENCODINGS = {"identity": "", "gzip": "gzip, deflate, br"}
+
+
+def through_middleware(view, **kwargs):
+    """
+    ``view`` behind ``CompressionMiddleware`` alone, rendering DRF responses
+    first as Django's handler does.
+    """
+
+    def get_response(request):
+        response = view(request, **kwargs)
+        if hasattr(response, "render"):
+            response.render()
+        return response
+
+    return CompressionMiddleware(get_response)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure bytes on the wire and CPU per request with and without gzip for the post and follower lists "
+        "(compressed on the fly) and for cached user summaries, served precompressed or recompressed on "
+        "every hit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=500)
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--likes-per-post", type=int, default=20)
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--summary-posts", type=int, default=20, help="Latest posts included in a summary")
+
+    def handle(self, *args, **options):
+        users, _ = create_bench_data(
+            options["users"], options["posts"], likes_per_post=options["likes_per_post"], hashtags=20
+        )
+        User = get_user_model()
+        viewer = User.objects.get(pk=users[0])
+        UserFollowing.objects.bulk_create(
+            [UserFollowing(user_id_id=user_id, following_user_id_id=viewer.pk) for user_id in users[1:]]
+        )
+        profile_id = (
+            Post.objects.filter(author_id__in=users)
+            .values("author_id")
+            .annotate(total=Count("id"))
+            .order_by("-total")
+            .values_list("author_id", flat=True)
+            .first()
+        )
+        posts = through_middleware(PostListCreateUpdateDestroyViewSet.as_view({"get": "list"}, throttle_classes=[]))
+        followers = through_middleware(FollowersUsersViewSet.as_view({"get": "list"}, throttle_classes=[]))
+        summary_path = f"/api/v1/user/users/{profile_id}/summary/"
+
+        try:
+            self._run("post list", posts, "/api/v1/user/posts/", viewer, options["iterations"])
+            self._run("follower list", followers, "/api/v1/user/followers/", viewer, options["iterations"])
+            for label, precompress in (("summary hit, precompressed", True), ("summary hit, recompressed", False)):
+                config = {**get_response_compression_settings(), "PRECOMPRESS": precompress}
+                summary_config = {**get_user_summary_settings(), "POSTS": options["summary_posts"]}
+                with override_settings(RESPONSE_COMPRESSION=config, USER_SUMMARY=summary_config):
+                    invalidate_user_summary(profile_id)
+                    summary = UserViewSet.as_view({"get": "summary"}, throttle_classes=[])
+                    self._run(
+                        label, through_middleware(summary, pk=profile_id), summary_path, viewer, options["iterations"]
+                    )
+        finally:
+            UserFollowing.objects.filter(following_user_id=viewer).delete()
+            delete_bench_data()
+
+    def _run(self, label, view, path, user, iterations):
+        baseline = None
+        for encoding, accept in ENCODINGS.items():
+            extra = {"HTTP_ACCEPT_ENCODING": accept} if accept else {}
+            # The first call fills any cache the view uses.
+            time_view(view, path, user, 1, **extra)
+            response, wall, cpu = time_view(view, path, user, iterations, **extra)
+            size = len(response.content)
+            baseline = baseline or size
+            self.stdout.write(
+                f"{label:<28} {encoding:<9} {response.get('Content-Encoding', '-'):<5} {size:>9} bytes "
+                f"({size / baseline:6.1%})  wall={wall * 1000:7.2f}ms  cpu={cpu * 1000:7.2f}ms/request"
+            )
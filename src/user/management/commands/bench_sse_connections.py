@@ -0,0 +1,58 @@
+import asyncio
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from user.events import EventHub, get_events_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Open idle SSE streams against an in-process EventHub and report memory per connection "
+        "and the time to fan one event out to all of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=10000)
+        parser.add_argument("--channels-per-connection", type=int, default=20)
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options["connections"], options["channels_per_connection"]))
+
+    async def _run(self, count, channels_per_connection):
+        hub = EventHub({**get_events_settings(), "BACKEND": "user.events.LocalEventBackend", "HEARTBEAT_SECONDS": 3600})
+        received = 0
+        all_received = asyncio.Event()
+
+        async def client(index):
+            nonlocal received
+            channels = ["broadcast"] + [f"posts:{(index + i) % 1000}" for i in range(channels_per_connection - 1)]
+            stream = hub.stream(channels)
+            await anext(stream)  # retry preamble
+            await anext(stream)
+            received += 1
+            if received == count:
+                all_received.set()
+            await stream.aclose()
+
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        tasks = [asyncio.create_task(client(index)) for index in range(count)]
+        while hub.subscriber_count < count:
+            await asyncio.sleep(0.01)
+        idle_bytes = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        hub.publish("broadcast", "post", {"id": 1})
+        await all_received.wait()
+        fanout = time.perf_counter() - start
+        await asyncio.gather(*tasks)
+
+        per_connection = idle_bytes / count
+        self.stdout.write(
+            f"{count} idle connections: {idle_bytes / 1024 / 1024:.1f} MiB "
+            f"({per_connection / 1024:.1f} KiB each, ~{256 * 1024 * 1024 / per_connection:,.0f} per 256 MiB worker)"
+        )
+        self.stdout.write(f"fan-out of one event to all connections: {fanout * 1000:.1f}ms")
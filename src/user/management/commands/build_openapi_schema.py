@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from user.schema import SCHEMA_RENDERERS, generate_schema, render_schema, schema_file_path
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema into versioned YAML and JSON files served by the schema view."
+
+    def handle(self, *args, **options):
+        schema = generate_schema()
+        for schema_format in SCHEMA_RENDERERS:
+            path = schema_file_path(schema_format)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(render_schema(schema, schema_format))
+            self.stdout.write(f"Wrote {path}")
+        self.stdout.write(self.style.SUCCESS(f"Schema version {settings.SPECTACULAR_SETTINGS['VERSION']} built."))
@@ -0,0 +1,38 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from user.exports import EXPORT_CHUNK_SIZE, gzip_stream, iter_account_export
+
+
+class Command(BaseCommand):
+    help = "Export a user's posts, followings, followers and likes as NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("user", help="User id or email")
+        parser.add_argument("-o", "--output", help="Output file (defaults to stdout)")
+        parser.add_argument("--gzip", action="store_true", help="Gzip the output")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        lookup = {"pk": options["user"]} if options["user"].isdigit() else {"email": options["user"]}
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        chunks = iter_account_export(user, chunk_size=options["chunk_size"])
+        if options["gzip"]:
+            chunks = gzip_stream(chunks)
+
+        output = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options["output"]:
+                output.close()
+            else:
+                output.flush()
@@ -0,0 +1,57 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+STARTUP_SCRIPT = (
+    "import time; start = time.perf_counter(); "
+    "import django; django.setup(); "
+    "from django.urls import get_resolver; get_resolver().url_patterns; "
+    "import sys; print(f'startup: {(time.perf_counter() - start) * 1000:.1f}ms', file=sys.stderr)"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure worker cold start: import config.settings, set up INSTALLED_APPS and load the URLconf "
+        "in a fresh interpreter with -X importtime, then list the slowest imports."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=25)
+        parser.add_argument(
+            "--self", action="store_true", dest="by_self", help="Sort by self time instead of cumulative"
+        )
+
+    def handle(self, *args, **options):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "config.settings")}
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        imports = []
+        for line in result.stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match:
+                imports.append((int(match[1]), int(match[2]), len(match[3]) // 2, match[4]))
+            elif line.startswith("startup:"):
+                self.stdout.write(line)
+        if result.returncode:
+            self.stderr.write(result.stderr[-2000:])
+            return
+
+        top_level = sum(cumulative for _, cumulative, depth, _ in imports if depth == 0)
+        self.stdout.write(f"{len(imports)} modules, {top_level / 1000:.1f}ms importing")
+        key = 0 if options["by_self"] else 1
+        for self_us, cumulative_us, depth, module in sorted(imports, key=lambda row: row[key], reverse=True)[
+            : options["top"]
+        ]:
+            self.stdout.write(f"{cumulative_us / 1000:>8.1f}ms {self_us / 1000:>7.1f}ms  {module}")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from user.idempotency import prune_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key records in batches. Run periodically, e.g. from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        deleted = prune_expired(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from user.uploads import prune_expired_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads left unattached past UPLOADS['EXPIRE_HOURS']. Run periodically, e.g. from cron."
+
+    def handle(self, *args, **options):
+        pruned = prune_expired_uploads()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {pruned} expired uploads."))
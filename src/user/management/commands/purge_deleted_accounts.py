@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from user.deletion import PURGE_BATCH_SIZE, pending_purge, purge_user
+
+
+class Command(BaseCommand):
+    help = (
+        "Purge soft-deleted accounts: remove their posts, likes, follows and notifications in bounded "
+        "batches, then the user rows. Safe to interrupt; the next run continues where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+        parser.add_argument("--limit", type=int, default=None, help="Purge at most this many accounts")
+
+    def handle(self, *args, **options):
+        user_ids = list(pending_purge().values_list("pk", flat=True)[: options["limit"]])
+        if not user_ids:
+            self.stdout.write("No accounts to purge.")
+            return
+        log = self.stdout.write if options["verbosity"] > 1 else None
+        for user_id in user_ids:
+            totals = purge_user(user_id, options["batch_size"], options["pause"], log=log)
+            summary = ", ".join(f"{name}: {count}" for name, count in totals.items())
+            self.stdout.write(f"Purged user {user_id} ({summary})")
+        self.stdout.write(self.style.SUCCESS(f"Purged {len(user_ids)} accounts."))
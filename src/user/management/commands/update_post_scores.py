@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.ranking import decay_scores, rebuild_engagement
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply time decay to post scores used by ?order=ranked. Run periodically. With --rebuild, first "
+        "recompute engagement from like and follower counts (backfill, or after account purges)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            start = time.perf_counter()
+            rebuilt = rebuild_engagement()
+            self.stdout.write(f"Rebuilt engagement for {rebuilt} posts in {time.perf_counter() - start:.2f}s")
+        start = time.perf_counter()
+        updated = decay_scores()
+        self.stdout.write(self.style.SUCCESS(f"Decayed {updated} post scores in {time.perf_counter() - start:.2f}s."))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from user.caching import refresh
+from user.models import Post
+from user.ranking import candidates_cache_key, get_ranking_settings, ranked_candidates
+from user.summary import (
+    build_profile_summary,
+    get_user_summary_settings,
+    most_followed_profile_ids,
+    profile_summary_cache_key,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Prefill the read caches for the hottest keys: the ranked post candidates and the summaries of the "
+        "most followed profiles. Run on deploy so new workers do not start cold; needs a shared CACHES backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", type=int, default=100, help="Number of most followed profiles to warm")
+
+    def handle(self, *args, **options):
+        ranking = get_ranking_settings()
+        for limit in sorted({ranking["TOP_K"], ranking["MAX_TOP_K"]}):
+            refresh(
+                candidates_cache_key(limit),
+                lambda: ranked_candidates(Post.objects.all(), limit, ranking),
+                ranking["CACHE_SECONDS"],
+            )
+        self.stdout.write("Warmed ranked post candidates.")
+
+        summary = get_user_summary_settings()
+        profile_ids = most_followed_profile_ids(options["profiles"])
+        for profile_id in profile_ids:
+            refresh(
+                profile_summary_cache_key(profile_id),
+                lambda: build_profile_summary(profile_id),
+                summary["CACHE_SECONDS"],
+            )
+        self.stdout.write(self.style.SUCCESS(f"Warmed {len(profile_ids)} profile summaries."))
@@ -0,0 +1,171 @@
+import mimetypes
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+from user.uploads import get_upload_settings
+
+DEFAULT_MEDIA_SERVING_SETTINGS = {
+    "ENABLED": False,
+    "MODE": "django",
+    "ACCEL_REDIRECT_PREFIX": "/protected-media/",
+    "MAX_AGE": 7 * 24 * 3600,
+    "BLOCK_SIZE": 64 * 1024,
+}
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def get_media_serving_settings():
+    return {**DEFAULT_MEDIA_SERVING_SETTINGS, **getattr(settings, "MEDIA_SERVING", {})}
+
+
+class FileRange:
+    """
+    Read-only view of ``length`` bytes of ``file`` starting at ``start``.
+
+    It exposes ``fileno`` so a WSGI server's ``wsgi.file_wrapper`` can
+    ``sendfile`` the range (gunicorn sends Content-Length bytes from the
+    current offset), and bounds ``read`` for servers that iterate instead.
+    It has no ``tell``, so ``FileResponse`` leaves Content-Length to us.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(stat):
+    return quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+
+
+def not_modified(request, etag, mtime):
+    """
+    RFC 9110 precedence: If-None-Match decides when present, otherwise
+    If-Modified-Since.
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return since is not None and int(mtime) <= since
+
+
+def requested_range(request, size, etag, mtime):
+    """
+    Return ``(start, end)`` for a single satisfiable ``bytes`` range, None to
+    send the whole file, or ``False`` when the range cannot be satisfied.
+    Multi-range requests and ranges whose ``If-Range`` validator no longer
+    matches get the whole file, which RFC 9110 allows.
+    """
+    header = request.headers.get("Range")
+    if not header:
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != int(mtime):
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def validator_headers(response, etag, mtime, config):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(mtime)
+    response["Cache-Control"] = f"public, max-age={config['MAX_AGE']}"
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def is_upload_chunk(path):
+    """
+    Whether ``path`` is in the chunked uploads' ``TEMP_DIR``, which lives
+    under ``MEDIA_ROOT`` by default but holds unverified partial uploads.
+    """
+    return path.resolve().is_relative_to(get_upload_settings()["TEMP_DIR"].resolve())
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve a file under ``MEDIA_ROOT`` for deployments without a front proxy.
+    It is only routed with ``ENABLED`` on.
+
+    Responses carry an ETag, Last-Modified and a long ``Cache-Control`` so
+    revalidations end in a body-less 304, and single ``bytes`` ranges are
+    answered with 206. The body is a ``FileResponse``, which WSGI servers
+    hand to ``sendfile`` through ``wsgi.file_wrapper`` instead of copying it
+    through Python. With ``MODE = "accel"`` the file is left to nginx via
+    ``X-Accel-Redirect`` to ``ACCEL_REDIRECT_PREFIX`` + path, and nginx
+    handles ranges and validators itself. Upload chunks are never served.
+    """
+    config = get_media_serving_settings()
+    try:
+        fullpath = Path(safe_join(settings.MEDIA_ROOT, path))
+        stat = fullpath.stat()
+    except (OSError, ValueError, SuspiciousFileOperation):
+        raise Http404("File not found.")
+    if not fullpath.is_file() or is_upload_chunk(fullpath):
+        raise Http404("File not found.")
+
+    content_type = mimetypes.guess_type(fullpath.name)[0] or "application/octet-stream"
+    if config["MODE"] == "accel":
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = config["ACCEL_REDIRECT_PREFIX"].rstrip("/") + "/" + quote(path)
+        return response
+
+    etag = file_etag(stat)
+    if not_modified(request, etag, stat.st_mtime):
+        return validator_headers(HttpResponseNotModified(), etag, stat.st_mtime, config)
+
+    size = stat.st_size
+    byte_range = requested_range(request, size, etag, stat.st_mtime)
+    if byte_range is False:
+        response = HttpResponse(status=416, content_type=content_type)
+        response["Content-Range"] = f"bytes */{size}"
+        return validator_headers(response, etag, stat.st_mtime, config)
+    start, end = byte_range or (0, size - 1)
+    length = max(end - start + 1, 0)
+
+    if request.method == "HEAD":
+        response = HttpResponse(content_type=content_type)
+    else:
+        file = open(fullpath, "rb")
+        body = FileRange(file, start, length) if byte_range else file
+        response = FileResponse(body, content_type=content_type)
+        response.block_size = config["BLOCK_SIZE"]
+    response["Content-Length"] = length
+    if byte_range:
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return validator_headers(response, etag, stat.st_mtime, config)
@@ -0,0 +1,196 @@
+import bisect
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+DEFAULT_METRICS_SETTINGS = {
+    "ENABLED": True,
+    "SLOW_REQUEST_THRESHOLD_MS": None,
+    "DURATION_BUCKETS": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    "QUERY_COUNT_BUCKETS": (0, 1, 2, 5, 10, 20, 50, 100, 200),
+    "DB_DURATION_BUCKETS": (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+    "RESPONSE_SIZE_BUCKETS": (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+    "PUBLISH_INTERVAL_SECONDS": 5.0,
+    "WORKER_TTL_SECONDS": 24 * 3600,
+    "WORKERS_LOCK_SECONDS": 5,
+}
+
+WORKERS_KEY = "metrics:workers"
+WORKERS_LOCK_KEY = "metrics:workers:lock"
+
+
+def get_metrics_settings():
+    return {**DEFAULT_METRICS_SETTINGS, **getattr(settings, "REQUEST_METRICS", {})}
+
+
+class Histogram:
+    """
+    Fixed-size cumulative histogram with Prometheus bucket semantics.
+    """
+
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        running = 0
+        for bound, bucket_count in zip(self.bounds + ("+Inf",), self.counts):
+            running += bucket_count
+            yield bound, running
+
+
+def worker_key(pid):
+    return f"metrics:worker:{pid}"
+
+
+class MetricsRegistry:
+    """
+    Per-route request histograms, recorded in process and shared through
+    the cache.
+
+    Recording a request costs a dict lookup and four bisects under a lock.
+    At most every ``PUBLISH_INTERVAL_SECONDS`` a worker copies its totals to
+    the cache under its pid, and ``render`` reports every worker found there
+    with a ``worker`` label, so whichever worker answers a scrape shows them
+    all and each series only grows. Prometheus sums the workers at query
+    time. Workers share the totals only through a shared CACHES backend.
+    """
+
+    METRICS = (
+        ("http_request_duration_seconds", "DURATION_BUCKETS", "Wall time spent handling the request."),
+        ("http_request_db_queries", "QUERY_COUNT_BUCKETS", "Number of database queries per request."),
+        ("http_request_db_duration_seconds", "DB_DURATION_BUCKETS", "Time spent in database queries."),
+        ("http_response_size_bytes", "RESPONSE_SIZE_BUCKETS", "Size of the response body."),
+    )
+
+    def __init__(self, config=None):
+        self.config = config or get_metrics_settings()
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._responses = defaultdict(int)
+        self._published_at = 0.0
+
+    def _new_route(self):
+        return tuple(Histogram(self.config[buckets]) for _, buckets, _ in self.METRICS)
+
+    def observe(self, route, status_code, duration, queries, db_duration, size):
+        with self._lock:
+            histograms = self._routes.get(route)
+            if histograms is None:
+                histograms = self._routes[route] = self._new_route()
+            for histogram, value in zip(histograms, (duration, queries, db_duration, size)):
+                histogram.observe(value)
+            self._responses[(route, status_code)] += 1
+            due = time.monotonic() - self._published_at >= self.config["PUBLISH_INTERVAL_SECONDS"]
+            if due:
+                self._published_at = time.monotonic()
+        if due:
+            self.publish()
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._responses.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "routes": {route: tuple(_copy(h) for h in hs) for route, hs in self._routes.items()},
+                "responses": dict(self._responses),
+            }
+
+    def publish(self):
+        """
+        Store this worker's totals in the cache and make sure its pid is
+        listed among the workers.
+        """
+        pid = os.getpid()
+        cache.set(worker_key(pid), self.snapshot(), self.config["WORKER_TTL_SECONDS"])
+        if pid not in (cache.get(WORKERS_KEY) or set()):
+            self._update_workers(lambda workers: workers | {pid})
+
+    def worker_snapshots(self):
+        """
+        ``{pid: snapshot}`` of every worker in the cache, this one current.
+        """
+        self.publish()
+        workers = (cache.get(WORKERS_KEY) or set()) | {os.getpid()}
+        snapshots = cache.get_many([worker_key(pid) for pid in workers])
+        live = {pid: snapshots[worker_key(pid)] for pid in workers if worker_key(pid) in snapshots}
+        gone = workers.difference(live)
+        if gone:
+            self._update_workers(lambda workers: workers - gone)
+        return live
+
+    def _update_workers(self, update):
+        """
+        Replace the cached pid set with ``update(pids)`` while holding a
+        cache lock, so workers registering at the same time do not drop
+        each other. Gives up when the lock is taken; a worker that is not
+        listed yet tries again on its next publish.
+        """
+        if not cache.add(WORKERS_LOCK_KEY, os.getpid(), self.config["WORKERS_LOCK_SECONDS"]):
+            return False
+        try:
+            workers = cache.get(WORKERS_KEY) or set()
+            cache.set(WORKERS_KEY, update(workers), self.config["WORKER_TTL_SECONDS"])
+        finally:
+            cache.delete(WORKERS_LOCK_KEY)
+        return True
+
+    def render(self):
+        """
+        Render all series of all workers in the Prometheus text exposition
+        format.
+        """
+        snapshots = sorted(self.worker_snapshots().items())
+
+        lines = []
+        for index, (name, _, help_text) in enumerate(self.METRICS):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for pid, snapshot in snapshots:
+                routes = snapshot["routes"]
+                for route in sorted(routes):
+                    histogram = routes[route][index]
+                    labels = f'route="{_escape(route)}",worker="{pid}"'
+                    for bound, running in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {running}')
+                    lines.append(f"{name}_sum{{{labels}}} {histogram.total}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        lines.append("# HELP http_responses_total Responses by route and status code.")
+        lines.append("# TYPE http_responses_total counter")
+        for pid, snapshot in snapshots:
+            for (route, status_code), total in sorted(snapshot["responses"].items()):
+                labels = f'route="{_escape(route)}",status="{status_code}",worker="{pid}"'
+                lines.append(f"http_responses_total{{{labels}}} {total}")
+        return "\n".join(lines) + "\n"
+
+
+def _copy(histogram):
+    clone = Histogram(histogram.bounds)
+    clone.counts = list(histogram.counts)
+    clone.total = histogram.total
+    clone.count = histogram.count
+    return clone
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,122 @@
+import logging
+import time
+
+from django.db import connections
+
+from user.db import pin_to_primary
+from user.metrics import registry
+
+logger = logging.getLogger("user.metrics")
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that counts queries and their total duration.
+
+    SQL text is only kept when ``capture_sql`` is set, so the always-on path
+    does not retain any per-query strings.
+    """
+
+    def __init__(self, capture_sql=False):
+        self.count = 0
+        self.duration = 0.0
+        self.capture_sql = capture_sql
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if self.capture_sql:
+                self.statements.append((elapsed, sql))
+
+
+class RequestMetricsMiddleware:
+    """
+    Records wall time, query count, DB time and response size per route name.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        threshold = registry.config["SLOW_REQUEST_THRESHOLD_MS"]
+        self.enabled = registry.config["ENABLED"]
+        self.slow_threshold = threshold / 1000 if threshold is not None else None
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        recorder = QueryRecorder(capture_sql=self.slow_threshold is not None)
+        wrappers = [connections[alias].execute_wrapper(recorder) for alias in connections]
+        start = time.perf_counter()
+        try:
+            for wrapper in wrappers:
+                wrapper.__enter__()
+            response = self.get_response(request)
+        finally:
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+        duration = time.perf_counter() - start
+
+        route = self._route_name(request)
+        registry.observe(
+            route,
+            response.status_code,
+            duration,
+            recorder.count,
+            recorder.duration,
+            self._response_size(response),
+        )
+        if self.slow_threshold is not None and duration >= self.slow_threshold:
+            logger.warning(
+                "Slow request %s %s (%s) took %.1fms with %d queries (%.1fms in DB):\n%s",
+                request.method,
+                request.path,
+                route,
+                duration * 1000,
+                recorder.count,
+                recorder.duration * 1000,
+                "\n".join(f"[{elapsed * 1000:.1f}ms] {sql}" for elapsed, sql in recorder.statements),
+            )
+        return response
+
+    @staticmethod
+    def _route_name(request):
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return "<unresolved>"
+        return match.view_name or match._func_path
+
+    @staticmethod
+    def _response_size(response):
+        if response.streaming:
+            return 0
+        return len(response.content)
+
+
+class PrimaryPinningMiddleware:
+    """
+    Pins a user to the primary database for ``REPLICA_PIN_SECONDS`` after a
+    successful write, so they read their own writes despite replica lag.
+    """
+
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            request.method not in self.SAFE_METHODS
+            and response.status_code < 400
+            and not getattr(request, "skip_primary_pin", False)
+        ):
+            user = getattr(request, "user", None)
+            if user is not None and user.is_authenticated:
+                pin_to_primary(user)
+        return response
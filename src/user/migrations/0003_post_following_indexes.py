@@ -0,0 +1,54 @@
+# Generated by Django 4.2 on 2026-10-19 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build each index in its own transaction so the write lock on a large
+    # table is only held for one CREATE INDEX at a time.
+    atomic = False
+
+    dependencies = [
+        ("user", "0002_post_hashtag"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="post",
+            options={
+                "ordering": ["-created_at"],
+                "verbose_name": "post",
+                "verbose_name_plural": "posts",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["-created_at"], name="post_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["author", "-created_at"], name="post_author_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["is_published", "-created_at"],
+                name="post_published_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="userfollowing",
+            index=models.Index(
+                fields=["user_id", "-created"], name="following_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="userfollowing",
+            index=models.Index(
+                fields=["following_user_id", "-created"],
+                name="followers_user_created_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-19 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0005_user_soft_delete"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="impression_count",
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="view_count",
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
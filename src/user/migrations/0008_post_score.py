@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-19 14:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0007_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="engagement",
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="score",
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["-score", "-id"], name="post_score_idx"),
+        ),
+    ]
@@ -0,0 +1,141 @@
+# Generated by Django 4.2 on 2026-10-19 14:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0008_post_score"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedPost",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("content", models.TextField()),
+                (
+                    "image",
+                    models.ImageField(blank=True, null=True, upload_to="post_image"),
+                ),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+                ("is_published", models.BooleanField(default=False)),
+                ("view_count", models.PositiveBigIntegerField(default=0)),
+                ("impression_count", models.PositiveBigIntegerField(default=0)),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_posts",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "archived post",
+                "verbose_name_plural": "archived posts",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedPostLike",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="user.archivedpost",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedPostHashtag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "hashtag",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="user.hashtag",
+                    ),
+                ),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="user.archivedpost",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="archivedpost",
+            name="hashtag",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="archived_posts",
+                through="user.ArchivedPostHashtag",
+                to="user.hashtag",
+            ),
+        ),
+        migrations.AddField(
+            model_name="archivedpost",
+            name="likes",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="archived_likes",
+                through="user.ArchivedPostLike",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="archivedpostlike",
+            constraint=models.UniqueConstraint(
+                fields=("post", "user"), name="unique_archived_post_like"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="archivedposthashtag",
+            constraint=models.UniqueConstraint(
+                fields=("post", "hashtag"), name="unique_archived_post_hashtag"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedpost",
+            index=models.Index(
+                fields=["author", "-created_at"], name="archived_post_author_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 4.2 on 2026-10-19 15:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class AlterFieldWhenSharded(migrations.AlterField):
+    """
+    Drops the database constraint only when POST_SHARDS is set at migrate
+    time: sharded posts, their links and notifications point at rows in
+    other databases. Unsharded databases keep the constraints. Used inside
+    SeparateDatabaseAndState, so the model state, and user.models, keep
+    them either way.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if getattr(settings, "POST_SHARDS", ()):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if getattr(settings, "POST_SHARDS", ()):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0010_upload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HiddenAuthor",
+            fields=[
+                ("user_id", models.BigIntegerField(primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="IdSequence",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("value", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                AlterFieldWhenSharded(
+                    model_name="notification",
+                    name="post",
+                    field=models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="notifications",
+                        to="user.post",
+                    ),
+                ),
+                AlterFieldWhenSharded(
+                    model_name="post",
+                    name="author",
+                    field=models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                AlterFieldWhenSharded(
+                    model_name="post",
+                    name="hashtag",
+                    field=models.ManyToManyField(
+                        blank=True, db_constraint=False, related_name="posts", to="user.hashtag"
+                    ),
+                ),
+                AlterFieldWhenSharded(
+                    model_name="post",
+                    name="likes",
+                    field=models.ManyToManyField(
+                        blank=True,
+                        db_constraint=False,
+                        related_name="likes",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,54 @@
+import unicodedata
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def normalize(name, max_length):
+    # Same as user.hashtags.normalize_hashtag at the time of writing.
+    name = unicodedata.normalize("NFKC", name).strip().lstrip("#").casefold()
+    return name[:max_length]
+
+
+def normalize_hashtags(apps, schema_editor):
+    """
+    Rename hashtags created before names were normalized. Tags that now
+    share a name are merged into the oldest one, which takes over their
+    post links; tags left without a name are deleted with their links.
+    """
+    alias = schema_editor.connection.alias
+    Hashtag = apps.get_model("user", "Hashtag")
+    throughs = (apps.get_model("user", "Post").hashtag.through, apps.get_model("user", "ArchivedPostHashtag"))
+    max_length = Hashtag._meta.get_field("name").max_length
+
+    groups = defaultdict(list)
+    for pk, name in Hashtag.objects.using(alias).order_by("pk").values_list("pk", "name"):
+        groups[normalize(name, max_length)].append((pk, name))
+
+    for name, tags in groups.items():
+        if not name:
+            Hashtag.objects.using(alias).filter(pk__in=[pk for pk, _ in tags]).delete()
+            continue
+        (keep, current), merged = tags[0], [pk for pk, _ in tags[1:]]
+        if merged:
+            for Through in throughs:
+                links = Through.objects.using(alias).filter(hashtag_id__in=merged)
+                post_ids = set(links.values_list("post_id", flat=True))
+                Through.objects.using(alias).bulk_create(
+                    [Through(post_id=post_id, hashtag_id=keep) for post_id in post_ids], ignore_conflicts=True
+                )
+                links.delete()
+            Hashtag.objects.using(alias).filter(pk__in=merged).delete()
+        if current != name:
+            Hashtag.objects.using(alias).filter(pk=keep).update(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0011_post_sharding"),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_hashtags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-19 15:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0012_normalize_hashtags"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="notification",
+            options={
+                "ordering": ["-created_at", "-id"],
+                "verbose_name": "notification",
+                "verbose_name_plural": "notifications",
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name="notification",
+            name="notification_feed_idx",
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["recipient", "-created_at", "-id"], name="notification_feed_idx"
+            ),
+        ),
+    ]
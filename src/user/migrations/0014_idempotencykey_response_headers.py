@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-19 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0013_notification_created_order"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="idempotencykey",
+            name="response_headers",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
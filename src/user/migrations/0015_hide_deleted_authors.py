@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def hide_deleted_authors(apps, schema_editor):
+    """
+    Record accounts soft-deleted before posts were filtered through
+    ``HiddenAuthor`` in every database. Post shards have no users and
+    already list them.
+    """
+    alias = schema_editor.connection.alias
+    User, HiddenAuthor = apps.get_model("user", "User"), apps.get_model("user", "HiddenAuthor")
+    user_ids = User.objects.using(alias).filter(deleted_at__isnull=False).values_list("pk", flat=True)
+    HiddenAuthor.objects.using(alias).bulk_create(
+        [HiddenAuthor(user_id=user_id) for user_id in user_ids], ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0014_idempotencykey_response_headers"),
+    ]
+
+    operations = [
+        migrations.RunPython(hide_deleted_authors, migrations.RunPython.noop),
+    ]
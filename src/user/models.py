@@ -1,12 +1,16 @@
+import uuid
 from datetime import timezone, datetime
 
 from django.apps import apps
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils.translation import gettext as _
 
+from user.sharding import allocate_post_ids, is_sharded, post_shards, scatter, shard_for_author
+
 
 class UserManager(BaseUserManager):
     """
@@ -15,6 +19,9 @@ class UserManager(BaseUserManager):
 
     use_in_migrations = True
 
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
     def _create_user(self, email, password, **extra_fields):
         """
         Create and save a user with the given email, and password.
@@ -89,8 +96,11 @@ class User(AbstractUser):
     profile_image = models.ImageField(upload_to="profile_image", blank=True, null=True)
     birth_date = models.DateField(blank=True, null=True)
     location = models.CharField(max_length=255, blank=True, null=True)
+    unread_notification_count = models.PositiveIntegerField(default=0, editable=False)
+    deleted_at = models.DateTimeField(blank=True, null=True, editable=False)
 
     objects = UserManager()
+    all_objects = models.Manager()
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
@@ -98,11 +108,29 @@ class User(AbstractUser):
     class Meta:
         verbose_name = _("user")
         verbose_name_plural = _("users")
+        indexes = [
+            models.Index(
+                fields=["deleted_at"], condition=models.Q(deleted_at__isnull=False), name="user_pending_purge_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.email
 
 
+class UserFollowingManager(models.Manager):
+    """
+    Hides follow relationships of soft-deleted accounts on either side.
+    """
+
+    def get_queryset(self):
+        return (
+            super()
+            .get_queryset()
+            .filter(user_id__deleted_at__isnull=True, following_user_id__deleted_at__isnull=True)
+        )
+
+
 class UserFollowing(models.Model):
     """
     Model to represent user-to-user following relationships.
@@ -124,12 +152,18 @@ class UserFollowing(models.Model):
     )
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = UserFollowingManager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
                 fields=["user_id", "following_user_id"], name="unique_followers"
             )
         ]
+        indexes = [
+            models.Index(fields=["user_id", "-created"], name="following_user_created_idx"),
+            models.Index(fields=["following_user_id", "-created"], name="followers_user_created_idx"),
+        ]
 
         ordering = ["-created"]
 
@@ -137,11 +171,106 @@ class UserFollowing(models.Model):
         return f"{self.user_id} {self.following_user_id}"
 
 
+class PostManager(models.Manager):
+    """
+    Hides posts of soft-deleted authors until they are purged. Authors are
+    matched against the small ``HiddenAuthor`` table in the posts' own
+    database rather than by joining the user table.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().exclude(author_id__in=HiddenAuthor.objects.values("user_id"))
+
+
+class HiddenAuthor(models.Model):
+    """
+    Soft-deleted users waiting to be purged, kept in the default database
+    and on each post shard, where the user table cannot be joined.
+    """
+
+    user_id = models.BigIntegerField(primary_key=True)
+
+    def __str__(self):
+        return f"Hidden author {self.user_id}"
+
+
+class IdSequence(models.Model):
+    """
+    Named counters in the default database, used to hand out ids that are
+    unique across post shards.
+    """
+
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class ShardedPostQuerySet(models.QuerySet):
+    """
+    Post queries that pick their shard. Without sharding every method
+    behaves like the plain queryset on the default database.
+    """
+
+    def for_author(self, author_id):
+        queryset = self.filter(author_id=author_id)
+        return queryset.using(shard_for_author(author_id)) if is_sharded() else queryset
+
+    def locate(self, **lookups):
+        """
+        First post matching ``lookups``, looked up on every shard at once
+        when the shard is not known, or None.
+        """
+        queryset = self.filter(**lookups)
+        if queryset._db or not is_sharded():
+            return queryset.first()
+        found = scatter(lambda shard: shard.first(), [queryset.using(alias) for alias in post_shards()])
+        return next((post for post in found if post is not None), None)
+
+    def on_shards(self):
+        """
+        This queryset bound to each database holding posts, for updates and
+        deletes that have to reach all of them.
+        """
+        if self._db or not is_sharded():
+            return [self]
+        return [self.using(alias) for alias in post_shards()]
+
+    def create(self, **kwargs):
+        if self._db or not is_sharded():
+            return super().create(**kwargs)
+        author_id = kwargs["author"].pk if "author" in kwargs else kwargs["author_id"]
+        return self.using(shard_for_author(author_id)).create(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if self._db or not is_sharded():
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        new = [post for post in objs if post.pk is None]
+        for post, post_id in zip(new, allocate_post_ids(len(new))):
+            post.pk = post_id
+        by_shard = {}
+        for post in objs:
+            by_shard.setdefault(shard_for_author(post.author_id), []).append(post)
+        for alias, posts in by_shard.items():
+            self.using(alias).bulk_create(posts, *args, **kwargs)
+        return objs
+
+
+class ShardedPostManager(PostManager.from_queryset(ShardedPostQuerySet)):
+    """
+    ``PostManager`` with the shard-picking methods of ``ShardedPostQuerySet``.
+    """
+
+
 class Post(models.Model):
     """
     Model representing a user-created post with content, image, and hashtags.
     """
 
+    # With sharded posts, migration 0011 leaves these relations and
+    # Notification.post without database constraints; see user.sharding.
     author = models.ForeignKey("User", on_delete=models.CASCADE)
     content = models.TextField()
     image = models.ImageField(upload_to="post_image", blank=True, null=True)
@@ -154,14 +283,89 @@ class Post(models.Model):
     )
     is_published = models.BooleanField(default=False)
     hashtag = models.ManyToManyField("Hashtag", blank=True, related_name="posts")
+    # Written in batches by user.counters, so they lag by up to one flush interval.
+    view_count = models.PositiveBigIntegerField(default=0, editable=False)
+    impression_count = models.PositiveBigIntegerField(default=0, editable=False)
+    # Maintained by user.ranking: engagement points and their time-decayed score.
+    engagement = models.FloatField(default=0, editable=False)
+    score = models.FloatField(default=0, editable=False)
+
+    objects = ShardedPostManager()
 
     class Meta:
         verbose_name = _("post")
         verbose_name_plural = _("posts")
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["-created_at"], name="post_created_idx"),
+            models.Index(fields=["author", "-created_at"], name="post_author_created_idx"),
+            models.Index(fields=["is_published", "-created_at"], name="post_published_created_idx"),
+            models.Index(fields=["-score", "-id"], name="post_score_idx"),
+        ]
 
     def __str__(self):
         return f"Post {self.id}"
 
+    def save(self, *args, **kwargs):
+        if self.pk is None and is_sharded():
+            self.pk = allocate_post_ids(1)[0]
+            kwargs["force_insert"] = True
+        super().save(*args, **kwargs)
+
+
+class ArchivedPost(models.Model):
+    """
+    A post moved out of the hot ``Post`` table by ``archive_posts``. It keeps
+    the original id, so ids already handed to clients stay valid, and
+    mirrors the field names of ``Post`` so the same filters apply to both.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    author = models.ForeignKey("User", related_name="archived_posts", on_delete=models.CASCADE)
+    content = models.TextField()
+    image = models.ImageField(upload_to="post_image", blank=True, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    likes = models.ManyToManyField("User", through="ArchivedPostLike", related_name="archived_likes", blank=True)
+    is_published = models.BooleanField(default=False)
+    hashtag = models.ManyToManyField("Hashtag", through="ArchivedPostHashtag", related_name="archived_posts", blank=True)
+    view_count = models.PositiveBigIntegerField(default=0)
+    impression_count = models.PositiveBigIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = PostManager()
+
+    class Meta:
+        verbose_name = _("archived post")
+        verbose_name_plural = _("archived posts")
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["author", "-created_at"], name="archived_post_author_idx"),
+        ]
+
+    def __str__(self):
+        return f"Archived post {self.id}"
+
+
+class ArchivedPostLike(models.Model):
+    post = models.ForeignKey("ArchivedPost", on_delete=models.CASCADE)
+    user = models.ForeignKey("User", related_name="+", on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["post", "user"], name="unique_archived_post_like"),
+        ]
+
+
+class ArchivedPostHashtag(models.Model):
+    post = models.ForeignKey("ArchivedPost", on_delete=models.CASCADE)
+    hashtag = models.ForeignKey("Hashtag", related_name="+", on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["post", "hashtag"], name="unique_archived_post_hashtag"),
+        ]
+
 
 class Hashtag(models.Model):
     """
@@ -176,3 +380,109 @@ class Hashtag(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class Notification(models.Model):
+    """
+    Aggregated notification: all events of one kind for one recipient and
+    target within a time bucket share a single row.
+    """
+
+    class Kind(models.TextChoices):
+        FOLLOW = "follow", _("follow")
+        LIKE = "like", _("like")
+
+    recipient = models.ForeignKey("User", related_name="notifications", on_delete=models.CASCADE)
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    post = models.ForeignKey("Post", related_name="notifications", on_delete=models.CASCADE, null=True, blank=True)
+    bucket = models.DateTimeField()
+    last_actor = models.ForeignKey("User", related_name="+", on_delete=models.SET_NULL, null=True, blank=True)
+    actor_count = models.PositiveIntegerField(default=1)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("notification")
+        verbose_name_plural = _("notifications")
+        ordering = ["-created_at", "-id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipient", "kind", "post", "bucket"],
+                condition=models.Q(post__isnull=False),
+                name="unique_post_notification_bucket",
+            ),
+            models.UniqueConstraint(
+                fields=["recipient", "kind", "bucket"],
+                condition=models.Q(post__isnull=True),
+                name="unique_user_notification_bucket",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["recipient", "-created_at", "-id"], name="notification_feed_idx"),
+            models.Index(
+                fields=["recipient"], condition=models.Q(is_read=False), name="notification_unread_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} x{self.actor_count} for {self.recipient_id}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Outcome of a write made with an ``Idempotency-Key`` header, replayed when
+    the client retries with the same key with the headers the view set,
+    such as ``Location``. ``status_code`` is empty while the first request
+    is still in flight.
+    """
+
+    user = models.ForeignKey("User", related_name="+", on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    response = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    response_headers = models.JSONField(blank=True, default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="unique_idempotency_key"),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="idempotency_expires_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} for {self.user_id}"
+
+
+class Upload(models.Model):
+    """
+    A file sent in chunks through ``/uploads/``. Chunks are kept on disk
+    until the upload is completed; ``file`` then holds the assembled file
+    until a post or profile attaches it.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey("User", related_name="uploads", on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    checksum = models.CharField(max_length=64, blank=True, help_text=_("SHA-256 of the whole file, hex encoded"))
+    file = models.FileField(upload_to="uploads", blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"], name="upload_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.id})"
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
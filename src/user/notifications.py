@@ -0,0 +1,93 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from user.events import hub, user_channel
+from user.models import Notification
+
+
+def notification_bucket(moment=None):
+    """
+    Floor ``moment`` to the start of its ``NOTIFICATION_BUCKET_SECONDS`` window.
+    """
+    moment = moment or timezone.now()
+    size = settings.NOTIFICATION_BUCKET_SECONDS
+    return datetime.fromtimestamp(int(moment.timestamp()) // size * size, tz=dt_timezone.utc)
+
+
+def notify(recipient, actor, kind, post=None):
+    """
+    Record that ``actor`` did ``kind`` to ``recipient`` (optionally on ``post``).
+
+    Events are coalesced into one row per (recipient, kind, post, bucket):
+    repeated events bump ``actor_count`` with a single UPDATE, and only the
+    first event of a bucket inserts. The recipient's unread counter moves
+    only when a row becomes unread, so reading it stays O(1).
+    """
+    if recipient.pk == actor.pk:
+        return
+    key = {"recipient": recipient, "kind": kind, "post": post, "bucket": notification_bucket()}
+    changes = {"actor_count": F("actor_count") + 1, "last_actor": actor, "updated_at": timezone.now()}
+
+    with transaction.atomic():
+        _publish(recipient, actor, kind, post)
+        if Notification.objects.filter(**key, is_read=False).update(**changes):
+            return
+        if not Notification.objects.filter(**key, is_read=True).update(**changes, is_read=False):
+            try:
+                with transaction.atomic():
+                    Notification.objects.create(**key, last_actor=actor)
+            except IntegrityError:
+                # A concurrent request created the row first; fold into it.
+                if Notification.objects.filter(**key, is_read=False).update(**changes):
+                    return
+                Notification.objects.filter(**key).update(**changes, is_read=False)
+        type(recipient).objects.filter(pk=recipient.pk).update(
+            unread_notification_count=F("unread_notification_count") + 1
+        )
+
+
+def retract(recipient, actor, kind, post=None, moment=None):
+    """
+    Undo a ``notify()`` call made at ``moment``, such as a follow that was
+    withdrawn. The row loses one actor, or is removed when that was its
+    only one; a removed unread row leaves the recipient's unread counter.
+    """
+    if recipient.pk == actor.pk:
+        return
+    key = {"recipient": recipient, "kind": kind, "post": post, "bucket": notification_bucket(moment)}
+
+    with transaction.atomic():
+        if Notification.objects.filter(**key, actor_count__gt=1).update(
+            actor_count=F("actor_count") - 1, updated_at=timezone.now()
+        ):
+            Notification.objects.filter(**key, last_actor=actor).update(last_actor=None)
+            return
+        unread = Notification.objects.filter(**key, is_read=False).delete()[0]
+        Notification.objects.filter(**key).delete()
+        if unread:
+            type(recipient).objects.filter(pk=recipient.pk, unread_notification_count__gt=0).update(
+                unread_notification_count=F("unread_notification_count") - 1
+            )
+
+
+def _publish(recipient, actor, kind, post):
+    hub.publish_on_commit(
+        user_channel(recipient.pk),
+        "notification",
+        {"kind": kind, "post": post.pk if post else None, "actor": actor.pk},
+    )
+
+
+def mark_all_read(recipient):
+    """
+    Mark every unread notification of ``recipient`` as read with one UPDATE
+    over the partial unread index and reset the counter.
+    """
+    with transaction.atomic():
+        updated = Notification.objects.filter(recipient=recipient, is_read=False).update(is_read=True)
+        type(recipient).objects.filter(pk=recipient.pk).update(unread_notification_count=0)
+    return updated
@@ -0,0 +1,242 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Case, Count, DurationField, ExpressionWrapper, F, FloatField, IntegerField, OuterRef, Q
+from django.db.models import Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce, Power
+from django.utils import timezone
+
+from user.caching import cached
+from user.db import retry_on_busy
+from user.models import Post, UserFollowing
+from user.sharding import post_databases, scatter_rows, shard_for_author
+
+DEFAULT_RANKING_SETTINGS = {
+    "BASE_SCORE": 1.0,
+    "LIKE_WEIGHT": 1.0,
+    "FOLLOWER_WEIGHT": 0.1,
+    "HALF_LIFE_HOURS": 24.0,
+    "HORIZON_DAYS": 14,
+    "AFFINITY_BOOST": 1.5,
+    "CANDIDATE_FACTOR": 3,
+    "TOP_K": 50,
+    "MAX_TOP_K": 200,
+    "BATCH_SIZE": 1000,
+    "CACHE_SECONDS": 30,
+}
+
+
+def get_ranking_settings():
+    return {**DEFAULT_RANKING_SETTINGS, **getattr(settings, "RANKING", {})}
+
+
+def decay_factor(created_at, now=None, config=None):
+    """
+    Exponential time decay: 1 for a new post, halving every
+    ``HALF_LIFE_HOURS``, 0 past ``HORIZON_DAYS``.
+    """
+    config = config or get_ranking_settings()
+    age = (now or timezone.now()) - created_at
+    if age > timedelta(days=config["HORIZON_DAYS"]):
+        return 0.0
+    return 0.5 ** (max(age.total_seconds(), 0) / 3600 / config["HALF_LIFE_HOURS"])
+
+
+def on_publish(post):
+    """
+    Seed a new post's engagement with the base score plus its author's
+    follower count.
+    """
+    config = get_ranking_settings()
+    followers = UserFollowing.objects.filter(following_user_id=post.author_id).count()
+    engagement = config["BASE_SCORE"] + config["FOLLOWER_WEIGHT"] * followers
+    Post._base_manager.using(post._state.db).filter(pk=post.pk).update(engagement=engagement, score=engagement)
+
+
+def on_like(post, delta=1):
+    config = get_ranking_settings()
+    points = delta * config["LIKE_WEIGHT"]
+    Post._base_manager.using(post._state.db).filter(pk=post.pk).update(
+        engagement=F("engagement") + points,
+        score=F("score") + points * decay_factor(post.created_at, config=config),
+    )
+
+
+def on_follow(author_id, delta=1):
+    """
+    Credit (or debit) a follow to the author's posts that are still inside
+    the ranking horizon. Each post's current decay is ``score / engagement``,
+    so the follow weight is scaled in SQL without reading the rows.
+    """
+    config = get_ranking_settings()
+    points = delta * config["FOLLOWER_WEIGHT"]
+    Post._base_manager.using(shard_for_author(author_id)).filter(
+        author_id=author_id,
+        created_at__gte=timezone.now() - timedelta(days=config["HORIZON_DAYS"]),
+        engagement__gt=0,
+    ).update(
+        score=F("score") + points * F("score") / F("engagement"),
+        engagement=F("engagement") + points,
+    )
+
+
+def on_likes_removed(alias, post_ids):
+    """
+    Take one like off each of ``post_ids`` in ``alias`` with a single
+    UPDATE, for likes deleted in bulk such as a purged account's. The decay
+    is scaled as in ``on_follow()``.
+    """
+    points = get_ranking_settings()["LIKE_WEIGHT"]
+    Post._base_manager.using(alias).filter(pk__in=post_ids, engagement__gt=0).update(
+        score=F("score") - points * F("score") / F("engagement"),
+        engagement=F("engagement") - points,
+    )
+
+
+def ranked_candidates(queryset, limit, config):
+    """
+    ``(id, author_id, score)`` of the top scored posts, merged across post
+    shards when ``queryset`` is not pinned to one.
+    """
+    rows = scatter_rows(
+        queryset.filter(score__gt=0).order_by("-score", "-id").values("id", "author_id", "score"), ("-score", "-id")
+    )
+    return [(row["id"], row["author_id"], row["score"]) for row in rows[: limit * config["CANDIDATE_FACTOR"]]]
+
+
+def candidates_cache_key(limit):
+    return f"ranked-posts:{limit}"
+
+
+def cached_candidates(limit, config=None):
+    """
+    Candidates of the unfiltered listing, shared by every viewer and
+    refreshed at most once per ``CACHE_SECONDS`` across workers.
+    """
+    config = config or get_ranking_settings()
+    return cached(
+        candidates_cache_key(limit),
+        lambda: ranked_candidates(Post.objects.all(), limit, config),
+        config["CACHE_SECONDS"],
+    )
+
+
+def ranked_post_ids(queryset, user, limit=None, use_cache=False):
+    """
+    Return up to ``limit`` post ids by score. Candidates come from the score
+    index, or from the shared cache with ``use_cache`` when ``queryset`` is
+    the unfiltered listing; posts by authors ``user`` follows are boosted by
+    ``AFFINITY_BOOST`` before the final cut.
+    """
+    config = get_ranking_settings()
+    limit = min(limit or config["TOP_K"], config["MAX_TOP_K"])
+    if use_cache:
+        candidates = list(cached_candidates(limit, config))
+    else:
+        candidates = ranked_candidates(queryset, limit, config)
+    followed = set()
+    if user.is_authenticated and candidates:
+        followed = set(
+            UserFollowing.objects.filter(
+                user_id=user, following_user_id__in={author_id for _, author_id, _ in candidates}
+            ).values_list("following_user_id", flat=True)
+        )
+    boost = config["AFFINITY_BOOST"]
+    candidates.sort(key=lambda row: (row[2] * (boost if row[1] in followed else 1), row[0]), reverse=True)
+    return [post_id for post_id, _, _ in candidates[:limit]]
+
+
+def decay_scores(now=None, config=None):
+    """
+    Recompute ``score = engagement * decay`` for every post in the horizon,
+    and zero the posts that fell out of it, with one UPDATE per database.
+
+    The decay is computed in SQL from each post's age, the same curve as
+    ``decay_factor()``, so no post is read into Python. Returns the number
+    of posts updated.
+    """
+    config = config or get_ranking_settings()
+    now = now or timezone.now()
+    horizon = now - timedelta(days=config["HORIZON_DAYS"])
+    # The backend stores durations as microseconds.
+    age_hours = Cast(ExpressionWrapper(Value(now) - F("created_at"), output_field=DurationField()), FloatField()) / (
+        3600 * 10**6
+    )
+    score = Case(
+        When(created_at__lt=horizon, then=Value(0.0)),
+        When(created_at__gt=now, then=F("engagement")),
+        default=F("engagement") * Power(Value(0.5), age_hours / config["HALF_LIFE_HOURS"]),
+        output_field=FloatField(),
+    )
+    updated = 0
+    for alias in post_databases():
+        update = retry_on_busy(lambda queryset, **changes: queryset.update(**changes), using=alias)
+        posts = Post._base_manager.using(alias).filter(Q(created_at__gte=horizon) | Q(score__gt=0))
+        updated += update(posts, score=score)
+    return updated
+
+
+def rebuild_engagement(config=None):
+    """
+    Recompute ``engagement`` from like and follower counts for posts in the
+    horizon, in id batches. Use it to backfill scores, and after bulk changes
+    that skip the incremental hooks, such as account purges.
+    """
+    config = config or get_ranking_settings()
+    horizon = timezone.now() - timedelta(days=config["HORIZON_DAYS"])
+    likes = (
+        Post.likes.through.objects.filter(post_id=OuterRef("pk"))
+        .order_by()
+        .values("post_id")
+        .annotate(total=Count("*"))
+        .values("total")
+    )
+    base = Value(config["BASE_SCORE"]) + config["LIKE_WEIGHT"] * Coalesce(Subquery(likes), 0)
+
+    rebuilt = 0
+    for alias in post_databases():
+        update = retry_on_busy(
+            lambda ids, followers: Post._base_manager.using(alias)
+            .filter(pk__in=ids)
+            .update(engagement=base + config["FOLLOWER_WEIGHT"] * followers),
+            using=alias,
+        )
+        posts = Post._base_manager.using(alias).filter(created_at__gte=horizon).order_by("pk")
+        last_id = 0
+        while rows := list(posts.filter(pk__gt=last_id).values_list("pk", "author_id")[: config["BATCH_SIZE"]]):
+            ids = [post_id for post_id, _ in rows]
+            rebuilt += update(ids, author_followers(alias, {author_id for _, author_id in rows}))
+            last_id = ids[-1]
+    return rebuilt
+
+
+def author_followers(alias, author_ids):
+    """
+    Follower count of each post's author as an expression for posts in
+    ``alias``: a subquery in the default database, and on a post shard,
+    where follows are not stored, a CASE over counts read from the default
+    database, one WHEN per distinct count.
+    """
+    if alias == DEFAULT_DB_ALIAS:
+        followers = (
+            UserFollowing.objects.filter(following_user_id=OuterRef("author_id"))
+            .order_by()
+            .values("following_user_id")
+            .annotate(total=Count("*"))
+            .values("total")
+        )
+        return Coalesce(Subquery(followers), 0)
+    counts = (
+        UserFollowing.objects.filter(following_user_id__in=author_ids)
+        .order_by()
+        .values("following_user_id")
+        .annotate(total=Count("*"))
+        .values_list("following_user_id", "total")
+    )
+    authors_by_count = defaultdict(list)
+    for author_id, total in counts:
+        authors_by_count[total].append(author_id)
+    whens = [When(author_id__in=authors, then=Value(total)) for total, authors in authors_by_count.items()]
+    return Case(*whens, default=Value(0), output_field=IntegerField()) if whens else Value(0)
@@ -0,0 +1,96 @@
+import gzip
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.views import SpectacularAPIView
+
+from user.compression import accepts_gzip
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_RENDERERS = {"yaml": OpenApiYamlRenderer, "json": OpenApiJsonRenderer}
+
+
+def schema_file_path(schema_format, version=None):
+    version = version or settings.SPECTACULAR_SETTINGS["VERSION"]
+    return Path(settings.OPENAPI_SCHEMA_DIR) / f"openapi-{version}.{schema_format}"
+
+
+def render_schema(schema, schema_format):
+    return SCHEMA_RENDERERS[schema_format]().render(schema, renderer_context={})
+
+
+def generate_schema(request=None):
+    return SchemaGenerator().get_schema(request=request, public=True)
+
+
+class SchemaDocument:
+    """
+    A rendered schema held in memory together with its gzip encoding and
+    ETag, so serving it costs no generation, rendering or compression.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+        self.etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+_documents = {}
+_documents_lock = threading.Lock()
+
+
+def get_schema_document(schema_format, request=None):
+    """
+    Return the in-memory document for ``schema_format``, loading it from the
+    file written by ``build_openapi_schema``. If the file is missing the
+    schema is generated once and kept for the lifetime of the process.
+    """
+    document = _documents.get(schema_format)
+    if document is not None:
+        return document
+    with _documents_lock:
+        if schema_format not in _documents:
+            path = schema_file_path(schema_format)
+            if path.exists():
+                content = path.read_bytes()
+            else:
+                logger.warning("%s not found, generating the schema at runtime; run build_openapi_schema", path)
+                content = render_schema(generate_schema(request), schema_format)
+            _documents[schema_format] = SchemaDocument(content)
+        return _documents[schema_format]
+
+
+class PrecomputedSchemaView(SpectacularAPIView):
+    """
+    Serves the schema built by ``build_openapi_schema`` from memory with
+    ETag revalidation and a precompressed gzip body. With
+    ``OPENAPI_SCHEMA_LIVE`` on the schema is generated on every request, as
+    before.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if settings.OPENAPI_SCHEMA_LIVE:
+            return super().get(request, *args, **kwargs)
+
+        renderer = request.accepted_renderer
+        document = get_schema_document(renderer.format, request)
+        if document.etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        elif accepts_gzip(request):
+            response = HttpResponse(document.gzipped, content_type=renderer.media_type)
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(document.content, content_type=renderer.media_type)
+        response["ETag"] = document.etag
+        response["Cache-Control"] = "public, max-age=300"
+        patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+        return response
@@ -1,8 +1,118 @@
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files import File
+from django.core.validators import validate_image_file_extension
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch, Value
+from django.utils import timezone
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-from user.models import UserFollowing, Post, Hashtag
+from user.archive import ARCHIVED_RELATIONS
+from user.hashtags import extract_hashtags, get_or_create_hashtags, normalize_hashtag
+from user.models import UserFollowing, Post, Hashtag, HiddenAuthor, Notification, Upload
+from user.sharding import ShardedRows, is_sharded, post_shards, scatter_rows
+from user.uploads import get_upload_settings, received_chunks
+
+
+def parse_field_list(value):
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    Limits output to the fields named in ``?fields=`` and renders relations
+    in ``expandable_fields`` as primary keys unless named in ``?expand=``.
+    Without the parameters the serializer output is unchanged.
+    """
+
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None:
+            return
+        fields, expanded = self.get_output_fields(request)
+        for name in set(self.fields) - set(fields):
+            self.fields.pop(name)
+        for name, collapsed_field in self.expandable_fields.items():
+            if name in self.fields and name not in expanded:
+                self.fields[name] = collapsed_field()
+
+    @classmethod
+    def get_output_fields(cls, request):
+        """
+        Return the requested field names in ``Meta.fields`` order and the
+        subset of them that should be rendered expanded.
+        """
+        params = {} if request is None else getattr(request, "query_params", request.GET)
+        requested = parse_field_list(params.get("fields"))
+        expanded = parse_field_list(params.get("expand"))
+        fields = [name for name in cls.Meta.fields if requested is None or name in requested]
+        if expanded is None:
+            expanded = set(cls.expandable_fields)
+        return fields, expanded.intersection(fields)
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, request):
+        """
+        Load only the columns backing the requested fields.
+        """
+        fields, _ = cls.get_output_fields(request)
+        concrete = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        return queryset.only(*[name for name in fields if name in concrete])
+
+
+class UploadField(serializers.PrimaryKeyRelatedField):
+    """
+    Write-only id of a completed ``Upload`` owned by the requesting user.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("write_only", True)
+        kwargs.setdefault("required", False)
+        super().__init__(queryset=Upload.objects.filter(completed_at__isnull=False), **kwargs)
+
+    def get_queryset(self):
+        request = self.context.get("request")
+        if request is None or not request.user.is_authenticated:
+            return Upload.objects.none()
+        return super().get_queryset().filter(owner=request.user)
+
+
+class UploadAttachmentMixin:
+    """
+    Accepts the id of a finished chunked upload in place of a multipart
+    file: ``upload_fields`` maps each ``UploadField`` to the file field it
+    fills. The upload record is consumed once the instance is saved.
+    """
+
+    upload_fields = {}
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        self._attached_uploads = []
+        for upload_field, file_field in self.upload_fields.items():
+            upload = attrs.pop(upload_field, None)
+            if upload is None:
+                continue
+            if attrs.get(file_field):
+                raise serializers.ValidationError({upload_field: f"Send either {file_field} or {upload_field}."})
+            attrs[file_field] = upload.file.name
+            self._attached_uploads.append(upload.pk)
+        return attrs
+
+    def save(self, **kwargs):
+        instance = super().save(**kwargs)
+        if self._attached_uploads:
+            Upload.objects.filter(pk__in=self._attached_uploads).delete()
+        return instance
 
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -54,7 +164,7 @@ class UserSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class UserListSerializer(serializers.ModelSerializer):
+class UserListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = (
@@ -64,7 +174,11 @@ class UserListSerializer(serializers.ModelSerializer):
         )
 
 
-class UserUpdateSerializer(serializers.ModelSerializer):
+class UserUpdateSerializer(UploadAttachmentMixin, serializers.ModelSerializer):
+    profile_image_upload = UploadField(help_text="Id of a completed upload to use as profile_image")
+
+    upload_fields = {"profile_image_upload": "profile_image"}
+
     class Meta:
         model = get_user_model()
         fields = (
@@ -72,6 +186,7 @@ class UserUpdateSerializer(serializers.ModelSerializer):
             "phone_number",
             "bio",
             "profile_image",
+            "profile_image_upload",
             "location",
         )
 
@@ -80,13 +195,14 @@ class UserDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = (
+            "id",
             "email",
             "username",
             "profile_image",
             "location",
             "phone_number",
             "bio",
-            "profile_picture",
+            "birth_date",
         )
 
 
@@ -145,10 +261,15 @@ class HashtagSerializer(serializers.ModelSerializer):
         extra_kwargs = {"name": {"validators": []}}
 
 
-class PostListSerializer(serializers.ModelSerializer):
+class PostListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     author = UserShortsSerializer(read_only=True)
     hashtag = HashtagSerializer(read_only=True, many=True)
 
+    expandable_fields = {
+        "author": lambda: serializers.PrimaryKeyRelatedField(read_only=True),
+        "hashtag": lambda: serializers.PrimaryKeyRelatedField(read_only=True, many=True),
+    }
+
     class Meta:
         model = Post
         fields = (
@@ -159,41 +280,345 @@ class PostListSerializer(serializers.ModelSerializer):
             "updated_at",
             "likes",
             "hashtag",
+            "view_count",
+            "impression_count",
         )
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, request):
+        fields, expanded = cls.get_output_fields(request)
+        columns = [name for name in fields if name in PostListFastSerializer.COLUMNS]
+        if "author" in expanded:
+            queryset = queryset.select_related("author")
+            columns += ["author__id", "author__email", "author__username"]
+        elif "author" in fields:
+            columns.append("author")
+        if "likes" in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch("likes", queryset=get_user_model().objects.only("id").order_by("id"))
+            )
+        if "hashtag" in fields:
+            queryset = queryset.prefetch_related(Prefetch("hashtag", queryset=Hashtag.objects.order_by("id")))
+        return queryset.only(*columns)
+
+
+class PostListFastSerializer:
+    """
+    Read-only equivalent of ``PostListSerializer`` for list endpoints.
+
+    Posts are read with ``values()`` and each relation with one batched
+    query, then rendered to plain dicts with the same keys and value formats
+    as ``PostListSerializer``, without per-row DRF field objects.
+    """
+
+    COLUMNS = ("content", "image", "created_at", "updated_at", "view_count", "impression_count")
+    BATCH_SIZE = 500
+
+    def __init__(self, request, fields=None, expanded=None):
+        self.request = request
+        self.fields, self.expanded = PostListSerializer.get_output_fields(request)
+        if fields is not None:
+            self.fields = list(fields)
+        if expanded is not None:
+            self.expanded = set(expanded).intersection(self.fields)
+
+    def get_rows(self, queryset):
+        """
+        Rows of ``queryset``, merged in ``-created_at`` order across post
+        shards unless it is pinned to one database.
+        """
+        columns = ["id"] + [name for name in self.fields if name in self.COLUMNS]
+        if is_sharded() and "created_at" not in columns:
+            columns.append("created_at")
+        if "author" in self.fields:
+            columns.append("author_id")
+        return scatter_rows(queryset.select_related(None).prefetch_related(None).values(*columns))
+
+    def get_rows_with_archive(self, queryset, archived_queryset):
+        """
+        Rows of ``queryset`` followed in ``-created_at`` order by the
+        matching ``ArchivedPost`` rows, read with one UNION ALL query, or
+        with sharded posts one query per shard plus one for the archive.
+        Archived rows are flagged so their relations come from the archive.
+        """
+        columns = ["id", "created_at"] + [name for name in self.fields if name in self.COLUMNS and name != "created_at"]
+        if "author" in self.fields:
+            columns.append("author_id")
+        hot = queryset.select_related(None).prefetch_related(None).order_by().values(*columns)
+        cold = archived_queryset.order_by().values(*columns)
+        if is_sharded():
+            hot_querysets = [hot] if hot._db else [hot.using(alias) for alias in post_shards()]
+            return ShardedRows(
+                [queryset.annotate(archived=Value(False)) for queryset in hot_querysets]
+                + [cold.annotate(archived=Value(True))]
+            )
+        return (
+            hot.annotate(archived=Value(False))
+            .union(cold.annotate(archived=Value(True)), all=True)
+            .order_by("-created_at", "-id")
+        )
 
-class PostCreateUpdateSerializer(serializers.ModelSerializer):
-    hashtag = HashtagSerializer(many=True)
+    def to_representation(self, rows):
+        rows = list(rows)
+        post_ids = [row["id"] for row in rows if not row.get("archived")]
+        archived_ids = [row["id"] for row in rows if row.get("archived")]
+        relations = {}
+        if "author" in self.expanded:
+            relations["author"] = self._authors({row["author_id"] for row in rows})
+        if "likes" in self.fields:
+            relations["likes"] = self._related("likes", post_ids, archived_ids, "user_id")
+        if "hashtag" in self.fields:
+            if "hashtag" in self.expanded:
+                tags = self._related("hashtag", post_ids, archived_ids, "hashtag__name", order_by="hashtag_id")
+                relations["hashtag"] = {post_id: [{"name": name} for name in names] for post_id, names in tags.items()}
+            else:
+                relations["hashtag"] = self._related("hashtag", post_ids, archived_ids, "hashtag_id")
+
+        writers = [(name, self._writer(name, relations)) for name in self.fields]
+        return [{name: write(row) for name, write in writers} for row in rows]
+
+    def _writer(self, name, relations):
+        if name == "author":
+            authors = relations.get("author")
+            if authors is None:
+                return lambda row: row["author_id"]
+            return lambda row: authors[row["author_id"]]
+        if name in ("likes", "hashtag"):
+            grouped = relations[name]
+            return lambda row: grouped.get(row["id"], [])
+        if name == "image":
+            return self._image_url
+        if name in ("created_at", "updated_at"):
+            current_timezone = timezone.get_current_timezone()
+            return lambda row: self._datetime(row[name], current_timezone)
+        return lambda row: row[name]
+
+    def _image_url(self, row):
+        if not row["image"]:
+            return None
+        url = Post._meta.get_field("image").storage.url(row["image"])
+        if self.request is not None:
+            return self.request.build_absolute_uri(url)
+        return url
+
+    @staticmethod
+    def _datetime(value, current_timezone):
+        value = value.astimezone(current_timezone).isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+
+    def _authors(self, author_ids):
+        authors = {}
+        author_ids = list(author_ids)
+        for start in range(0, len(author_ids), self.BATCH_SIZE):
+            batch = author_ids[start : start + self.BATCH_SIZE]
+            for author in get_user_model().objects.filter(id__in=batch).values("id", "email", "username"):
+                authors[author["id"]] = author
+        return authors
+
+    def _related(self, name, post_ids, archived_ids, column, order_by=None):
+        through, archived_through, _ = ARCHIVED_RELATIONS[name]
+        # Links live with their post, so with sharded posts each shard is
+        # asked for its own.
+        querysets = [through.objects.using(alias) for alias in post_shards()] or [through.objects.all()]
+        archived_queryset = archived_through.objects.all()
+        if name == "likes":
+            # Likes of soft-deleted users are hidden, as in PostListSerializer.
+            # Shards have no user rows, so they exclude HiddenAuthor ids.
+            if is_sharded():
+                querysets = [
+                    queryset.exclude(user_id__in=HiddenAuthor.objects.using(queryset.db).values("user_id"))
+                    for queryset in querysets
+                ]
+            else:
+                querysets = [queryset.filter(user__deleted_at__isnull=True) for queryset in querysets]
+            archived_queryset = archived_queryset.filter(user__deleted_at__isnull=True)
+        grouped = defaultdict(list)
+        for queryset in querysets:
+            grouped.update(self._grouped(queryset, post_ids, column, order_by))
+        if archived_ids:
+            grouped.update(self._grouped(archived_queryset, archived_ids, column, order_by))
+        return grouped
+
+    def _grouped(self, queryset, post_ids, column, order_by=None):
+        grouped = defaultdict(list)
+        for start in range(0, len(post_ids), self.BATCH_SIZE):
+            batch = post_ids[start : start + self.BATCH_SIZE]
+            pairs = queryset.filter(post_id__in=batch).order_by(order_by or column).values_list("post_id", column)
+            for post_id, value in pairs:
+                grouped[post_id].append(value)
+        return grouped
+
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    """
+    Profile screen payload. Expects a user annotated by
+    ``user.summary.annotate_summary`` and the rendered latest posts in
+    ``context["posts"]``. Any user can read it, so only public profile
+    fields are included.
+    """
+
+    followers_count = serializers.IntegerField(read_only=True)
+    following_count = serializers.IntegerField(read_only=True)
+    posts_count = serializers.IntegerField(read_only=True)
+    is_following = serializers.BooleanField(read_only=True)
+    posts = serializers.SerializerMethodField()
+
+    class Meta:
+        model = get_user_model()
+        fields = (
+            "id",
+            "username",
+            "profile_image",
+            "location",
+            "bio",
+            "followers_count",
+            "following_count",
+            "posts_count",
+            "is_following",
+            "posts",
+        )
+
+    @extend_schema_field(PostListSerializer(many=True))
+    def get_posts(self, obj):
+        return self.context["posts"]
+
+
+class PostCreateUpdateSerializer(UploadAttachmentMixin, serializers.ModelSerializer):
+    hashtag = HashtagSerializer(many=True, required=False)
+    image_upload = UploadField(help_text="Id of a completed upload to use as image")
+
+    upload_fields = {"image_upload": "image"}
 
     class Meta:
         model = Post
-        fields = ("content", "image", "hashtag")
+        fields = ("content", "image", "image_upload", "hashtag")
+
+    @staticmethod
+    def _hashtag_names(content, hashtag_data):
+        explicit = [normalize_hashtag(tag["name"]) for tag in hashtag_data or ()]
+        return list(dict.fromkeys(extract_hashtags(content) + explicit))
 
     def create(self, validated_data):
-        hashtag = validated_data.pop("hashtag")
+        hashtag = validated_data.pop("hashtag", None)
         post = Post.objects.create(**validated_data)
-
-        for tag in hashtag:
-            hashtag_obj, created = Hashtag.objects.get_or_create(**tag)
-            post.hashtag.add(hashtag_obj)
-
+        post.hashtag.set(get_or_create_hashtags(self._hashtag_names(post.content, hashtag)))
         return post
 
     def update(self, instance, validated_data):
         hashtag_data = validated_data.pop("hashtag", None)
+        extracted = extract_hashtags(instance.content)
 
         instance = super().update(instance, validated_data)
 
         if hashtag_data is not None:
-            instance.hashtag.clear()
-            for hashtag in hashtag_data:
-                hashtag_obj, created = Hashtag.objects.get_or_create(**hashtag)
-                instance.hashtag.add(hashtag_obj)
+            instance.hashtag.set(get_or_create_hashtags(self._hashtag_names(instance.content, hashtag_data)))
+        elif "content" in validated_data:
+            # Tags taken from the old content are replaced by those in the
+            # new one; tags given explicitly stay.
+            stale = set(extracted).difference(extract_hashtags(instance.content))
+            kept = [name for name in instance.hashtag.values_list("name", flat=True) if name not in stale]
+            instance.hashtag.set(get_or_create_hashtags(extract_hashtags(instance.content) + kept))
 
         return instance
 
 
-class UserFilterSerializer(serializers.Serializer):
+class NotificationSerializer(serializers.ModelSerializer):
+    last_actor = UserShortsSerializer(read_only=True)
+
+    class Meta:
+        model = Notification
+        fields = (
+            "id",
+            "kind",
+            "post",
+            "last_actor",
+            "actor_count",
+            "is_read",
+            "created_at",
+            "updated_at",
+        )
+
+
+class UploadSerializer(serializers.ModelSerializer):
+    chunk_count = serializers.IntegerField(read_only=True)
+    received_chunks = serializers.SerializerMethodField()
+    completed = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Upload
+        fields = (
+            "id",
+            "filename",
+            "size",
+            "checksum",
+            "chunk_size",
+            "chunk_count",
+            "received_chunks",
+            "completed",
+        )
+        read_only_fields = ("id", "chunk_size")
+
+    def validate_filename(self, value):
+        validate_image_file_extension(File(None, name=value))
+        return os.path.basename(value)
+
+    def validate_size(self, value):
+        max_size = get_upload_settings()["MAX_SIZE"]
+        if not 0 < value <= max_size:
+            raise serializers.ValidationError(f"Size must be between 1 and {max_size} bytes.")
+        return value
+
+    def validate_checksum(self, value):
+        if value and (len(value) != 64 or not all(char in "0123456789abcdefABCDEF" for char in value)):
+            raise serializers.ValidationError("Checksum must be a hex encoded SHA-256 digest.")
+        return value.lower()
+
+    def get_received_chunks(self, obj) -> list[int]:
+        if obj.completed_at is not None:
+            return list(range(obj.chunk_count))
+        return received_chunks(obj)
+
+    def get_completed(self, obj) -> bool:
+        return obj.completed_at is not None
+
+    def create(self, validated_data):
+        validated_data["chunk_size"] = get_upload_settings()["CHUNK_SIZE"]
+        return super().create(validated_data)
+
+
+class EventTicketSerializer(serializers.Serializer):
+    ticket = serializers.CharField()
+    expires_in = serializers.IntegerField()
+
+
+class BatchSubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=("GET", "POST", "PUT", "PATCH", "DELETE"))
+    path = serializers.CharField()
+    body = serializers.JSONField(required=False)
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    requests = BatchSubRequestSerializer(many=True, allow_empty=False)
+
+    def validate_requests(self, value):
+        max_size = settings.BATCH_REQUESTS["MAX_SIZE"]
+        if len(value) > max_size:
+            raise serializers.ValidationError(f"A batch can contain at most {max_size} requests.")
+        return value
+
+
+class SparseFieldsetFilterSerializer(serializers.Serializer):
+    fields = serializers.CharField(
+        required=False, help_text="Comma-separated list of fields to return"
+    )
+    expand = serializers.CharField(
+        required=False, help_text="Comma-separated list of relations to render as objects instead of ids"
+    )
+
+
+class UserFilterSerializer(SparseFieldsetFilterSerializer):
     username = serializers.CharField(
         required=False, help_text="Filter by username (partial match)"
     )
@@ -202,7 +627,16 @@ class UserFilterSerializer(serializers.Serializer):
     )
 
 
-class PostFilterSerializer(serializers.Serializer):
+class PostFilterSerializer(SparseFieldsetFilterSerializer):
     hashtag = serializers.CharField(
-        required=False, help_text="Filter by hashtag (partial match)"
+        required=False, help_text="Filter by hashtag name (with or without #) or id"
+    )
+    author = serializers.IntegerField(
+        required=False, help_text="Filter by author id. Author and hashtag filters include archived posts"
+    )
+    order = serializers.ChoiceField(
+        choices=["ranked"], required=False, help_text="'ranked' returns the top posts by engagement score"
+    )
+    limit = serializers.IntegerField(
+        required=False, min_value=1, help_text="Number of posts to return with order=ranked"
     )
@@ -0,0 +1,279 @@
+import copy
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from operator import attrgetter, itemgetter
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, Max
+
+from user.db import retry_on_busy
+
+DEFAULT_POST_SHARDING_SETTINGS = {
+    "MAX_WORKERS": 8,
+}
+
+# Tables split by author across the post shards.
+SHARDED_MODELS = {"user.post", "user.post_likes", "user.post_hashtag"}
+# Small tables copied to every shard so posts can still join them there.
+REFERENCE_MODELS = {"user.hashtag"}
+
+POST_ORDERING = ("-created_at", "-id")
+
+
+def get_post_sharding_settings():
+    return {**DEFAULT_POST_SHARDING_SETTINGS, **getattr(settings, "POST_SHARDING", {})}
+
+
+def post_shards():
+    """
+    Aliases of the databases posts are split across, empty when posts live
+    in the default database.
+    """
+    return list(getattr(settings, "POST_SHARDS", ()))
+
+
+def is_sharded():
+    return bool(post_shards())
+
+
+def post_databases():
+    return post_shards() or [DEFAULT_DB_ALIAS]
+
+
+def shard_for_author(author_id):
+    shards = post_shards()
+    if not shards:
+        return DEFAULT_DB_ALIAS
+    return shards[int(author_id) % len(shards)]
+
+
+_current_shard = ContextVar("current_shard", default=None)
+
+
+@contextmanager
+def using_shard(alias):
+    """
+    Send post queries in the block that do not pick a shard themselves to
+    ``alias``, for code such as the admin that builds its own queries.
+    """
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def scatter(func, querysets):
+    """
+    Call ``func`` on each queryset, concurrently when there is more than
+    one and no transaction is open on their databases, and return the
+    results in order. Each worker thread opens its own connection and
+    closes it when done.
+    """
+    querysets = list(querysets)
+    # Worker threads cannot see writes of a transaction still open here.
+    if len(querysets) == 1 or any(connections[queryset.db].in_atomic_block for queryset in querysets):
+        return [func(queryset) for queryset in querysets]
+
+    def call(queryset):
+        try:
+            return func(queryset)
+        finally:
+            connections[queryset.db].close()
+
+    with ThreadPoolExecutor(min(len(querysets), get_post_sharding_settings()["MAX_WORKERS"])) as pool:
+        return list(pool.map(call, querysets))
+
+
+class ShardedRows:
+    """
+    One query run on several databases, merged in ``order_by`` order.
+
+    Slicing ``[start:stop]`` asks every database for its first ``stop``
+    rows and merges them, so a page costs one bounded, index-ordered query
+    per shard. ``count()``, ``len()`` and iteration make it usable wherever
+    the views and paginators take a queryset. Rows are merged on the
+    ordering columns, which must be in the rows and share one direction.
+    """
+
+    def __init__(self, querysets, order_by=POST_ORDERING):
+        directions = {name.startswith("-") for name in order_by}
+        if len(directions) != 1:
+            raise ValueError("ShardedRows needs every ordering column in the same direction.")
+        self.querysets = [queryset.order_by(*order_by) for queryset in querysets]
+        self.columns = [name.lstrip("-") for name in order_by]
+        self.reverse = directions.pop()
+        self._result_cache = None
+
+    def _key(self, row):
+        getter = itemgetter if isinstance(row, dict) else attrgetter
+        return getter(*self.columns)(row)
+
+    def _merge(self, stop=None):
+        results = scatter(lambda queryset: list(queryset if stop is None else queryset[:stop]), self.querysets)
+        merged = heapq.merge(*results, key=self._key, reverse=self.reverse)
+        return list(merged if stop is None else (row for _, row in zip(range(stop), merged)))
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            self._result_cache = self._merge()
+        return self._result_cache
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        return sum(scatter(lambda queryset: queryset.count(), self.querysets))
+
+    def __len__(self):
+        return len(self._fetch_all())
+
+    def __iter__(self):
+        return iter(self._fetch_all())
+
+    def __getitem__(self, index):
+        if self._result_cache is not None:
+            return self._result_cache[index]
+        if isinstance(index, int):
+            return self._merge(index + 1)[index]
+        if index.step or (index.start or 0) < 0 or (index.stop is not None and index.stop < 0):
+            return self._fetch_all()[index]
+        return self._merge(index.stop)[index.start :]
+
+
+def scatter_rows(queryset, order_by=POST_ORDERING):
+    """
+    ``queryset`` across every post shard as ``ShardedRows``. Returned as is
+    when posts are not sharded or the queryset is pinned to one database.
+    """
+    if queryset._db or not is_sharded():
+        return queryset
+    return ShardedRows([queryset.using(alias) for alias in post_shards()], order_by)
+
+
+@retry_on_busy
+def allocate_post_ids(count):
+    """
+    Reserve ``count`` consecutive post ids from a counter in the default
+    database, so ids stay unique across shards. The counter starts above
+    the highest id already used by a post or archived post.
+    """
+    IdSequence = apps.get_model("user", "IdSequence")
+    if not IdSequence.objects.filter(name="post").update(value=F("value") + count):
+        Post, ArchivedPost = apps.get_model("user", "Post"), apps.get_model("user", "ArchivedPost")
+        highest = [
+            ArchivedPost.objects.aggregate(top=Max("id"))["top"] or 0,
+            *(Post._base_manager.using(alias).aggregate(top=Max("id"))["top"] or 0 for alias in post_databases()),
+        ]
+        IdSequence.objects.create(name="post", value=max(highest) + count)
+    value = IdSequence.objects.get(name="post").value
+    return range(value - count + 1, value + 1)
+
+
+def replicate(model, objects):
+    """
+    Copy reference rows (same ids) from the default database to every post
+    shard. Existing rows are updated in place: deleting them would cascade
+    to the shard's links.
+    """
+    objects = list(objects)
+    fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+    for alias in post_shards():
+        # bulk_create binds the instances to ``alias``; hand it copies.
+        model._base_manager.using(alias).bulk_create(
+            [copy.copy(obj) for obj in objects],
+            update_conflicts=True,
+            unique_fields=[model._meta.pk.name],
+            update_fields=fields,
+        )
+
+
+def hide_author(user_id):
+    """
+    Record a soft-deleted author in the default database and on every post
+    shard. Posts are filtered by this table where they are stored, instead
+    of joining the user table, which shards do not have.
+    """
+    HiddenAuthor = apps.get_model("user", "HiddenAuthor")
+    for alias in [DEFAULT_DB_ALIAS, *post_shards()]:
+        HiddenAuthor.objects.using(alias).get_or_create(user_id=user_id)
+
+
+def unhide_author(user_id):
+    HiddenAuthor = apps.get_model("user", "HiddenAuthor")
+    for alias in [DEFAULT_DB_ALIAS, *post_shards()]:
+        HiddenAuthor.objects.using(alias).filter(user_id=user_id).delete()
+
+
+def unreplicate(model, pks):
+    for alias in post_shards():
+        model._base_manager.using(alias).filter(pk__in=pks).delete()
+
+
+def replicate_on_save(sender, instance, raw=False, using=None, **kwargs):
+    if is_sharded() and using == DEFAULT_DB_ALIAS:
+        replicate(sender, [instance])
+
+
+def unreplicate_on_delete(sender, instance, using=None, **kwargs):
+    if is_sharded() and using == DEFAULT_DB_ALIAS:
+        unreplicate(sender, [instance.pk])
+
+
+def delete_post_notifications(sender, instance, using=None, **kwargs):
+    """
+    Notifications live in the default database, out of reach of a post's
+    cascade on its shard, so they are removed here.
+    """
+    if is_sharded() and using != DEFAULT_DB_ALIAS:
+        apps.get_model("user", "Notification").objects.filter(post_id=instance.pk).delete()
+
+
+class ShardRoutingError(Exception):
+    """
+    A sharded table was queried without saying which shard to use.
+    """
+
+
+class PostShardRouter:
+    """
+    Routes posts and their like and hashtag links by author.
+
+    Queries carrying a ``Post`` instance hint (saving a post, its related
+    managers) go to that post's shard, including reads of the hashtags
+    replicated there. Code that reads posts without an instance picks the
+    shard itself with ``Post.objects.for_author()``, ``locate()``,
+    ``scatter_rows()`` or ``using()``; anything else would silently hit the
+    default database, which holds no posts, so it raises
+    ``ShardRoutingError`` unless a ``using_shard()`` block names the shard.
+    Every database gets the full schema.
+    """
+
+    def db_for_read(self, model, **hints):
+        return self.route(model, hints.get("instance"), strict=True)
+
+    def db_for_write(self, model, **hints):
+        # Assigning a user to an unsaved post's author asks with the user as
+        # the hint; the post is routed again by its own instance when saved.
+        return self.route(model, hints.get("instance"), strict="instance" not in hints)
+
+    def route(self, model, instance, strict):
+        if not is_sharded():
+            return None
+        label = model._meta.label_lower
+        if instance is None or instance._meta.label_lower != "user.post":
+            if label not in SHARDED_MODELS:
+                return None
+            shard = _current_shard.get()
+            if shard is None and strict:
+                raise ShardRoutingError(
+                    f"{model._meta.label} is sharded; pick its database with for_author(), locate(), "
+                    "scatter_rows(), using() or using_shard()."
+                )
+            return shard
+        if label not in SHARDED_MODELS | REFERENCE_MODELS:
+            return None
+        return instance._state.db or shard_for_author(instance.author_id)
@@ -0,0 +1,199 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from user.caching import cached
+from user.compression import EncodedBody
+from user.models import Post, UserFollowing
+from user.renderers import FastJSONRenderer
+from user.sharding import is_sharded, post_shards, scatter
+from user.serializers import PostListFastSerializer, PostListSerializer, UserSummarySerializer
+
+DEFAULT_USER_SUMMARY_SETTINGS = {
+    "POSTS": 5,
+    "CACHE_SECONDS": 60,
+}
+
+
+def get_user_summary_settings():
+    return {**DEFAULT_USER_SUMMARY_SETTINGS, **getattr(settings, "USER_SUMMARY", {})}
+
+
+def _version_key(user_id):
+    return f"user-summary:version:{user_id}"
+
+
+def summary_version(user_id):
+    """
+    Current cache generation of ``user_id``'s summary. A missing version is
+    seeded with the clock rather than 0, so if it is evicted, entries cached
+    under the old version are never reused.
+    """
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def summary_cache_key(profile_id, viewer_id):
+    return f"user-summary:{profile_id}:{viewer_id or 0}:{summary_version(profile_id)}"
+
+
+def profile_summary_cache_key(profile_id):
+    return f"user-summary:profile:{profile_id}:{summary_version(profile_id)}"
+
+
+def invalidate_user_summary(*user_ids):
+    """
+    Drop every viewer's cached summary of ``user_ids`` by bumping their
+    cache versions.
+    """
+    for user_id in user_ids:
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def _count(queryset, column):
+    return Coalesce(
+        Subquery(queryset.order_by().values(column).annotate(total=Count("*")).values("total"), IntegerField()),
+        Value(0),
+    )
+
+
+def annotate_summary(queryset, viewer=None):
+    """
+    Add follower, following and post counts, and whether ``viewer`` follows
+    each user when one is given, as subqueries of a single SELECT. Sharded
+    posts cannot be counted from the user table's database, so
+    ``posts_count`` is left to the caller then.
+    """
+    queryset = queryset.annotate(
+        followers_count=_count(UserFollowing.objects.filter(following_user_id=OuterRef("pk")), "following_user_id"),
+        following_count=_count(UserFollowing.objects.filter(user_id=OuterRef("pk")), "user_id"),
+    )
+    if not is_sharded():
+        queryset = queryset.annotate(posts_count=_count(Post.objects.filter(author=OuterRef("pk")), "author"))
+    if viewer is None:
+        return queryset
+    viewer_id = viewer.pk if viewer.is_authenticated else None
+    return queryset.annotate(
+        is_following=Exists(UserFollowing.objects.filter(user_id=viewer_id, following_user_id=OuterRef("pk")))
+    )
+
+
+def build_profile_summary(profile_id):
+    """
+    The viewer-independent part of the summary: profile, counts and latest
+    posts, with ``is_following`` left False and image URLs relative to the
+    site, as the entry is shared by requests to any host. One query for the
+    profile and counts plus a fixed number for the posts.
+    """
+    config = get_user_summary_settings()
+    User = get_user_model()
+    columns = {field.name for field in User._meta.concrete_fields}
+    profile = annotate_summary(
+        User.objects.filter(pk=profile_id).only(*columns.intersection(UserSummarySerializer.Meta.fields))
+    ).first()
+    if profile is None:
+        return None
+    if is_sharded():
+        profile.posts_count = Post.objects.for_author(profile.pk).count()
+    profile.is_following = False
+    # Every post belongs to the profile, so the author is left out.
+    posts = PostListFastSerializer(
+        None, fields=[name for name in PostListSerializer.Meta.fields if name != "author"], expanded=("hashtag",)
+    )
+    rows = posts.get_rows(Post.objects.for_author(profile.pk))[: config["POSTS"]]
+    return UserSummarySerializer(profile, context={"posts": posts.to_representation(rows)}).data
+
+
+def cached_profile_summary(profile_id):
+    config = get_user_summary_settings()
+    return cached(
+        profile_summary_cache_key(profile_id),
+        lambda: build_profile_summary(profile_id),
+        config["CACHE_SECONDS"],
+    )
+
+
+def absolute_image_urls(data, request):
+    """
+    ``data`` from ``build_profile_summary`` with its image URLs made
+    absolute for ``request``.
+    """
+    absolute = request.build_absolute_uri
+    return {
+        **data,
+        "profile_image": data["profile_image"] and absolute(data["profile_image"]),
+        "posts": [{**post, "image": post["image"] and absolute(post["image"])} for post in data["posts"]],
+    }
+
+
+def build_user_summary(profile_id, request):
+    """
+    Return the summary of ``profile_id`` as seen by ``request.user``,
+    rendered to JSON as an ``EncodedBody``, or None if there is no such
+    user.
+
+    Two cache levels, both stampede-protected: the profile's shared summary,
+    which ``warm_caches`` can prefill, and the per-viewer response body with
+    ``is_following`` set, stored raw and gzipped. A per-viewer miss costs one
+    EXISTS query when the shared entry is warm; a hit costs no query and no
+    compression.
+    """
+    config = get_user_summary_settings()
+
+    def for_viewer():
+        data = cached_profile_summary(profile_id)
+        if data is None:
+            return None
+        is_following = (
+            request.user.is_authenticated
+            and UserFollowing.objects.filter(user_id=request.user, following_user_id=profile_id).exists()
+        )
+        data = {**absolute_image_urls(data, request), "is_following": is_following}
+        return EncodedBody(FastJSONRenderer().render(data))
+
+    return cached(summary_cache_key(profile_id, request.user.pk), for_viewer, config["CACHE_SECONDS"])
+
+
+def most_followed_profile_ids(limit):
+    return list(
+        UserFollowing.objects.order_by()
+        .values("following_user_id")
+        .annotate(total=Count("*"))
+        .order_by("-total")
+        .values_list("following_user_id", flat=True)[:limit]
+    )
+
+
+def invalidate_on_follow(sender, instance, **kwargs):
+    invalidate_user_summary(instance.user_id_id, instance.following_user_id_id)
+
+
+def invalidate_on_post(sender, instance, **kwargs):
+    invalidate_user_summary(instance.author_id)
+
+
+def invalidate_on_user(sender, instance, **kwargs):
+    invalidate_user_summary(instance.pk)
+
+
+def invalidate_on_like(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        # ``user.likes.add(post)``: ``instance`` is the user.
+        posts = Post._base_manager.filter(pk__in=pk_set or ()).values_list("author_id", flat=True)
+        author_ids = scatter(list, [posts.using(alias) for alias in post_shards()] or [posts])
+        invalidate_user_summary(*{author_id for ids in author_ids for author_id in ids})
+    else:
+        invalidate_user_summary(instance.author_id)
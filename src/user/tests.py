@@ -1,3 +1,1823 @@
-from django.test import TestCase
+import asyncio
+import copy
+import gzip
+import hashlib
+import importlib
+import json
+import sqlite3
+import tempfile
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import QuerySet
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches
+from django.utils import timezone as django_timezone
+from drf_spectacular.drainage import GENERATOR_STATS
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from user import batch, ranking, schema
+from user.admin import delete_in_chunks, update_in_chunks
+from user.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from user.caching import cached
+from user.compression import CompressionMiddleware
+from user.counters import CounterBuffer, get_post_counters_settings, post_counters
+from user.db import PrimaryReplicaRouter, primary_pin_key, replica_reads, retry_on_busy
+from user.deletion import purge_steps, purge_user, soft_delete_user
+from user.events import Event, EventHub, get_events_settings, issue_stream_ticket, stream_ticket_user_id
+from user.exports import iter_account_export
+from user.hashtags import HASHTAG_MAX_LENGTH, extract_hashtags, get_or_create_hashtags, normalize_hashtag
+from user.idempotency import claim, complete, prune_expired
+from user.media import serve_media
+from user.metrics import WORKERS_KEY, WORKERS_LOCK_KEY, MetricsRegistry, get_metrics_settings, registry, worker_key
+from user.models import (
+    ArchivedPost,
+    Hashtag,
+    HiddenAuthor,
+    IdempotencyKey,
+    IdSequence,
+    Notification,
+    Post,
+    Upload,
+    UserFollowing,
+)
+from user.notifications import notify
+from user.pagination import EstimatedCountPaginator, estimate_row_count
+from user.renderers import FastJSONRenderer
+from user.serializers import PostListFastSerializer, PostListSerializer
+from user.sharding import ShardedRows, ShardRoutingError, post_databases, post_shards, scatter_rows, shard_for_author
+from user.throttling import BatchAwareUserRateThrottle
+from user.views import _authenticate_event_stream
+
+
+# Plans and serializer comparisons read posts from the default database.
+@override_settings(POST_SHARDS=[])
+class QueryPlanTests(TestCase):
+    """
+    The listing queries read their table through the indexes added for
+    them, in index order, rather than scanning and sorting it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(email="author@example.com", password="password")
+        cls.other = User.objects.create_user(email="reader@example.com", password="password")
+        UserFollowing.objects.create(user_id=cls.other, following_user_id=cls.user)
+        Post.objects.create(author=cls.user, content="post")
+
+    def assertUsesIndex(self, queryset, table, index, search=True):
+        """
+        Every step reading ``table`` uses ``index``, and with ``search`` it
+        seeks into it rather than walking the whole index.
+        """
+        plan = queryset.explain()
+        lines = [line for line in plan.splitlines() if f" {table} " in f"{line} "]
+        self.assertTrue(lines, plan)
+        for line in lines:
+            self.assertIn(f"USING INDEX {index}", line, plan)
+            if search:
+                self.assertIn(f"SEARCH {table} ", line, plan)
+        self.assertNotIn(f"SCAN {table}\n", f"{plan}\n")
+        self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan)
+
+    def test_post_list(self):
+        # The unfiltered list walks the index newest first and stops at the
+        # page size.
+        self.assertUsesIndex(Post.objects.all()[:20], "user_post", "post_created_idx", search=False)
+
+    def test_author_history(self):
+        self.assertUsesIndex(Post.objects.filter(author=self.user.pk)[:20], "user_post", "post_author_created_idx")
+
+    def test_following_list(self):
+        self.assertUsesIndex(self.other.following.all()[:20], "user_userfollowing", "following_user_created_idx")
+
+    def test_followers_list(self):
+        self.assertUsesIndex(self.user.followers.all()[:20], "user_userfollowing", "followers_user_created_idx")
+
+    def test_notification_feed(self):
+        self.assertUsesIndex(
+            Notification.objects.filter(recipient=self.user)[:20], "user_notification", "notification_feed_idx"
+        )
+
+
+@override_settings(POST_SHARDS=[])
+class PostListFastSerializerTests(TestCase):
+    """
+    ``PostListFastSerializer`` rendered with ``FastJSONRenderer`` produces
+    the same bytes as ``PostListSerializer`` with ``JSONRenderer``.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        author = User.objects.create_user(email="author@example.com", username="author", password="password")
+        readers = [User.objects.create_user(email=f"reader{i}@example.com", password="password") for i in range(3)]
+        tags = [Hashtag.objects.create(name=name) for name in ("python", "café", "日本")]
+        first = Post.objects.create(author=author, content="Plain post")
+        second = Post.objects.create(author=author, content='Ünïcödé \u2028 "quoted" <b>', image="post_image/a.jpg")
+        first.likes.set(readers)
+        first.hashtag.set(tags[:2])
+        second.likes.set(readers[1:])
+        second.hashtag.set(tags)
+        cls.readers = readers
+
+    def render_both(self, query=""):
+        request = Request(APIRequestFactory().get(f"/api/v1/user/posts/{query}"))
+        queryset = PostListSerializer.setup_eager_loading(Post.objects.all(), request)
+        expected = JSONRenderer().render(PostListSerializer(queryset, many=True, context={"request": request}).data)
+        serializer = PostListFastSerializer(request)
+        actual = FastJSONRenderer().render(serializer.to_representation(serializer.get_rows(Post.objects.all())))
+        return expected, actual
+
+    def test_list(self):
+        expected, actual = self.render_both()
+        self.assertEqual(actual, expected)
+
+    def test_sparse_fields(self):
+        expected, actual = self.render_both("?fields=author,content,likes,created_at")
+        self.assertEqual(actual, expected)
+
+    def test_expand(self):
+        for query in ("?expand=", "?expand=author", "?expand=hashtag", "?fields=hashtag,image&expand=hashtag"):
+            with self.subTest(query=query):
+                expected, actual = self.render_both(query)
+                self.assertEqual(actual, expected)
+
+    def test_soft_deleted_likes_hidden(self):
+        soft_delete_user(self.readers[1])
+        expected, actual = self.render_both("?fields=likes")
+        self.assertEqual(actual, expected)
+        first, second, third = (reader.pk for reader in self.readers)
+        self.assertEqual(json.loads(actual), [{"likes": [third]}, {"likes": [first, third]}])
+
+
+class PostFilterTests(APITestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(email="author@example.com", password="password")
+        cls.other = User.objects.create_user(email="other@example.com", password="password")
+        cls.post = Post.objects.create(author=cls.user, content="#python post")
+        cls.post.hashtag.add(Hashtag.objects.create(name="python"))
+        Post.objects.create(author=cls.other, content="other post")
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        # Write the recorded impressions before the test database goes away.
+        post_counters.flush()
+
+    def test_filters(self):
+        for query, expected in (
+            (f"author={self.user.pk}", ["#python post"]),
+            ("hashtag=%23Python", ["#python post"]),
+            (f"author={self.other.pk}&hashtag=python", []),
+        ):
+            with self.subTest(query=query):
+                response = self.client.get(f"/api/v1/user/posts/?{query}&fields=content")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([post["content"] for post in response.json()], expected)
+
+    def test_invalid_filters_rejected(self):
+        for query in ("author=abc", "author=1.5", "order=oldest", "limit=0"):
+            with self.subTest(query=query):
+                response = self.client.get(f"/api/v1/user/posts/?{query}")
+                self.assertEqual(response.status_code, 400)
+
+    def test_filters_ignored_outside_list(self):
+        response = self.client.get(f"/api/v1/user/posts/{self.post.pk}/?author={self.other.pk}&hashtag=abc")
+        self.assertEqual(response.status_code, 200)
+
+
+class PostCounterTests(TestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = get_user_model().objects.create_user(email="author@example.com", password="password")
+        cls.posts = [Post.objects.create(author=cls.author, content=f"post {i}") for i in range(3)]
+
+    def make_buffer(self, **config):
+        return CounterBuffer({**get_post_counters_settings(), **config}, autoflush=False)
+
+    def counts(self, post):
+        data = PostListSerializer(Post.objects.locate(pk=post.pk)).data
+        return data["view_count"], data["impression_count"]
+
+    def test_flush_updates_serialized_counts(self):
+        buffer = self.make_buffer()
+        first, second, third = self.posts
+        buffer.record_impressions([first.pk, second.pk, first.pk])
+        buffer.record_views([first.pk])
+        self.assertEqual(self.counts(first), (0, 0))
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.pending(), {})
+        self.assertEqual([self.counts(post) for post in self.posts], [(1, 2), (0, 1), (0, 0)])
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_one_case_update_per_batch(self):
+        buffer = self.make_buffer(UPDATE_BATCH_SIZE=2)
+        first, second, third = self.posts
+        buffer.increment("impression_count", [first.pk, second.pk, third.pk])
+        buffer.increment("impression_count", [first.pk])
+        buffer.increment("view_count", [third.pk], amount=5)
+        captures = [CaptureQueriesContext(connections[alias]) for alias in post_databases()]
+        with ExitStack() as stack:
+            for capture in captures:
+                stack.enter_context(capture)
+            buffer.flush()
+        # Every post database gets one statement per batch of two posts.
+        for capture in captures:
+            updates = [query["sql"] for query in capture if query["sql"].startswith("UPDATE")]
+            self.assertEqual(len(updates), 2)
+            self.assertTrue(all("CASE WHEN" in sql for sql in updates))
+        self.assertEqual([self.counts(post) for post in self.posts], [(0, 2), (0, 1), (5, 1)])
+
+    def test_failed_flush_keeps_increments(self):
+        buffer = self.make_buffer()
+        buffer.record_views([self.posts[0].pk])
+        with mock.patch("user.counters.write_counts", side_effect=RuntimeError("disk full")):
+            with self.assertRaises(RuntimeError):
+                buffer.flush()
+        buffer.record_views([self.posts[0].pk])
+        self.assertEqual(buffer.pending(), {"view_count": {self.posts[0].pk: 2}})
+        buffer.flush()
+        self.assertEqual(self.counts(self.posts[0]), (2, 0))
+
+    def test_pending_posts_bounded(self):
+        # Past MAX_PENDING_POSTS the flusher is woken rather than waiting
+        # out the interval, which bounds what a crash can lose.
+        buffer = CounterBuffer({**get_post_counters_settings(), "MAX_PENDING_POSTS": 2})
+        with mock.patch.object(buffer, "_ensure_flusher"):
+            buffer.record_impressions([self.posts[0].pk])
+            self.assertFalse(buffer._wakeup.is_set())
+            buffer.record_impressions([self.posts[1].pk])
+            self.assertTrue(buffer._wakeup.is_set())
+        buffer.flush()
+
+    def test_zero_interval_writes_through(self):
+        buffer = CounterBuffer({**get_post_counters_settings(), "FLUSH_INTERVAL_SECONDS": 0})
+        buffer.record_views([self.posts[0].pk])
+        self.assertEqual(buffer.pending(), {})
+        self.assertEqual(self.counts(self.posts[0]), (1, 0))
+
+
+class IdempotencyTests(APITestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(email="staff@example.com", password="password", is_staff=True)
+        cls.other = User.objects.create_user(email="other@example.com", password="password")
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def create_post(self, content="post", key="key-1"):
+        return self.client.post("/api/v1/user/posts/", {"content": content}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_post_create_replayed(self):
+        first = self.create_post()
+        second = self.create_post()
+        self.assertEqual(first.status_code, 201)
+        self.assertNotIn("Idempotent-Replayed", first.headers)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Post.objects.for_author(self.user.pk).count(), 1)
+
+    def test_follow_replayed(self):
+        responses = [
+            self.client.post(f"/api/v1/user/follow/{self.other.pk}/", HTTP_IDEMPOTENCY_KEY="follow") for _ in range(2)
+        ]
+        self.assertEqual([response.status_code for response in responses], [201, 201])
+        self.assertEqual(responses[1].headers["Idempotent-Replayed"], "true")
+        self.assertEqual(UserFollowing.objects.filter(user_id=self.user).count(), 1)
+
+    def test_different_body_rejected(self):
+        self.create_post("first")
+        response = self.create_post("second")
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Post.objects.for_author(self.user.pk).count(), 1)
+
+    def test_failed_request_releases_key(self):
+        with mock.patch("user.views.ranking.on_publish", side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.create_post()
+        self.assertFalse(IdempotencyKey.objects.exists())
+        response = self.create_post()
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("Idempotent-Replayed", response.headers)
+
+    def test_expired_key_reclaimed(self):
+        IdempotencyKey.objects.create(
+            user=self.user,
+            key="key-1",
+            fingerprint="old",
+            status_code=201,
+            response={"content": "old"},
+            expires_at=django_timezone.now() - timedelta(seconds=1),
+        )
+        response = self.create_post("new")
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("Idempotent-Replayed", response.headers)
+        self.assertEqual(IdempotencyKey.objects.get().response["content"], "new")
+
+    def test_replay_keeps_view_headers(self):
+        record, response = claim(self.user, "key", "fingerprint")
+        self.assertIsNone(response)
+        complete(record, Response({"id": 1}, status=201, headers={"Location": "/api/v1/user/posts/1/"}))
+        _, replay = claim(self.user, "key", "fingerprint")
+        self.assertEqual((replay.status_code, replay.data), (201, {"id": 1}))
+        self.assertEqual(replay.headers["Location"], "/api/v1/user/posts/1/")
+        self.assertEqual(replay.headers["Idempotent-Replayed"], "true")
+
+    def test_server_error_releases_key(self):
+        record, _ = claim(self.user, "key", "fingerprint")
+        complete(record, Response(status=503))
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_in_flight_duplicate(self):
+        config = {"TTL_SECONDS": 60, "WAIT_SECONDS": 0.1, "IN_FLIGHT_TIMEOUT_SECONDS": 60, "POLL_SECONDS": 0.05}
+        claim(self.user, "key", "fingerprint", config)
+        with mock.patch("user.idempotency.time.sleep") as sleep:
+            self.assertEqual(claim(self.user, "key", "other", config)[1].status_code, 422)
+            sleep.assert_not_called()
+            with mock.patch("user.idempotency.time.monotonic", side_effect=[0.0, 0.0, 1.0]):
+                self.assertEqual(claim(self.user, "key", "fingerprint", config)[1].status_code, 409)
+            sleep.assert_called_once_with(0.05)
+        # A claim left in flight past the timeout is taken over.
+        IdempotencyKey.objects.update(created_at=django_timezone.now() - timedelta(seconds=61))
+        record, response = claim(self.user, "key", "fingerprint", config)
+        self.assertIsNone(response)
+        self.assertEqual(IdempotencyKey.objects.get().pk, record.pk)
+
+    def test_prune_expired(self):
+        now = django_timezone.now()
+        for index, expires_at in enumerate([now - timedelta(seconds=1)] * 3 + [now + timedelta(hours=1)]):
+            IdempotencyKey.objects.create(user=self.user, key=f"key-{index}", fingerprint="", expires_at=expires_at)
+        self.assertEqual(prune_expired(batch_size=2, now=now), 3)
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["key-3"])
+
+
+class BatchTests(APITransactionTestCase):
+    """
+    A TransactionTestCase, so consecutive GETs run on the shared pool as
+    they do in production.
+    """
+
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(email="user@example.com", password="password")
+        self.other = User.objects.create_user(email="other@example.com", password="password")
+        self.client.force_authenticate(self.user)
+
+    def batch(self, *requests):
+        specs = [{"method": method, "path": path} for method, path in requests]
+        return self.client.post("/api/v1/batch/", {"requests": specs}, format="json")
+
+    def statuses(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [result["status"] for result in response.json()["responses"]]
+
+    def test_dispatch(self):
+        with mock.patch.object(batch._pool, "submit", wraps=batch._pool.submit) as submit:
+            response = self.batch(
+                ("POST", f"/api/v1/user/follow/{self.other.pk}/"),
+                ("GET", "/api/v1/user/followings/"),
+                ("GET", f"/api/v1/user/users/{self.other.pk}/"),
+            )
+        self.assertEqual(self.statuses(response), [201, 200, 200])
+        follow, followings, other = (result["body"] for result in response.json()["responses"])
+        self.assertEqual(follow["following_user_id"], self.other.pk)
+        self.assertEqual(len(followings), 1)
+        self.assertEqual(other["email"], self.other.email)
+        # The write runs first on this thread, then both reads on the pool.
+        self.assertEqual(submit.call_count, 2)
+
+    def test_only_user_api_allowed(self):
+        response = self.batch(
+            ("GET", "/api/v1/batch/"),
+            ("GET", "/api/schema/"),
+            ("GET", "/api/v1/user/missing/"),
+            ("GET", "/api/v1/user/followings/"),
+        )
+        self.assertEqual(self.statuses(response), [400, 400, 404, 200])
+
+    def test_streaming_and_async_views_rejected(self):
+        response = self.batch(("GET", "/api/v1/user/export/"), ("GET", "/api/v1/user/events/"))
+        self.assertEqual(self.statuses(response), [400, 400])
+
+    def test_throttle_charged_per_sub_request(self):
+        followings = ("GET", "/api/v1/user/followings/")
+        with mock.patch.dict(BatchAwareUserRateThrottle.THROTTLE_RATES, {"user": "3/minute"}):
+            self.assertEqual(self.statuses(self.batch(followings, followings)), [200, 200])
+            self.assertEqual(self.client.get("/api/v1/user/followings/").status_code, 200)
+            self.assertEqual(self.client.get("/api/v1/user/followings/").status_code, 429)
+            cache.clear()
+            self.assertEqual(self.batch(*[followings] * 4).status_code, 429)
+            self.assertEqual(self.statuses(self.batch(*[followings] * 3)), [200, 200, 200])
+
+
+class NotificationTests(APITestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.author = User.objects.create_user(email="author@example.com", password="password")
+        cls.readers = [User.objects.create_user(email=f"reader{i}@example.com", password="password") for i in range(2)]
+        cls.post = Post.objects.create(author=cls.author, content="post")
+
+    def unread_count(self):
+        self.author.refresh_from_db()
+        self.client.force_authenticate(self.author)
+        count = self.client.get("/api/v1/user/notifications/unread_count/").json()["unread_count"]
+        self.assertEqual(count, Notification.objects.filter(recipient=self.author, is_read=False).count())
+        return count
+
+    def test_likes_coalesced(self):
+        for reader in self.readers:
+            notify(self.author, reader, Notification.Kind.LIKE, post=self.post)
+        notify(self.author, self.author, Notification.Kind.LIKE, post=self.post)
+        notification = Notification.objects.get()
+        self.assertEqual((notification.actor_count, notification.last_actor), (2, self.readers[1]))
+        self.assertEqual(self.unread_count(), 1)
+
+    def test_mark_all_read(self):
+        notify(self.author, self.readers[0], Notification.Kind.LIKE, post=self.post)
+        notify(self.author, self.readers[0], Notification.Kind.FOLLOW)
+        self.assertEqual(self.unread_count(), 2)
+        response = self.client.post("/api/v1/user/notifications/mark_all_read/")
+        self.assertEqual(response.json(), {"marked_read": 2})
+        self.assertEqual(self.unread_count(), 0)
+        # A new like in the same bucket makes the read row unread again.
+        notify(self.author, self.readers[1], Notification.Kind.LIKE, post=self.post)
+        self.assertEqual(self.unread_count(), 1)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(Notification.objects.get(kind=Notification.Kind.LIKE).actor_count, 2)
+
+    def test_unfollow_retracts(self):
+        for reader in self.readers:
+            self.client.force_authenticate(reader)
+            self.assertEqual(self.client.post(f"/api/v1/user/follow/{self.author.pk}/").status_code, 201)
+        self.assertEqual(Notification.objects.get().actor_count, 2)
+        self.assertEqual(self.unread_count(), 1)
+        for remaining, reader in enumerate(reversed(self.readers)):
+            self.client.force_authenticate(reader)
+            self.assertEqual(self.client.delete(f"/api/v1/user/follow/{self.author.pk}/").status_code, 204)
+            self.assertEqual(list(Notification.objects.values_list("actor_count", flat=True)), [1] * (1 - remaining))
+        self.assertEqual(self.unread_count(), 0)
+
+    def test_concurrent_insert_folded(self):
+        bucket = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        update = QuerySet.update
+
+        def racing_update(queryset, **changes):
+            updated = update(queryset, **changes)
+            if queryset.model is Notification and not updated and not Notification.objects.exists():
+                # Another request inserts the row between the checks and the INSERT.
+                Notification.objects.create(
+                    recipient=self.author, kind=Notification.Kind.LIKE, post=self.post, bucket=bucket
+                )
+            return updated
+
+        with mock.patch("user.notifications.notification_bucket", return_value=bucket), mock.patch.object(
+            QuerySet, "update", autospec=True, side_effect=racing_update
+        ):
+            notify(self.author, self.readers[0], Notification.Kind.LIKE, post=self.post)
+        notification = Notification.objects.get()
+        self.assertEqual((notification.actor_count, notification.last_actor), (2, self.readers[0]))
+        # The other request counted the row as unread.
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.unread_notification_count, 0)
+
+
+@override_settings(ALLOWED_HOSTS=["*"])
+class UserSummaryTests(APITestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.profile = User.objects.create_user(
+            email="profile@example.com",
+            password="password",
+            username="profile",
+            phone_number="+380501234567",
+            birth_date="1990-01-01",
+            profile_image="profile_image/a.jpg",
+        )
+        cls.viewers = [User.objects.create_user(email=f"viewer{i}@example.com", password="password") for i in range(2)]
+        Post.objects.create(author=cls.profile, content="post", image="post_image/a.jpg")
+
+    def setUp(self):
+        cache.clear()
+
+    def summary(self, viewer, host):
+        self.client.force_authenticate(viewer)
+        response = self.client.get(f"/api/v1/user/users/{self.profile.pk}/summary/", HTTP_HOST=host)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_public_fields_only(self):
+        data = self.summary(self.viewers[0], "testserver")
+        self.assertEqual(data["username"], "profile")
+        for name in ("email", "phone_number", "birth_date"):
+            self.assertNotIn(name, data)
+
+    def test_image_urls_follow_request_host(self):
+        first = self.summary(self.viewers[0], "a.example.com")
+        second = self.summary(self.viewers[1], "b.example.com")
+        self.assertEqual(first["profile_image"], "http://a.example.com/media/profile_image/a.jpg")
+        self.assertEqual(second["profile_image"], "http://b.example.com/media/profile_image/a.jpg")
+        self.assertEqual(second["posts"][0]["image"], "http://b.example.com/media/post_image/a.jpg")
+
+    @override_settings(RESPONSE_COMPRESSION={"MIN_SIZE": 0})
+    def test_precompressed_body_sent_once(self):
+        self.client.force_authenticate(self.viewers[0])
+        url = f"/api/v1/user/users/{self.profile.pk}/summary/"
+        plain = self.client.get(url)
+        for _ in range(2):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertIn("Accept-Encoding", response["Vary"])
+            self.assertEqual(gzip.decompress(response.content), plain.content)
+
+
+class EventHubTests(SimpleTestCase):
+    def make_hub(self, **config):
+        return EventHub({**get_events_settings(), "BACKEND": "user.events.LocalEventBackend", **config})
+
+    def test_replay_after_last_event_id(self):
+        hub = self.make_hub(REPLAY_BUFFER_SIZE=3, REPLAY_MAX_CHANNELS=2)
+        for event_id, channel in enumerate(("a", "b", "a", "a", "a", "b"), start=1):
+            hub.dispatch(Event(event_id, channel, "post", {"n": event_id}))
+        self.assertEqual([event.id for event in hub.replay({"a", "b"}, 0)], [2, 3, 4, 5, 6])
+        self.assertEqual([event.id for event in hub.replay({"a", "b"}, 4)], [5, 6])
+        self.assertEqual(hub.replay({"c"}, 0), [])
+        # A third channel evicts the least recently active one.
+        hub.dispatch(Event(7, "c", "post", {}))
+        self.assertEqual([event.id for event in hub.replay({"a", "b", "c"}, 0)], [2, 6, 7])
+
+    def test_fan_out(self):
+        hub = self.make_hub(SUBSCRIBER_QUEUE_SIZE=1)
+
+        async def run():
+            both = hub.subscribe(["a", "b"])
+            only_b = hub.subscribe(["b"])
+            self.assertEqual(hub.subscriber_count, 2)
+            hub.publish("a", "post", {"n": 1})
+            hub.publish("b", "post", {"n": 2})
+            await asyncio.sleep(0)
+            self.assertEqual((await both.queue.get()).data, {"n": 1})
+            self.assertTrue(both.dropped)
+            self.assertEqual((await only_b.queue.get()).data, {"n": 2})
+            self.assertFalse(only_b.dropped)
+            hub.unsubscribe(both)
+            hub.unsubscribe(only_b)
+            self.assertEqual(hub.subscriber_count, 0)
+
+        asyncio.run(run())
+
+    def test_stream_replays_then_follows(self):
+        hub = self.make_hub(RETRY_MILLISECONDS=1000)
+        hub.dispatch(Event(1, "a", "post", {"n": 1}))
+        hub.dispatch(Event(2, "a", "post", {"n": 2}))
+
+        async def run():
+            stream = hub.stream(["a"], last_event_id=1)
+            chunks = [await anext(stream), await anext(stream)]
+            hub.dispatch(Event(3, "a", "post", {"n": 3}))
+            chunks.append(await anext(stream))
+            await stream.aclose()
+            return chunks
+
+        self.assertEqual(
+            asyncio.run(run()),
+            [
+                b"retry: 1000\n\n",
+                b'id: 2\nevent: post\ndata: {"n":2}\n\n',
+                b'id: 3\nevent: post\ndata: {"n":3}\n\n',
+            ],
+        )
+        self.assertEqual(hub.subscriber_count, 0)
+
+
+class EventStreamAuthenticationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email="user@example.com", password="password")
+
+    def authenticate(self, query="", **headers):
+        return _authenticate_event_stream(RequestFactory().get(f"/api/v1/user/events/{query}", **headers))
+
+    def test_ticket(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post("/api/v1/user/events/ticket/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["expires_in"], get_events_settings()["TICKET_SECONDS"])
+        self.assertEqual(self.authenticate(f"?ticket={response.data['ticket']}"), self.user)
+
+    def test_invalid_ticket_refused(self):
+        ticket = issue_stream_ticket(self.user)
+        self.assertIsNone(stream_ticket_user_id(ticket, {"TICKET_SECONDS": -1}))
+        self.assertIsNone(self.authenticate(f"?ticket={ticket[:-1]}"))
+        self.assertIsNone(self.authenticate())
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.authenticate(f"?ticket={ticket}"))
+
+    def test_access_token_only_in_header(self):
+        token = str(AccessToken.for_user(self.user))
+        self.assertEqual(self.authenticate(HTTP_AUTHORIZATION=f"Bearer {token}"), self.user)
+        self.assertIsNone(self.authenticate(f"?token={token}"))
+        self.assertIsNone(self.authenticate(HTTP_AUTHORIZATION="Bearer invalid"))
+
+    async def test_unauthenticated_stream(self):
+        response = await self.async_client.get("/api/v1/user/events/")
+        self.assertEqual(response.status_code, 401)
+
+
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def test_middleware_records_route(self):
+        self.client.get("/api/v1/user/posts/")
+        self.client.get("/api/v1/user/posts/")
+        self.client.get("/no-such-page/")
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["responses"], {("user:posts-list", 401): 2, ("<unresolved>", 404): 1})
+        duration, queries, db_duration, size = snapshot["routes"]["user:posts-list"]
+        self.assertEqual([duration.count, queries.count, size.count], [2, 2, 2])
+        self.assertEqual(size.total, 2 * len(self.client.get("/api/v1/user/posts/").content))
+
+    def test_metrics_endpoint(self):
+        admin = get_user_model().objects.create_superuser(email="admin@example.com", password="password")
+        self.client.get("/api/v1/user/posts/")
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.client.force_authenticate(admin)
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        self.assertIn('http_request_duration_seconds_count{route="user:posts-list",', response.content.decode())
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def make_registry(self):
+        return MetricsRegistry(
+            {
+                **get_metrics_settings(),
+                "DURATION_BUCKETS": (0.1, 1.0),
+                "QUERY_COUNT_BUCKETS": (1,),
+                "DB_DURATION_BUCKETS": (0.1,),
+                "RESPONSE_SIZE_BUCKETS": (100,),
+                "PUBLISH_INTERVAL_SECONDS": float("inf"),
+            }
+        )
+
+    def as_worker(self, pid):
+        return mock.patch("user.metrics.os.getpid", return_value=pid)
+
+    def test_exposition_format(self):
+        metrics = self.make_registry()
+        metrics.observe('user:"quoted"', 200, 0.05, 2, 0.01, 10)
+        metrics.observe('user:"quoted"', 404, 0.5, 0, 0.0, 500)
+        with self.as_worker(100):
+            lines = metrics.render().splitlines()
+        labels = 'route="user:\\"quoted\\"",worker="100"'
+        self.assertEqual(
+            lines[:7],
+            [
+                "# HELP http_request_duration_seconds Wall time spent handling the request.",
+                "# TYPE http_request_duration_seconds histogram",
+                f'http_request_duration_seconds_bucket{{{labels},le="0.1"}} 1',
+                f'http_request_duration_seconds_bucket{{{labels},le="1.0"}} 2',
+                f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2',
+                f"http_request_duration_seconds_sum{{{labels}}} 0.55",
+                f"http_request_duration_seconds_count{{{labels}}} 2",
+            ],
+        )
+        self.assertIn(f'http_request_db_queries_bucket{{{labels},le="+Inf"}} 2', lines)
+        self.assertEqual(
+            lines[-4:],
+            [
+                "# HELP http_responses_total Responses by route and status code.",
+                "# TYPE http_responses_total counter",
+                'http_responses_total{route="user:\\"quoted\\"",status="200",worker="100"} 1',
+                'http_responses_total{route="user:\\"quoted\\"",status="404",worker="100"} 1',
+            ],
+        )
+
+    def test_workers_share_cache(self):
+        first, second = self.make_registry(), self.make_registry()
+        first.observe("a", 200, 0.01, 0, 0.0, 1)
+        second.observe("b", 200, 0.01, 0, 0.0, 1)
+        with self.as_worker(200):
+            second.publish()
+        with self.as_worker(100):
+            self.assertEqual(set(first.worker_snapshots()), {100, 200})
+            self.assertEqual(cache.get(WORKERS_KEY), {100, 200})
+            self.assertIn('route="b",worker="200"', first.render())
+
+            cache.delete(worker_key(200))
+            self.assertEqual(set(first.worker_snapshots()), {100})
+            self.assertEqual(cache.get(WORKERS_KEY), {100})
+
+    def test_registration_waits_for_lock(self):
+        first, second = self.make_registry(), self.make_registry()
+        with self.as_worker(100):
+            first.publish()
+        cache.add(WORKERS_LOCK_KEY, 100)
+        with self.as_worker(200):
+            second.publish()
+            # Skipped while another worker updates the list, never clobbering it.
+            self.assertEqual(cache.get(WORKERS_KEY), {100})
+            self.assertEqual(set(second.worker_snapshots()), {100, 200})
+            cache.delete(WORKERS_LOCK_KEY)
+            second.publish()
+        self.assertEqual(cache.get(WORKERS_KEY), {100, 200})
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def make_connection(self, **options):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "db.sqlite3"
+        settings_dict = {**connections[DEFAULT_DB_ALIAS].settings_dict, "NAME": self.path, "OPTIONS": options}
+        wrapper = SQLiteDatabaseWrapper(settings_dict, alias="sqlite_backend_test")
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pragmas(self):
+        wrapper = self.make_connection(pragmas={"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -2048})
+        with wrapper.cursor() as cursor:
+            values = [cursor.execute(f"PRAGMA {name}").fetchone()[0] for name in ("journal_mode", "synchronous")]
+            self.assertEqual(values + [cursor.execute("PRAGMA cache_size").fetchone()[0]], ["wal", 1, -2048])
+
+    def write_blocked(self, wrapper):
+        """
+        Whether another connection is refused a write while ``wrapper`` has
+        begun a transaction but only read so far.
+        """
+        with wrapper.cursor() as cursor:
+            cursor.execute("CREATE TABLE item (id INTEGER)")
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        try:
+            with wrapper.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM item")
+            try:
+                with other:
+                    other.execute("INSERT INTO item VALUES (1)")
+            except sqlite3.OperationalError as error:
+                self.assertEqual(str(error), "database is locked")
+                return True
+            return False
+        finally:
+            wrapper.rollback()
+            wrapper.set_autocommit(True)
+
+    def test_transaction_mode(self):
+        pragmas = {"journal_mode": "WAL"}
+        self.assertFalse(self.write_blocked(self.make_connection(pragmas=pragmas)))
+        self.assertTrue(self.write_blocked(self.make_connection(transaction_mode="immediate", pragmas=pragmas)))
+
+    def test_invalid_transaction_mode(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.make_connection(transaction_mode="EVENTUALLY").get_connection_params()
+
+
+class RetryOnBusyTests(TransactionTestCase):
+    def setUp(self):
+        patcher = mock.patch("user.db.time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def failing(self, *errors):
+        calls = []
+
+        @retry_on_busy(attempts=3, base_delay=0.01)
+        def work():
+            calls.append(connections[DEFAULT_DB_ALIAS].in_atomic_block)
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return "done"
+
+        return work, calls
+
+    def test_retries_when_locked(self):
+        work, calls = self.failing(OperationalError("database is locked"), OperationalError("database is locked"))
+        self.assertEqual(work(), "done")
+        self.assertEqual(calls, [True, True, True])
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_gives_up(self):
+        work, calls = self.failing(*[OperationalError("database table is locked")] * 3)
+        with self.assertRaises(OperationalError):
+            work()
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_not_retried(self):
+        work, calls = self.failing(OperationalError("no such table: item"))
+        with self.assertRaises(OperationalError):
+            work()
+        self.assertEqual(len(calls), 1)
+        self.sleep.assert_not_called()
+
+    def test_runs_once_inside_atomic(self):
+        work, calls = self.failing(OperationalError("database is locked"))
+        with self.assertRaises(OperationalError):
+            with transaction.atomic():
+                work()
+        self.assertEqual(len(calls), 1)
+        self.sleep.assert_not_called()
+
+
+class PrimaryReplicaRouterTests(TransactionTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.router.replicas = ["replica_1"]
+
+    def test_routing(self):
+        self.assertEqual(self.router.db_for_read(Post), DEFAULT_DB_ALIAS)
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), "replica_1")
+            self.assertEqual(self.router.db_for_write(Post), DEFAULT_DB_ALIAS)
+            with replica_reads(False):
+                self.assertEqual(self.router.db_for_read(Post), DEFAULT_DB_ALIAS)
+            with transaction.atomic():
+                self.assertEqual(self.router.db_for_read(Post), DEFAULT_DB_ALIAS)
+            self.assertEqual(self.router.db_for_read(Post), "replica_1")
+
+    def test_no_replicas(self):
+        self.router.replicas = []
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), DEFAULT_DB_ALIAS)
+
+
+class ReplicaReadRequestTests(APITestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(email="user@example.com", password="password")
+        cls.other = User.objects.create_user(email="other@example.com", password="password")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch("user.views.replica_reads", wraps=replica_reads)
+        self.replica_reads = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def uses_replica(self, method, path):
+        self.replica_reads.reset_mock()
+        response = getattr(self.client, method)(path)
+        self.assertLess(response.status_code, 300)
+        return self.replica_reads.called
+
+    def test_safe_requests_use_replica(self):
+        self.assertTrue(self.uses_replica("get", "/api/v1/user/users/"))
+        self.assertTrue(self.uses_replica("get", f"/api/v1/user/users/{self.other.pk}/"))
+        self.assertTrue(self.uses_replica("get", "/api/v1/user/followers/"))
+
+    def test_writes_pin_to_primary(self):
+        self.assertFalse(self.uses_replica("post", f"/api/v1/user/follow/{self.other.pk}/"))
+        self.assertTrue(cache.get(primary_pin_key(self.user.pk)))
+        self.assertFalse(self.uses_replica("get", "/api/v1/user/followings/"))
+        # Other users are not pinned by this user's write.
+        self.client.force_authenticate(self.other)
+        self.assertTrue(self.uses_replica("get", "/api/v1/user/followers/"))
+
+        cache.delete(primary_pin_key(self.user.pk))
+        self.client.force_authenticate(self.user)
+        self.assertTrue(self.uses_replica("get", "/api/v1/user/followings/"))
+
+    def test_failed_writes_do_not_pin(self):
+        self.assertEqual(self.client.post("/api/v1/user/follow/0/").status_code, 404)
+        self.assertIsNone(cache.get(primary_pin_key(self.user.pk)))
+
+
+class PrecomputedSchemaTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.content = json.dumps({"openapi": "3.0.3", "paths": {"/precomputed/": {}}}).encode()
+        (self.directory / "openapi-1.0.0.json").write_bytes(self.content)
+        schema._documents.clear()
+        self.addCleanup(schema._documents.clear)
+        self.enterContext(override_settings(OPENAPI_SCHEMA_DIR=self.directory, OPENAPI_SCHEMA_LIVE=False))
+        # Keep the generator's warnings about unrelated views out of the output.
+        self.enterContext(GENERATOR_STATS.silence())
+
+    def get(self, **headers):
+        return self.client.get("/api/schema/?format=json", **headers)
+
+    def test_precompressed_body(self):
+        plain = self.get()
+        self.assertEqual(plain.status_code, 200)
+        self.assertEqual(plain.content, self.content)
+        self.assertFalse(plain.has_header("Content-Encoding"))
+
+        response = self.get(HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.content)
+        self.assertEqual(response["ETag"], plain["ETag"])
+        self.assertEqual(response["Vary"], "Accept, Accept-Encoding")
+
+    def test_etag_revalidation(self):
+        etag = self.get()["ETag"]
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_missing_file_generated_once(self):
+        (self.directory / "openapi-1.0.0.json").unlink()
+        with self.assertLogs("user.schema", "WARNING"):
+            first = self.get()
+        self.assertIn("/api/v1/user/posts/", json.loads(first.content)["paths"])
+        with mock.patch("user.schema.generate_schema") as generate_schema:
+            self.assertEqual(self.get().content, first.content)
+        generate_schema.assert_not_called()
+
+    def test_live(self):
+        with override_settings(OPENAPI_SCHEMA_LIVE=True):
+            response = self.get()
+        self.assertIn("/api/v1/user/posts/", json.loads(response.content)["paths"])
+        self.assertFalse(response.has_header("ETag"))
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+        self.on_sleep = None
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        if self.on_sleep:
+            self.on_sleep()
+
+
+class CachedTests(SimpleTestCase):
+    config = {
+        "STALE_SECONDS": 300,
+        "JITTER": 0.1,
+        "BETA": 1.0,
+        "LOCK_SECONDS": 30,
+        "WAIT_SECONDS": 1.0,
+        "POLL_SECONDS": 0.1,
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        self.random = mock.Mock(random=mock.Mock(return_value=0.0), uniform=mock.Mock(return_value=0.0))
+        for target, value in (("user.caching.time", self.clock), ("user.caching.random", self.random)):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.calls = 0
+
+    def compute(self):
+        # Each computation takes two (fake) seconds.
+        self.calls += 1
+        self.clock.now += 2
+        return self.calls
+
+    def get(self):
+        return cached("key", self.compute, 60, self.config)
+
+    def test_hit_until_expiry(self):
+        self.assertEqual(self.get(), 1)
+        self.clock.now += 59
+        self.assertEqual(self.get(), 1)
+        self.clock.now += 1
+        self.assertEqual(self.get(), 2)
+        self.assertIsNone(cache.get("key:lock"))
+
+    def test_ttl_jittered(self):
+        self.random.uniform.return_value = -0.1
+        self.get()
+        self.clock.now += 54
+        self.assertEqual(self.get(), 2)
+        self.random.uniform.assert_called_with(-0.1, 0.1)
+
+    def test_early_refresh(self):
+        self.get()
+        self.clock.now += 50
+        # 10s before expiry: -2 * log(1 - r) reaches 10 only for r > 0.993.
+        self.random.random.return_value = 0.99
+        self.assertEqual(self.get(), 1)
+        self.random.random.return_value = 0.995
+        self.assertEqual(self.get(), 2)
+
+    def test_stale_served_while_locked(self):
+        self.get()
+        self.clock.now += 60
+        cache.add("key:lock", 1)
+        self.assertEqual(self.get(), 1)
+        self.assertEqual(self.calls, 1)
+        cache.delete("key:lock")
+        self.assertEqual(self.get(), 2)
+
+    def test_miss_waits_for_lock_holder(self):
+        cache.add("key:lock", 1)
+        sleeps = []
+
+        def holder_finishes():
+            sleeps.append(self.clock.now)
+            if len(sleeps) == 3:
+                cache.set("key", ("theirs", self.clock.now + 60, 1.0))
+
+        self.clock.on_sleep = holder_finishes
+        self.assertEqual(self.get(), "theirs")
+        self.assertEqual(self.calls, 0)
+
+    def test_miss_computes_after_wait(self):
+        cache.add("key:lock", 1)
+        start = self.clock.now
+        self.assertEqual(self.get(), 1)
+        self.assertGreaterEqual(self.clock.now - 2, start + self.config["WAIT_SECONDS"])
+        self.assertEqual(cache.get("key:lock"), 1)
+
+    def test_lock_released_on_error(self):
+        with self.assertRaises(ZeroDivisionError):
+            cached("key", lambda: 1 / 0, 60, self.config)
+        self.assertIsNone(cache.get("key:lock"))
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    body = json.dumps([{"content": "post"}] * 200).encode()
+
+    def process(self, response, accept_encoding="gzip"):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def json_response(self, **kwargs):
+        return HttpResponse(self.body, content_type="application/json", **kwargs)
+
+    def test_gzip_negotiated(self):
+        for accept_encoding in ("gzip", "br, gzip;q=0.5", "x-gzip"):
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.process(self.json_response(), accept_encoding)
+                self.assertEqual(response["Content-Encoding"], "gzip")
+                self.assertEqual(response["Vary"], "Accept-Encoding")
+                self.assertEqual(gzip.decompress(response.content), self.body)
+
+    def test_gzip_refused(self):
+        for accept_encoding in ("", "br", "gzip;q=0", "*"):
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.process(self.json_response(), accept_encoding)
+                self.assertFalse(response.has_header("Content-Encoding"))
+                self.assertEqual(response["Vary"], "Accept-Encoding")
+                self.assertEqual(response.content, self.body)
+
+    def test_streaming_compressed(self):
+        response = self.process(StreamingHttpResponse(iter([self.body, b"\n"]), content_type="application/x-ndjson"))
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), self.body + b"\n")
+
+    def test_left_alone(self):
+        already_encoded = self.json_response()
+        already_encoded["Content-Encoding"] = "gzip"
+        for name, response in (
+            ("small", HttpResponse(b"[]", content_type="application/json")),
+            ("other type", HttpResponse(self.body, content_type="image/png")),
+            ("partial", self.json_response(status=206)),
+            ("encoded", already_encoded),
+            ("event stream", StreamingHttpResponse(iter([b"data: 1\n\n"]), content_type="text/event-stream")),
+        ):
+            with self.subTest(name):
+                content_encoding = response.get("Content-Encoding")
+                response = self.process(response)
+                self.assertEqual(response.get("Content-Encoding"), content_encoding)
+                self.assertFalse(response.has_header("Vary"))
+
+
+@override_settings(RANKING={"BASE_SCORE": 1.0, "LIKE_WEIGHT": 1.0, "FOLLOWER_WEIGHT": 0.1, "HALF_LIFE_HOURS": 24.0})
+class RankingTests(TestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.author = User.objects.create_user(email="author@example.com", password="password")
+        cls.readers = [User.objects.create_user(email=f"reader{i}@example.com", password="password") for i in range(2)]
+
+    def create_post(self, author=None, hours=0, engagement=None, now=None):
+        post = Post.objects.create(author=author or self.author, content="post")
+        changes = {"created_at": (now or django_timezone.now()) - timedelta(hours=hours)}
+        if engagement is not None:
+            changes.update(engagement=engagement, score=engagement * 0.5 ** (hours / 24))
+        Post._base_manager.using(post._state.db).filter(pk=post.pk).update(**changes)
+        post.refresh_from_db()
+        return post
+
+    def scores(self, *posts):
+        for post in posts:
+            post.refresh_from_db()
+        return [(round(post.engagement, 6), round(post.score, 6)) for post in posts]
+
+    def test_on_publish(self):
+        for reader in self.readers:
+            UserFollowing.objects.create(user_id=reader, following_user_id=self.author)
+        post = self.create_post()
+        ranking.on_publish(post)
+        self.assertEqual(self.scores(post), [(1.2, 1.2)])
+
+    def test_on_like(self):
+        post = self.create_post(hours=24, engagement=2)
+        ranking.on_like(post)
+        self.assertEqual(self.scores(post), [(3, 1.5)])
+        ranking.on_like(post, delta=-1)
+        self.assertEqual(self.scores(post), [(2, 1)])
+
+    def test_on_follow(self):
+        recent = self.create_post(hours=24, engagement=2)
+        expired = self.create_post(hours=24 * 15, engagement=2)
+        ranking.on_follow(self.author.pk)
+        self.assertEqual(self.scores(recent), [(2.1, 1.05)])
+        self.assertEqual(self.scores(expired), [(2, round(2 * 0.5**15, 6))])
+        ranking.on_follow(self.author.pk, delta=-1)
+        self.assertEqual(self.scores(recent), [(2, 1)])
+
+    def test_decay_scores(self):
+        now = django_timezone.now()
+        posts = [self.create_post(hours=hours, engagement=8, now=now) for hours in (0, 24, 36, 24 * 15)]
+        Post._base_manager.using(posts[0]._state.db).filter(pk=posts[0].pk).update(score=1)
+        ranking.decay_scores(now=now)
+        self.assertEqual([score for _, score in self.scores(*posts)], [8, 4, round(8 * 0.5**1.5, 6), 0])
+
+    def test_ranked_order(self):
+        other = self.readers[1]
+        UserFollowing.objects.create(user_id=self.readers[0], following_user_id=other)
+        high = self.create_post(engagement=10)
+        followed = self.create_post(author=other, engagement=8)
+        low = self.create_post(engagement=5)
+        self.create_post(engagement=0)
+        self.assertEqual(ranking.ranked_post_ids(Post.objects.all(), self.author), [high.pk, followed.pk, low.pk])
+        # Posts by followed authors get the affinity boost.
+        self.assertEqual(ranking.ranked_post_ids(Post.objects.all(), self.readers[0]), [followed.pk, high.pk, low.pk])
+        self.assertEqual(ranking.ranked_post_ids(Post.objects.all(), self.author, limit=1), [high.pk])
+
+
+class AccountExportTests(APITestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(email="user@example.com", password="password", username="user")
+        cls.others = [User.objects.create_user(email=f"other{i}@example.com", password="password") for i in range(2)]
+        cls.posts = [Post.objects.create(author=cls.user, content=f"#tag{i} post {i}") for i in range(3)]
+        cls.posts[0].hashtag.add(*get_or_create_hashtags(["tag0", "extra"]))
+        ArchivedPost.objects.create(
+            id=1000,
+            author=cls.user,
+            content="archived",
+            created_at=django_timezone.now(),
+            updated_at=django_timezone.now(),
+        )
+        cls.liked = [Post.objects.create(author=other, content="liked") for other in cls.others]
+        for post in cls.liked:
+            post.likes.add(cls.user)
+        UserFollowing.objects.create(user_id=cls.user, following_user_id=cls.others[0])
+        UserFollowing.objects.create(user_id=cls.others[1], following_user_id=cls.user)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def export(self, query=""):
+        response = self.client.get(f"/api/v1/user/export/{query}")
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content)
+
+    def test_ndjson(self):
+        response, content = self.export()
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(response["Content-Disposition"], f'attachment; filename="account-{self.user.pk}.ndjson"')
+        self.assertTrue(content.endswith(b"\n"))
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(records[0]["type"], "user")
+        self.assertEqual(records[0]["email"], "user@example.com")
+
+        by_type = {}
+        for record in records[1:]:
+            by_type.setdefault(record.pop("type"), []).append(record)
+        posts = by_type["post"]
+        self.assertEqual([post["id"] for post in posts], [post.pk for post in self.posts] + [1000])
+        self.assertEqual(sorted(posts[0]["hashtags"]), ["extra", "tag0"])
+        self.assertEqual(posts[-1]["content"], "archived")
+        self.assertEqual([following["user_id"] for following in by_type["following"]], [self.others[0].pk])
+        self.assertEqual([follower["user_id"] for follower in by_type["follower"]], [self.others[1].pk])
+        self.assertEqual(sorted(like["post_id"] for like in by_type["like"]), sorted(post.pk for post in self.liked))
+
+        # Reading in chunks of one row does not change the output.
+        self.assertEqual(b"".join(iter_account_export(self.user, chunk_size=1)), content)
+
+    def test_gzip(self):
+        _, content = self.export()
+        response, compressed = self.export("?compress=gzip")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(response["Content-Disposition"], f'attachment; filename="account-{self.user.pk}.ndjson.gz"')
+        self.assertEqual(gzip.decompress(compressed), content)
+
+
+class AccountDeletionTests(APITestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(email="user@example.com", password="password")
+        cls.other = User.objects.create_user(email="other@example.com", password="password")
+        cls.posts = [Post.objects.create(author=cls.other, content=f"post {i}") for i in range(3)]
+        cls.own_post = Post.objects.create(author=cls.user, content="own post")
+        ArchivedPost.objects.create(
+            id=1000,
+            author=cls.user,
+            content="archived",
+            created_at=django_timezone.now(),
+            updated_at=django_timezone.now(),
+        )
+        for post in cls.posts:
+            Post._base_manager.using(post._state.db).filter(pk=post.pk).update(engagement=4, score=2)
+            post.likes.add(cls.user)
+
+    def tearDown(self):
+        post_counters.flush()
+
+    def engagement(self):
+        posts = [Post._base_manager.using(post._state.db).get(pk=post.pk) for post in self.posts]
+        return sorted((post.engagement, post.score) for post in posts)
+
+    def test_soft_deleted_posts_hidden(self):
+        soft_delete_user(self.user)
+        self.assertNotIn("JOIN", str(Post.objects.all().query))
+        self.assertEqual(Post.objects.for_author(self.user.pk).count(), 0)
+        self.assertEqual(ArchivedPost.objects.filter(author=self.user).count(), 0)
+        self.client.force_authenticate(self.other)
+        response = self.client.get("/api/v1/user/posts/?fields=content")
+        self.assertEqual(sorted(post["content"] for post in response.json()), ["post 0", "post 1", "post 2"])
+
+    @override_settings(RANKING={"LIKE_WEIGHT": 1.0})
+    def test_purge_resumes(self):
+        soft_delete_user(self.user)
+        likes = dict(purge_steps(self.user.pk, batch_size=2))["likes"]
+        # An interrupted purge leaves whole batches done, with their posts'
+        # engagement already reduced.
+        self.assertEqual(likes(), 2)
+        self.assertEqual(self.engagement(), [(3, 1.5), (3, 1.5), (4, 2)])
+        likes_left = [
+            Post.likes.through.objects.using(post._state.db).filter(user_id=self.user.pk) for post in self.posts
+        ]
+        self.assertEqual(len({like.pk for queryset in likes_left for like in queryset}), 1)
+
+        totals = purge_user(self.user.pk, batch_size=2)
+        self.assertEqual((totals["likes"], totals["posts"], totals["archived posts"]), (1, 1, 1))
+        self.assertEqual(self.engagement(), [(3, 1.5)] * 3)
+        self.assertFalse(get_user_model().all_objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Post._base_manager.using(self.own_post._state.db).filter(author_id=self.user.pk).exists())
+
+
+class HashtagExtractionTests(SimpleTestCase):
+    def test_normalize(self):
+        for name, expected in (
+            ("#Python", "python"),
+            ("  #ＰＹＴＨＯＮ ", "python"),
+            ("Straße", "strasse"),
+            ("Café", "café"),
+            ("x" * (HASHTAG_MAX_LENGTH + 5), "x" * HASHTAG_MAX_LENGTH),
+        ):
+            with self.subTest(name=name):
+                self.assertEqual(normalize_hashtag(name), expected)
+
+    def test_extract(self):
+        text = "#Python and #python, (#Django) #日本語 #नमस्ते #2026 a#b &#35; /#path ##double #café."
+        self.assertEqual(extract_hashtags(text), ["python", "django", "日本語", "नमस्ते", "café"])
+        self.assertEqual(extract_hashtags(None), [])
+
+
+class PostHashtagTests(APITestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.admin = User.objects.create_superuser(email="admin@example.com", password="password")
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def tags(self, post_id):
+        return sorted(Post.objects.locate(pk=post_id).hashtag.values_list("name", flat=True))
+
+    def test_content_edit_replaces_extracted_tags(self):
+        response = self.client.post(
+            "/api/v1/user/posts/", {"content": "#Old #kept text", "hashtag": [{"name": "Manual"}]}, format="json"
+        )
+        post_id = Post.objects.for_author(self.admin.pk).get().pk
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.tags(post_id), ["kept", "manual", "old"])
+
+        response = self.client.patch(f"/api/v1/user/posts/{post_id}/", {"content": "#New #kept"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.tags(post_id), ["kept", "manual", "new"])
+
+        self.client.patch(f"/api/v1/user/posts/{post_id}/", {"content": "no tags"}, format="json")
+        self.assertEqual(self.tags(post_id), ["manual"])
+
+
+class BackfillHashtagsTests(TransactionTestCase):
+    """
+    A TransactionTestCase, as the command reads posts in worker threads.
+    """
+
+    databases = "__all__"
+
+    def test_backfill(self):
+        author = get_user_model().objects.create_user(email="author@example.com", password="password")
+        posts = Post.objects.bulk_create(
+            [Post(author=author, content=content) for content in ("#one #Two", "none", "#two again", "#three")]
+        )
+        posts[0].hashtag.add(*get_or_create_hashtags(["one"]))
+        stdout = StringIO()
+        call_command("backfill_hashtags", chunk_size=2, workers=2, stdout=stdout)
+        self.assertIn("Backfilled hashtags for 3 posts.", stdout.getvalue())
+        tags = [sorted(post.hashtag.values_list("name", flat=True)) for post in posts]
+        self.assertEqual(tags, [["one", "two"], [], ["two"], ["three"]])
+        self.assertEqual(Hashtag.objects.count(), 3)
+
+
+class UploadTests(APITestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser(email="admin@example.com", password="password")
+        image = BytesIO()
+        Image.new("RGB", (16, 16), "red").save(image, "PNG")
+        cls.image = image.getvalue()
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = Path(media_root.name)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root, UPLOADS={"CHUNK_SIZE": 32}))
+        self.client.force_authenticate(self.user)
+
+    def create_upload(self, content=None):
+        content = content or self.image
+        response = self.client.post(
+            "/api/v1/user/uploads/",
+            {"filename": "a.png", "size": len(content), "checksum": hashlib.sha256(content).hexdigest()},
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def put_chunk(self, upload, index, data=None, checksum=None):
+        data = self.image[index * 32 : (index + 1) * 32] if data is None else data
+        return self.client.put(
+            f"/api/v1/user/uploads/{upload['id']}/chunks/{index}/",
+            data,
+            content_type="application/octet-stream",
+            HTTP_UPLOAD_CHECKSUM=f"sha256 {checksum or hashlib.sha256(data).hexdigest()}",
+        )
+
+    def upload_image(self):
+        upload = self.create_upload()
+        for index in range(upload["chunk_count"]):
+            self.assertEqual(self.put_chunk(upload, index).status_code, 200)
+        self.assertEqual(self.client.post(f"/api/v1/user/uploads/{upload['id']}/complete/").status_code, 200)
+        return upload
+
+    def test_resume(self):
+        upload = self.create_upload()
+        self.assertEqual(upload["chunk_count"], -(-len(self.image) // 32))
+        last = upload["chunk_count"] - 1
+        self.assertEqual(self.put_chunk(upload, last).data["received_chunks"], [last])
+        self.assertEqual(self.put_chunk(upload, 0).data["received_chunks"], [0, last])
+
+        response = self.client.post(f"/api/v1/user/uploads/{upload['id']}/complete/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([int(index) for index in response.json()["missing_chunks"]], list(range(1, last)))
+
+        # A client resuming asks which chunks arrived and sends the rest.
+        received = self.client.get(f"/api/v1/user/uploads/{upload['id']}/").data["received_chunks"]
+        for index in set(range(upload["chunk_count"])) - set(received):
+            self.put_chunk(upload, index)
+        response = self.client.post(f"/api/v1/user/uploads/{upload['id']}/complete/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["completed"])
+        stored = Upload.objects.get(pk=upload["id"])
+        self.assertEqual(stored.file.read(), self.image)
+        self.assertFalse((self.media_root / "upload_chunks" / upload["id"]).exists())
+
+    def test_checksum_mismatch_rejected(self):
+        upload = self.create_upload()
+        response = self.put_chunk(upload, 0, checksum=hashlib.sha256(b"other").hexdigest())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.put_chunk(upload, 0, checksum="abc").status_code, 400)
+        self.assertEqual(list((self.media_root / "upload_chunks" / upload["id"]).iterdir()), [])
+        self.assertEqual(self.client.get(f"/api/v1/user/uploads/{upload['id']}/").data["received_chunks"], [])
+
+    def test_wrong_length_rejected(self):
+        upload = self.create_upload()
+        for index, data in ((0, self.image[:31]), (0, self.image[:33]), (upload["chunk_count"] - 1, self.image[:32])):
+            with self.subTest(index=index, length=len(data)):
+                response = self.put_chunk(upload, index, data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("exactly", response.data["detail"])
+        self.assertEqual(self.put_chunk(upload, upload["chunk_count"]).status_code, 400)
+
+    def test_whole_file_checksum_checked(self):
+        upload = self.create_upload()
+        Upload.objects.filter(pk=upload["id"]).update(checksum=hashlib.sha256(b"other").hexdigest())
+        for index in range(upload["chunk_count"]):
+            self.put_chunk(upload, index)
+        response = self.client.post(f"/api/v1/user/uploads/{upload['id']}/complete/")
+        self.assertEqual(response.status_code, 400)
+
+    def test_attach_then_delete(self):
+        upload = self.upload_image()
+        file_name = Upload.objects.get(pk=upload["id"]).file.name
+        response = self.client.post("/api/v1/user/posts/", {"content": "post", "image_upload": upload["id"]})
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.for_author(self.user.pk).get()
+        self.assertEqual(post.image.name, file_name)
+        # Attaching consumes the upload but the post keeps the file.
+        self.assertFalse(Upload.objects.filter(pk=upload["id"]).exists())
+        self.assertEqual(self.client.delete(f"/api/v1/user/uploads/{upload['id']}/").status_code, 404)
+        self.assertTrue((self.media_root / file_name).is_file())
+        response = self.client.post("/api/v1/user/posts/", {"content": "again", "image_upload": upload["id"]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_delete_unattached(self):
+        upload = self.upload_image()
+        file_name = Upload.objects.get(pk=upload["id"]).file.name
+        self.assertEqual(self.client.delete(f"/api/v1/user/uploads/{upload['id']}/").status_code, 204)
+        self.assertFalse((self.media_root / file_name).exists())
+
+
+class AdminHelperTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = [User.objects.create_user(email=f"user{i}@example.com", password="password") for i in range(5)]
+        UserFollowing.objects.bulk_create(
+            [UserFollowing(user_id=cls.users[0], following_user_id=user) for user in cls.users[1:]]
+        )
+
+    def statements(self, queries, verb):
+        return [query["sql"] for query in queries if query["sql"].startswith(verb)]
+
+    def test_update_in_chunks(self):
+        queryset = get_user_model().objects.filter(pk__in=[user.pk for user in self.users])
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+            self.assertEqual(update_in_chunks(queryset, chunk_size=2, is_active=False), 5)
+        self.assertEqual(len(self.statements(queries, "UPDATE")), 3)
+        self.assertFalse(queryset.filter(is_active=True).exists())
+
+    def test_delete_in_chunks(self):
+        queryset = UserFollowing.objects.filter(user_id=self.users[0])
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+            self.assertEqual(delete_in_chunks(queryset, chunk_size=3), 4)
+        self.assertEqual(len(self.statements(queries, "DELETE")), 2)
+        self.assertFalse(queryset.exists())
+
+    def test_estimated_count(self):
+        User = get_user_model()
+        User.objects.filter(pk__in=[user.pk for user in self.users[:2]]).delete()
+
+        class LowThresholdPaginator(EstimatedCountPaginator):
+            exact_count_threshold = 1
+
+        # Without statistics the estimate is the largest rowid.
+        self.assertEqual(LowThresholdPaginator(User.all_objects.order_by("pk"), 10).count, self.users[-1].pk)
+        self.assertEqual(EstimatedCountPaginator(User.all_objects.order_by("pk"), 10).count, 3)
+        filtered = User.all_objects.filter(is_active=True).order_by("pk")
+        self.assertEqual(LowThresholdPaginator(filtered, 10).count, 3)
+
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.assertEqual(estimate_row_count(User), 3)
+
+
+class AdminTests(TestCase):
+    """
+    Runs against sharded posts as well when POST_SHARDS is set.
+    """
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.admin = User.objects.create_superuser(email="admin@example.com", password="password")
+        cls.authors = [User.objects.create_user(email=f"author{i}@example.com", password="password") for i in range(2)]
+        cls.posts = [Post.objects.create(author=author, content=f"post by {author.pk}") for author in cls.authors]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist_url(self, post):
+        query = f"?shard={post._state.db}" if post_shards() else ""
+        return f"/admin/user/post/{query}"
+
+    def test_post_changelist(self):
+        for post in self.posts:
+            with self.subTest(post=post.pk):
+                response = self.client.get(self.changelist_url(post))
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, f"/admin/user/post/{post.pk}/change/")
+
+    def test_post_search(self):
+        for post, author in zip(self.posts, self.authors):
+            for term in (author.email.upper(), str(post.pk)):
+                with self.subTest(term=term):
+                    response = self.client.get(
+                        self.changelist_url(post) + ("&" if post_shards() else "?") + f"q={term}"
+                    )
+                    self.assertEqual([result.pk for result in response.context["cl"].result_list], [post.pk])
+
+    def test_post_change_and_actions(self):
+        for post in self.posts:
+            with self.subTest(post=post.pk):
+                url = f"/admin/user/post/{post.pk}/change/"
+                self.assertContains(self.client.get(url), post.content)
+                response = self.client.post(
+                    self.changelist_url(post), {"action": "publish_posts", "_selected_action": [post.pk]}
+                )
+                self.assertEqual(response.status_code, 302)
+                self.assertTrue(Post.objects.locate(pk=post.pk).is_published)
+                self.assertEqual(self.client.get(f"/admin/user/post/{post.pk}/history/").status_code, 200)
+
+    def test_post_delete(self):
+        post = self.posts[1]
+        self.assertEqual(self.client.get(f"/admin/user/post/{post.pk}/delete/").status_code, 200)
+        self.assertEqual(self.client.post(f"/admin/user/post/{post.pk}/delete/", {"post": "yes"}).status_code, 302)
+        self.assertIsNone(Post.objects.locate(pk=post.pk))
+        self.assertEqual(self.client.get("/admin/user/post/0/change/").status_code, 302)
+
+    def test_user_delete_action_soft_deletes(self):
+        response = self.client.get("/admin/user/user/")
+        actions = [name for name, _ in response.context["action_form"].fields["action"].choices]
+        self.assertNotIn("delete_selected", actions)
+        self.assertIn("soft_delete_users", actions)
+
+        author = self.authors[0]
+        response = self.client.post(
+            "/admin/user/user/", {"action": "soft_delete_users", "_selected_action": [author.pk]}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNotNone(get_user_model().all_objects.get(pk=author.pk).deleted_at)
+        self.assertTrue(HiddenAuthor.objects.filter(user_id=author.pk).exists())
+        self.assertFalse(Post.objects.for_author(author.pk).exists())
+
+
+class ServeMediaTests(SimpleTestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = Path(media_root.name)
+        (self.media_root / "post_image").mkdir()
+        (self.media_root / "post_image" / "a.jpg").write_bytes(b"image")
+        (self.media_root / "upload_chunks" / "1").mkdir(parents=True)
+        (self.media_root / "upload_chunks" / "1" / "0").write_bytes(b"chunk")
+        media_settings = override_settings(MEDIA_ROOT=self.media_root, UPLOADS={})
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def get(self, path, **headers):
+        return serve_media(RequestFactory().get(f"/media/{path}", **headers), path)
+
+    def get_range(self, byte_range, path="post_image/a.jpg", **headers):
+        response = self.get(path, HTTP_RANGE=byte_range, **headers)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def test_serves_media(self):
+        response = self.get("post_image/a.jpg")
+        self.assertEqual(b"".join(response.streaming_content), b"image")
+        response.close()
+
+    def test_refuses_upload_chunks(self):
+        for path in ("upload_chunks/1/0", "post_image/../upload_chunks/1/0"):
+            with self.subTest(path=path), self.assertRaises(Http404):
+                self.get(path)
+
+    def test_refuses_configured_temp_dir(self):
+        with override_settings(UPLOADS={"TEMP_DIR": self.media_root / "post_image"}), self.assertRaises(Http404):
+            self.get("post_image/a.jpg")
+
+    def test_ranges(self):
+        for byte_range, status, body, content_range in (
+            ("bytes=1-2", 206, b"ma", "bytes 1-2/5"),
+            ("bytes=2-", 206, b"age", "bytes 2-4/5"),
+            ("bytes=3-100", 206, b"ge", "bytes 3-4/5"),
+            ("bytes=-2", 206, b"ge", "bytes 3-4/5"),
+            ("bytes=-10", 206, b"image", "bytes 0-4/5"),
+            ("bytes=0-0,2-3", 200, b"image", None),
+            ("items=0-1", 200, b"image", None),
+        ):
+            with self.subTest(byte_range=byte_range):
+                response, content = self.get_range(byte_range)
+                self.assertEqual((response.status_code, content), (status, body))
+                self.assertEqual(response.get("Content-Range"), content_range)
+                self.assertEqual(response["Content-Length"], str(len(body)))
+
+    def test_unsatisfiable_ranges(self):
+        (self.media_root / "post_image" / "empty.jpg").write_bytes(b"")
+        for path, byte_range in (
+            ("post_image/a.jpg", "bytes=5-"),
+            ("post_image/a.jpg", "bytes=3-1"),
+            ("post_image/a.jpg", "bytes=-0"),
+            ("post_image/empty.jpg", "bytes=0-"),
+            ("post_image/empty.jpg", "bytes=-5"),
+        ):
+            with self.subTest(path=path, byte_range=byte_range):
+                response, content = self.get_range(byte_range, path)
+                size = (self.media_root / path).stat().st_size
+                self.assertEqual((response.status_code, content), (416, b""))
+                self.assertEqual(response["Content-Range"], f"bytes */{size}")
+
+    def test_if_range(self):
+        response = self.get("post_image/a.jpg")
+        response.close()
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+        for if_range, status in ((etag, 206), (last_modified, 206), ('"stale"', 200), ("W/" + etag, 200)):
+            with self.subTest(if_range=if_range):
+                response, _ = self.get_range("bytes=-2", HTTP_IF_RANGE=if_range)
+                self.assertEqual(response.status_code, status)
+
+    def test_route_enabled_by_setting(self):
+        import config.urls
+
+        def media_routed(enabled):
+            with override_settings(MEDIA_SERVING={"ENABLED": enabled}):
+                return any(
+                    getattr(pattern, "name", None) == "media" for pattern in importlib.reload(config.urls).urlpatterns
+                )
+
+        self.addCleanup(clear_url_caches)
+        self.addCleanup(importlib.reload, config.urls)
+        self.assertTrue(media_routed(True))
+        self.assertFalse(media_routed(False))
+
+
+TEST_SHARDS = ["test_posts_0", "test_posts_1"]
+
+
+@override_settings(POST_SHARDS=TEST_SHARDS)
+class PostShardingTests(TransactionTestCase):
+    """
+    Posts split across two shard databases set up for the test run, as
+    files in a temporary directory, next to the test default database.
+
+    A TransactionTestCase, as reads across shards run in worker threads
+    that cannot see another connection's open transaction.
+    """
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        for alias in TEST_SHARDS:
+            connections.settings[alias] = {
+                **copy.deepcopy(connections.settings[DEFAULT_DB_ALIAS]),
+                "NAME": str(Path(directory.name) / f"{alias}.sqlite3"),
+            }
+            cls.addClassCleanup(cls.remove_database, alias)
+        super().setUpClass()
+        for alias in TEST_SHARDS:
+            call_command("migrate", database=alias, verbosity=0, interactive=False)
+
+    @staticmethod
+    def remove_database(alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+    def setUp(self):
+        User = get_user_model()
+        self.users = [User.objects.create_user(email=f"user{i}@example.com", password="password") for i in range(4)]
+        self.shards = {user.pk: shard_for_author(user.pk) for user in self.users}
+
+    def shard_ids(self, alias):
+        return set(Post._base_manager.using(alias).values_list("id", flat=True))
+
+    def test_posts_and_links_routed_by_author(self):
+        self.assertEqual(len(set(self.shards.values())), 2)
+        tag = get_or_create_hashtags(["python"])[0]
+        for user in self.users:
+            post = Post.objects.create(author=user, content=f"post by {user.pk}")
+            post.likes.add(self.users[0])
+            post.hashtag.add(tag)
+            shard = self.shards[user.pk]
+            self.assertEqual(post._state.db, shard)
+            for alias in post_shards():
+                self.assertEqual(post.pk in self.shard_ids(alias), alias == shard)
+            Through = Post.likes.through
+            self.assertTrue(Through.objects.using(shard).filter(post_id=post.pk, user_id=self.users[0].pk).exists())
+            self.assertTrue(Post.hashtag.through.objects.using(shard).filter(post_id=post.pk).exists())
+            self.assertEqual(Post.objects.for_author(user.pk).db, shard)
+            self.assertEqual(Post.objects.locate(pk=post.pk)._state.db, shard)
+        self.assertFalse(self.shard_ids(DEFAULT_DB_ALIAS))
+
+    def test_ids_unique_across_shards(self):
+        Post._base_manager.using(self.shards[self.users[1].pk]).create(id=100, author_id=self.users[1].pk)
+        created = [Post.objects.create(author=user, content="single") for user in self.users]
+        bulk = Post.objects.bulk_create([Post(author=user, content="bulk") for user in self.users])
+        ids = [post.pk for post in created + bulk]
+        self.assertEqual(ids, list(range(101, 101 + len(ids))))
+        self.assertEqual(IdSequence.objects.get(name="post").value, ids[-1])
+        self.assertEqual(set().union(*(self.shard_ids(alias) for alias in post_shards())), {100, *ids})
+
+    def test_sharded_rows_merge_order(self):
+        posts = Post.objects.bulk_create([Post(author=user, content="post") for user in self.users * 3])
+        times = [datetime(2026, 1, 1 + index % 4, tzinfo=timezone.utc) for index in range(len(posts))]
+        for post, created_at in zip(posts, times):
+            Post._base_manager.using(self.shards[post.author_id]).filter(pk=post.pk).update(created_at=created_at)
+        expected = [
+            post.pk for _, post in sorted(zip(times, posts), key=lambda pair: (pair[0], pair[1].pk), reverse=True)
+        ]
+
+        rows = scatter_rows(Post.objects.values("id", "created_at"))
+        self.assertIsInstance(rows, ShardedRows)
+        self.assertEqual(rows.count(), len(posts))
+        self.assertEqual([row["id"] for row in rows[3:7]], expected[3:7])
+        self.assertEqual([row["id"] for row in rows], expected)
+
+    def test_only_new_hashtags_replicated(self):
+        get_or_create_hashtags(["python"])
+        for alias in post_shards():
+            self.assertEqual(list(Hashtag.objects.using(alias).values_list("name", flat=True)), ["python"])
+            with CaptureQueriesContext(connections[alias]) as queries:
+                get_or_create_hashtags(["python"])
+            self.assertEqual(len(queries), 0)
+        with CaptureQueriesContext(connections[post_shards()[0]]) as queries:
+            tags = get_or_create_hashtags(["python", "django"])
+        self.assertEqual(sorted(tag.name for tag in tags), ["django", "python"])
+        inserts = [query["sql"] for query in queries if query["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+        self.assertIn("django", inserts[0])
+        self.assertNotIn("python", inserts[0])
+
+    def test_soft_deleted_likes_hidden(self):
+        post = Post.objects.create(author=self.users[0], content="post")
+        post.likes.add(*self.users[1:])
+        soft_delete_user(self.users[2])
+        serializer = PostListFastSerializer(RequestFactory().get("/api/v1/user/posts/?fields=likes"))
+        rows = serializer.to_representation(serializer.get_rows(Post.objects.all()))
+        self.assertEqual(rows, [{"likes": [self.users[1].pk, self.users[3].pk]}])
+
+    def test_unhinted_post_queries_refused(self):
+        Post.objects.create(author=self.users[0], content="post")
+        with self.assertRaises(ShardRoutingError):
+            list(Post.objects.all())
+        with self.assertRaises(ShardRoutingError):
+            Post.likes.through.objects.count()
+        self.assertEqual(len(scatter_rows(Post.objects.all())), 1)
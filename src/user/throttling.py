@@ -0,0 +1,33 @@
+from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+
+
+class BatchAwareThrottleMixin:
+    """
+    Charges a batch request once per sub-request up front and lets the
+    sub-requests it dispatches through without touching the cache again.
+
+    Views can set ``get_throttle_cost(request)`` to charge more than one
+    request's worth of the rate.
+    """
+
+    def allow_request(self, request, view):
+        if getattr(request._request, "batch_parent", None) is not None:
+            return True
+        get_cost = getattr(view, "get_throttle_cost", None)
+        self.cost = max(1, get_cost(request)) if get_cost else 1
+        return super().allow_request(request, view)
+
+    def throttle_success(self):
+        if len(self.history) + self.cost > self.num_requests:
+            return self.throttle_failure()
+        self.history[:0] = [self.now] * self.cost
+        self.cache.set(self.key, self.history, self.duration)
+        return True
+
+
+class BatchAwareAnonRateThrottle(BatchAwareThrottleMixin, AnonRateThrottle):
+    pass
+
+
+class BatchAwareUserRateThrottle(BatchAwareThrottleMixin, UserRateThrottle):
+    pass
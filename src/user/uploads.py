@@ -0,0 +1,162 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from user.db import retry_on_busy
+from user.models import Upload
+
+DEFAULT_UPLOAD_SETTINGS = {
+    "CHUNK_SIZE": 4 * 1024 * 1024,
+    "MAX_SIZE": 50 * 1024 * 1024,
+    "EXPIRE_HOURS": 24,
+    "BLOCK_SIZE": 64 * 1024,
+    "TEMP_DIR": None,
+}
+
+CHECKSUM_HEADER = "Upload-Checksum"
+
+
+def get_upload_settings():
+    config = {**DEFAULT_UPLOAD_SETTINGS, **getattr(settings, "UPLOADS", {})}
+    config["TEMP_DIR"] = Path(config["TEMP_DIR"] or Path(settings.MEDIA_ROOT) / "upload_chunks")
+    return config
+
+
+def chunk_dir(upload):
+    return get_upload_settings()["TEMP_DIR"] / str(upload.id)
+
+
+def received_chunks(upload):
+    """
+    Indexes of the chunks stored so far. A chunk file only gets its final
+    name once its checksum has been verified, so listing the directory is
+    enough to resume.
+    """
+    directory = chunk_dir(upload)
+    if not directory.is_dir():
+        return []
+    return sorted(int(name) for name in os.listdir(directory) if name.isdigit())
+
+
+def expected_chunk_length(upload, index):
+    if index == upload.chunk_count - 1:
+        return upload.size - index * upload.chunk_size
+    return upload.chunk_size
+
+
+def parse_checksum(header):
+    algorithm, _, digest = (header or "").partition(" ")
+    if algorithm.lower() != "sha256" or len(digest) != 64:
+        raise ValidationError({"detail": f'{CHECKSUM_HEADER} must be "sha256 <hex digest>".'})
+    return digest.lower()
+
+
+def write_chunk(upload, index, stream, content_length, checksum_header):
+    """
+    Stream chunk ``index`` from ``stream`` to disk in ``BLOCK_SIZE`` reads,
+    hashing as it goes, and keep it only if its SHA-256 matches the
+    ``Upload-Checksum`` header. Re-sending a chunk replaces it.
+    """
+    if upload.completed_at is not None:
+        raise ValidationError({"detail": "Upload is already complete."})
+    if not 0 <= index < upload.chunk_count:
+        raise ValidationError({"detail": f"Chunk index must be between 0 and {upload.chunk_count - 1}."})
+    expected = expected_chunk_length(upload, index)
+    if content_length != expected:
+        raise ValidationError({"detail": f"Chunk {index} must be exactly {expected} bytes."})
+    checksum = parse_checksum(checksum_header)
+
+    config = get_upload_settings()
+    directory = chunk_dir(upload)
+    directory.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    received = 0
+    with tempfile.NamedTemporaryFile(dir=directory, suffix=".part", delete=False) as part:
+        try:
+            while received < expected:
+                block = stream.read(min(config["BLOCK_SIZE"], expected - received))
+                if not block:
+                    break
+                digest.update(block)
+                part.write(block)
+                received += len(block)
+        except BaseException:
+            os.unlink(part.name)
+            raise
+    if received != expected or digest.hexdigest() != checksum:
+        os.unlink(part.name)
+        raise ValidationError({"detail": f"Chunk {index} is incomplete or does not match its checksum."})
+    os.replace(part.name, directory / str(index))
+    return received_chunks(upload)
+
+
+def complete_upload(upload):
+    """
+    Concatenate the chunks into one file, check its size, optional
+    whole-file checksum and that it is an image, then store it in
+    ``upload.file`` and remove the chunks.
+    """
+    if upload.completed_at is not None:
+        return upload
+    missing = sorted(set(range(upload.chunk_count)) - set(received_chunks(upload)))
+    if missing:
+        raise ValidationError({"detail": "Upload is missing chunks.", "missing_chunks": missing[:100]})
+
+    directory = chunk_dir(upload)
+    block_size = get_upload_settings()["BLOCK_SIZE"]
+    digest = hashlib.sha256()
+    with tempfile.TemporaryFile(dir=directory) as assembled:
+        for index in range(upload.chunk_count):
+            with open(directory / str(index), "rb") as chunk:
+                while block := chunk.read(block_size):
+                    digest.update(block)
+                    assembled.write(block)
+        if upload.checksum and digest.hexdigest() != upload.checksum.lower():
+            raise ValidationError({"detail": "Assembled file does not match the upload checksum."})
+        assembled.seek(0)
+        try:
+            Image.open(assembled).verify()
+        except Exception:
+            raise ValidationError({"detail": "Upload is not a valid image."})
+        assembled.seek(0)
+        upload.file.save(upload.filename, File(assembled), save=False)
+
+    upload.completed_at = timezone.now()
+    retry_on_busy(upload.save)(update_fields=["file", "completed_at"])
+    shutil.rmtree(directory, ignore_errors=True)
+    return upload
+
+
+def discard_upload(upload):
+    """
+    Delete an upload with its chunks and, if it was never attached, its
+    assembled file.
+    """
+    shutil.rmtree(chunk_dir(upload), ignore_errors=True)
+    if upload.file:
+        upload.file.delete(save=False)
+    upload.delete()
+
+
+def prune_expired_uploads(now=None):
+    """
+    Discard uploads not attached to a post or profile within
+    ``EXPIRE_HOURS``, 500 at a time. Returns how many were removed.
+    """
+    now = now or timezone.now()
+    expired = Upload.objects.filter(created_at__lt=now - timedelta(hours=get_upload_settings()["EXPIRE_HOURS"]))
+    pruned = 0
+    while uploads := list(expired.order_by("created_at")[:500]):
+        for upload in uploads:
+            discard_upload(upload)
+        pruned += len(uploads)
+    return pruned
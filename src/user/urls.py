@@ -10,6 +10,11 @@ from user.views import (
     FollowersUsersViewSet,
     FollowCreateDestroyViewSet,
     PostListCreateUpdateDestroyViewSet,
+    AccountExportView,
+    NotificationViewSet,
+    UploadViewSet,
+    EventTicketView,
+    event_stream,
 )
 
 router = routers.DefaultRouter()
@@ -19,6 +24,8 @@ router.register("followings", FollowingUsersViewSet, basename="followings")
 router.register("followers", FollowersUsersViewSet, basename="followers")
 
 router.register("posts", PostListCreateUpdateDestroyViewSet, basename="posts")
+router.register("notifications", NotificationViewSet, basename="notifications")
+router.register("uploads", UploadViewSet, basename="uploads")
 
 
 urlpatterns = [
@@ -27,5 +34,8 @@ urlpatterns = [
     path("refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("register/", CreateUserView.as_view(), name="register"),
     path("logout/", LogoutUserView.as_view(), name="logout"),
+    path("export/", AccountExportView.as_view(), name="export"),
+    path("events/", event_stream, name="events"),
+    path("events/ticket/", EventTicketView.as_view(), name="events-ticket"),
 ]
 app_name = "user"
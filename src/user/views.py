@@ -1,14 +1,44 @@
+import json
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.http import HttpResponse, StreamingHttpResponse, JsonResponse, HttpResponseNotAllowed
 from drf_spectacular.utils import extend_schema
 from rest_framework import generics, status, mixins, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, SAFE_METHODS
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from user.models import UserFollowing, Post
+from user import ranking
+from user.batch import dispatch_batch, render_batch
+from user.compression import encoded_response
+from user.counters import post_counters
+from user.db import retry_on_busy, replica_reads, is_pinned_to_primary
+from user.deletion import soft_delete_user
+from user.events import (
+    hub,
+    user_channel,
+    author_channel,
+    get_events_settings,
+    issue_stream_ticket,
+    stream_ticket_user_id,
+)
+from user.exports import iter_account_export, gzip_stream
+from user.hashtags import normalize_hashtag
+from user.idempotency import idempotent
+from user.metrics import registry
+from user.models import UserFollowing, Post, Notification, ArchivedPost, Upload
+from user.notifications import notify, mark_all_read, retract
+from user.pagination import NotificationCursorPagination
 from user.permissions import IsAdminOrIfAuthenticatedReadOnly, IsOwnerOrAdmin
 from user.serializers import (
     MyTokenObtainPairSerializer,
@@ -20,9 +50,43 @@ from user.serializers import (
     FollowingSerializer,
     PostCreateUpdateSerializer,
     PostListSerializer,
+    PostListFastSerializer,
     UserFilterSerializer,
     PostFilterSerializer,
+    NotificationSerializer,
+    BatchRequestSerializer,
+    EventTicketSerializer,
+    UserSummarySerializer,
+    UploadSerializer,
 )
+from user.summary import build_user_summary, invalidate_user_summary
+from user.uploads import CHECKSUM_HEADER, write_chunk, complete_upload, discard_upload
+
+
+class ReplicaReadMixin:
+    """
+    Serves safe requests for ``replica_actions`` from a read replica, unless
+    the user wrote recently and is pinned to the primary.
+    """
+
+    replica_actions = ("list", "retrieve")
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            request.method in SAFE_METHODS
+            and self.action in self.replica_actions
+            and not is_pinned_to_primary(request.user)
+        ):
+            self._replica_stack = ExitStack()
+            self._replica_stack.enter_context(replica_reads())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        stack = getattr(self, "_replica_stack", None)
+        if stack is not None:
+            stack.close()
+            self._replica_stack = None
+        return super().finalize_response(request, response, *args, **kwargs)
 
 
 class MyTokenObtainPairView(TokenObtainPairView):
@@ -62,18 +126,21 @@ class LogoutUserView(APIView):
 
 
 class UserViewSet(
+    ReplicaReadMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     mixins.UpdateModelMixin,
+    mixins.DestroyModelMixin,
     viewsets.GenericViewSet,
 ):
     queryset = get_user_model().objects.all()
     serializer_class = UserListSerializer
+    replica_actions = ("list", "retrieve", "summary")
 
     def get_permissions(self):
         if self.action in ["list", "retrieve"]:
             permission_classes = [IsAdminOrIfAuthenticatedReadOnly]
-        elif self.action in ["update", "partial_update"]:
+        elif self.action in ["update", "partial_update", "destroy"]:
             permission_classes = [IsOwnerOrAdmin]
         else:
             permission_classes = [IsAdminOrIfAuthenticatedReadOnly]
@@ -89,6 +156,8 @@ class UserViewSet(
             queryset = queryset.filter(username__icontains=username)
         if location:
             queryset = queryset.filter(location__icontains=location)
+        if self.action == "list":
+            queryset = UserListSerializer.setup_eager_loading(queryset, self.request)
         return queryset.distinct()
 
     def get_serializer_class(self):
@@ -100,8 +169,29 @@ class UserViewSet(
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
-
-class FollowingUsersViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    @extend_schema(responses=UserSummarySerializer)
+    @action(detail=True, methods=["get"])
+    def summary(self, request, pk=None):
+        """
+        Profile, counts, follow state and latest posts in one response,
+        cached per (viewer, profile) until either side changes, with its gzip
+        encoding.
+        """
+        if not str(pk).isdigit():
+            raise NotFound()
+        body = build_user_summary(int(pk), request)
+        if body is None:
+            raise NotFound()
+        if request.accepted_renderer.format != "json":
+            return Response(json.loads(body.content))
+        return encoded_response(request, body)
+
+    @retry_on_busy
+    def perform_destroy(self, instance):
+        soft_delete_user(instance)
+
+
+class FollowingUsersViewSet(ReplicaReadMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
     queryset = get_user_model().objects.all()
     serializer_class = FollowingListSerializer
     permission_classes = [IsAdminOrIfAuthenticatedReadOnly]
@@ -115,7 +205,7 @@ class FollowingUsersViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
             return queryset.none()
 
 
-class FollowersUsersViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+class FollowersUsersViewSet(ReplicaReadMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
     queryset = get_user_model().objects.all()
     serializer_class = FollowersListSerializer
     permission_classes = [IsAdminOrIfAuthenticatedReadOnly]
@@ -138,6 +228,8 @@ class FollowCreateDestroyViewSet(
     def get_queryset(self):
         return UserFollowing.objects.filter(user_id=self.request.user)
 
+    @idempotent
+    @retry_on_busy
     def post(self, request, *args, **kwargs):
         following_user = get_object_or_404(get_user_model(), id=self.kwargs.get("pk"))
 
@@ -156,21 +248,28 @@ class FollowCreateDestroyViewSet(
         serializer = self.get_serializer(data=data, context={"request": request})
         serializer.is_valid(raise_exception=True)
         serializer.save(user_id=request.user)
+        ranking.on_follow(following_user.id)
+        notify(following_user, request.user, Notification.Kind.FOLLOW)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @retry_on_busy
     def destroy(self, request, *args, **kwargs):
         following_user = get_object_or_404(get_user_model(), id=self.kwargs.get("pk"))
         instance = self.get_queryset().filter(following_user_id=following_user).first()
         if not instance:
             return Response({"detail": "You are not following this user."}, status=404)
         instance.delete()
+        ranking.on_follow(following_user.id, delta=-1)
+        retract(following_user, request.user, Notification.Kind.FOLLOW, moment=instance.created)
         return Response(
             {"detail": "Unfollowed successfully."}, status=status.HTTP_204_NO_CONTENT
         )
 
 
 class PostListCreateUpdateDestroyViewSet(
+    ReplicaReadMixin,
     mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
     mixins.CreateModelMixin,
     mixins.UpdateModelMixin,
     mixins.DestroyModelMixin,
@@ -178,13 +277,24 @@ class PostListCreateUpdateDestroyViewSet(
 ):
     queryset = Post.objects.all()
     permission_classes = [IsAdminOrIfAuthenticatedReadOnly]
+    replica_actions = ("list",)
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
+    @retry_on_busy
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        ranking.on_publish(post)
+        hub.publish_on_commit(
+            author_channel(post.author_id),
+            "post",
+            {"id": post.id, "author": post.author_id, "content": post.content, "created_at": post.created_at},
+        )
 
     def get_serializer_class(self):
-        if self.action == "list":
-            print(Post.objects.all())
+        if self.action in ["list", "retrieve"]:
             return PostListSerializer
         return PostCreateUpdateSerializer
 
@@ -197,25 +307,288 @@ class PostListCreateUpdateDestroyViewSet(
             permission_classes = [IsAdminOrIfAuthenticatedReadOnly]
         return [permission() for permission in permission_classes]
 
-    def get_queryset(self):
-        hashtag = self.request.GET.get("hashtag")
+    def get_post_filters(self):
+        """
+        Lookups for the ``hashtag`` and ``author`` query parameters of the
+        list, validated by ``PostFilterSerializer``. Field names are shared
+        by ``Post`` and ``ArchivedPost``.
+        """
+        if self.action != "list":
+            return {}
+        params = PostFilterSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = {}
+        hashtag = params.validated_data.get("hashtag")
+        if hashtag and hashtag.isdigit():
+            filters["hashtag"] = hashtag
+        elif hashtag:
+            filters["hashtag__name"] = normalize_hashtag(hashtag)
+        if "author" in params.validated_data:
+            filters["author"] = params.validated_data["author"]
+        return filters
 
-        if hashtag:
-            return Post.objects.filter(hashtag=hashtag)
-        else:
-            return Post.objects.all()
+    def get_queryset(self):
+        filters = self.get_post_filters()
+        if "author" in filters:
+            # An author's posts are all on one shard.
+            return Post.objects.for_author(filters.pop("author")).filter(**filters)
+        return Post.objects.filter(**filters)
+
+    def get_object(self):
+        """
+        Look the post up with ``locate``, which searches every shard when
+        posts are sharded, since the shard cannot be told from the id.
+        """
+        lookup = {self.lookup_field: self.kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        try:
+            post = self.filter_queryset(self.get_queryset()).locate(**lookup)
+        except (TypeError, ValueError):
+            post = None
+        if post is None:
+            raise NotFound("No Post matches the given query.")
+        self.check_object_permissions(self.request, post)
+        return post
 
     @action(detail=True, methods=["post"])
+    @idempotent
+    @retry_on_busy
     def toggle_like(self, request, pk=None):
         post = self.get_object()
         user = request.user
-        if user in post.likes.all():
-            post.likes.remove(user)
+        like = post.likes.through.objects.using(post._state.db).filter(post_id=post.pk, user_id=user.pk)
+        if like.exists():
+            # Deleted from the link table directly: ``likes.remove()`` looks
+            # the user up in the post's database, which has no users when
+            # posts are sharded.
+            like.delete()
+            invalidate_user_summary(post.author_id)
+            ranking.on_like(post, delta=-1)
             return Response({"detail": "Unliked"}, status=status.HTTP_200_OK)
         else:
             post.likes.add(user)
+            ranking.on_like(post)
+            notify(post.author, user, Notification.Kind.LIKE, post=post)
             return Response({"detail": "Liked"}, status=status.HTTP_200_OK)
 
     @extend_schema(parameters=[PostFilterSerializer])
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        serializer = PostListFastSerializer(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        if request.query_params.get("order") == "ranked":
+            filters = PostFilterSerializer(data=request.query_params)
+            filters.is_valid(raise_exception=True)
+            ids = ranking.ranked_post_ids(
+                queryset, request.user, filters.validated_data.get("limit"), use_cache=not self.get_post_filters()
+            )
+            position = {post_id: index for index, post_id in enumerate(ids)}
+            rows = sorted(serializer.get_rows(Post.objects.filter(pk__in=ids)), key=lambda row: position[row["id"]])
+        elif filters := self.get_post_filters():
+            # Author history and hashtag search also cover archived posts.
+            rows = serializer.get_rows_with_archive(queryset, ArchivedPost.objects.filter(**filters))
+        else:
+            rows = serializer.get_rows(queryset)
+
+        page = self.paginate_queryset(rows)
+        rows = list(rows) if page is None else page
+        post_counters.record_impressions([row["id"] for row in rows])
+        data = serializer.to_representation(rows)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        post_counters.record_views([instance.pk])
+        serializer = PostListFastSerializer(request)
+        rows = serializer.get_rows(Post.objects.using(instance._state.db).filter(pk=instance.pk))
+        return Response(serializer.to_representation(rows)[0])
+
+
+class NotificationViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = NotificationCursorPagination
+
+    def get_queryset(self):
+        return Notification.objects.filter(recipient=self.request.user).select_related("last_actor")
+
+    @action(detail=False, methods=["get"])
+    def unread_count(self, request):
+        return Response({"unread_count": request.user.unread_notification_count})
+
+    @action(detail=False, methods=["post"])
+    @retry_on_busy
+    def mark_all_read(self, request):
+        updated = mark_all_read(request.user)
+        return Response({"marked_read": updated}, status=status.HTTP_200_OK)
+
+
+class UploadViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    Chunked, resumable image uploads. Create an upload with its filename and
+    size, ``PUT`` each chunk as the raw request body with an
+    ``Upload-Checksum: sha256 <hex>`` header, then ``POST`` to ``complete``.
+    ``GET`` lists the chunks already received, so an interrupted upload
+    resumes from there. The returned id is attached to a post or profile
+    through ``image_upload``/``profile_image_upload``.
+    """
+
+    serializer_class = UploadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Upload.objects.filter(owner=self.request.user)
+
+    @retry_on_busy
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+
+    def perform_destroy(self, instance):
+        discard_upload(instance)
+
+    @extend_schema(request={"application/octet-stream": bytes}, responses=UploadSerializer)
+    @action(detail=True, methods=["put"], url_path=r"chunks/(?P<index>\d+)")
+    def chunk(self, request, pk=None, index=None):
+        upload = self.get_object()
+        # Read the body straight from the stream: touching request.data
+        # would make DRF buffer the whole chunk before we see it.
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            content_length = 0
+        write_chunk(upload, int(index), request.stream, content_length, request.headers.get(CHECKSUM_HEADER))
+        return Response(self.get_serializer(upload).data)
+
+    @extend_schema(request=None, responses=UploadSerializer)
+    @action(detail=True, methods=["post"])
+    def complete(self, request, pk=None):
+        upload = complete_upload(self.get_object())
+        return Response(self.get_serializer(upload).data)
+
+
+class AccountExportView(APIView):
+    """
+    Streams the requesting user's posts, follows and likes as NDJSON.
+    ``?compress=gzip`` returns a gzipped file instead.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(responses={(200, "application/x-ndjson"): str})
+    def get(self, request, *args, **kwargs):
+        lines = iter_account_export(request.user)
+        filename = f"account-{request.user.id}.ndjson"
+        if request.query_params.get("compress") == "gzip":
+            response = StreamingHttpResponse(gzip_stream(lines), content_type="application/gzip")
+            filename += ".gz"
+        else:
+            response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class BatchView(APIView):
+    """
+    Runs several ``user`` API calls in one request: the caller is
+    authenticated and throttled once, consecutive GETs run concurrently,
+    and the responses come back in request order with their status codes.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get_throttle_cost(self, request):
+        requests = request.data.get("requests") if isinstance(request.data, dict) else None
+        return min(len(requests), settings.BATCH_REQUESTS["MAX_SIZE"]) if isinstance(requests, list) else 1
+
+    @extend_schema(request=BatchRequestSerializer)
+    def post(self, request, *args, **kwargs):
+        serializer = BatchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        specs = serializer.validated_data["requests"]
+
+        results = dispatch_batch(request._request, request.user, request.auth, specs)
+        # Only pin to the primary database when a sub-request actually wrote.
+        request._request.skip_primary_pin = all(spec["method"] == "GET" for spec in specs)
+        return HttpResponse(render_batch(results), content_type="application/json")
+
+
+class EventTicketView(APIView):
+    """
+    Issues a short-lived ticket for ``events/?ticket=``, so a browser
+    ``EventSource``, which cannot send an Authorization header, never puts
+    the access token in a URL where proxies and access logs would keep it.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(request=None, responses=EventTicketSerializer)
+    def post(self, request, *args, **kwargs):
+        return Response(
+            {"ticket": issue_stream_ticket(request.user), "expires_in": get_events_settings()["TICKET_SECONDS"]}
+        )
+
+
+def _authenticate_event_stream(request):
+    """
+    Authenticate with the usual JWT header, or with a ``?ticket=`` from
+    ``EventTicketView``.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        user_id = stream_ticket_user_id(request.GET.get("ticket", ""))
+        return get_user_model().objects.filter(pk=user_id, is_active=True).first() if user_id else None
+    raw_token = authentication.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def _event_channels(user):
+    following = UserFollowing.objects.filter(user_id=user).values_list("following_user_id", flat=True)
+    return [user_channel(user.id), author_channel(user.id)] + [author_channel(pk) for pk in following]
+
+
+async def event_stream(request):
+    """
+    Server-Sent Events stream of new posts from followed users and the
+    user's own notifications. Served by the ASGI application.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    user = await sync_to_async(_authenticate_event_stream)(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    channels = await sync_to_async(_event_channels)(user)
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    response = StreamingHttpResponse(hub.stream(channels, last_event_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+class MetricsView(APIView):
+    """
+    Exposes per-route request histograms in the Prometheus text format.
+    """
+
+    permission_classes = [IsAdminUser]
+    throttle_classes = []
+    schema = None
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")